@@ -22,6 +22,6 @@ from .geoFrame import IdaGeoDataFrame
 from .geoSeries import IdaGeoSeries
 
 __all__ = ['learn', 'sampledata', 'tests', 'aggregation', 
-		   'base', 'exceptions', 'filtering', 'frame', 'indexing', 
-		   'internals', 'series', 'sql', 'statistics', 'utils', 'geoFrame',
+		   'base', 'exceptions', 'filtering', 'frame', 'groupby', 'indexing', 
+		   'internals', 'plan', 'pool', 'series', 'sql', 'statistics', 'upload', 'utils', 'geoFrame',
              'geoSeries']
@@ -129,7 +129,8 @@ def aggregate_idadf(idadf, method, other, swap = False):
             newidadf.internal_state.columndict[key] = value
 
         newidadf.internal_state.update()
-        # REMARK: Don't need to reset some attributes ?
+        # The types of the aggregated columns may differ
+        newidadf._reset_attributes(["dtypes"])
         return newidadf
 
     if isinstance(idadf, ibmdbpy.IdaSeries):
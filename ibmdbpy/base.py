@@ -30,8 +30,11 @@ standard_library.install_aliases()
 import os
 #from os import path
 import sys
+import itertools
 import math
 import random
+import threading
+import queue
 from time import time
 import datetime
 import warnings
@@ -47,6 +50,8 @@ import six
 
 import ibmdbpy
 from ibmdbpy import sql
+from ibmdbpy import upload
+from ibmdbpy.pool import ConnectionPool
 from ibmdbpy.utils import timed, set_verbose, set_autocommit
 from ibmdbpy.exceptions import IdaDataBaseError, PrimaryKeyError
 
@@ -77,9 +82,15 @@ class IdaDataBase(object):
     as a parameter to be initialized. By convention, use only one instance of 
     IdaDataBase per database. However, you can use several instances of 
     IdaDataFrame per connection.
+
+    By default, all operations go through a single connection. A pooled mode
+    can be enabled with the pool_size parameter, in which case each thread
+    works with its own connection, so that independent queries can run in
+    parallel.
     """
 
-    def __init__(self, dsn, uid='', pwd='', autocommit=True, verbose=False):
+    def __init__(self, dsn, uid='', pwd='', autocommit=True, verbose=False,
+                 liveness_ttl=60, pool_size=None, use_catalog_stats=False):
         """
         Open a database connection.
 
@@ -101,6 +112,27 @@ class IdaDataBase(object):
         verbose : bool, defaukt: True
             If True, prints all SQL requests that are sent to the database. 
 
+        liveness_ttl : int or float, default: 60
+            Number of seconds during which the connection is assumed to be
+            alive after the last successful round trip to the database. Once
+            this delay is over, the connection is probed with a lightweight
+            statement before being used and reopened if it was lost. Set it
+            to 0 to probe the connection before every operation.
+
+        pool_size : int, optional
+            If given, enable the pooled mode: up to pool_size connections are
+            opened and handed out to the threads using this IdaDataBase. A
+            thread keeps its connection as long as it holds changes that are
+            not committed yet, and gives it back to the pool otherwise.
+
+        use_catalog_stats : bool, default: False
+            If True, the number of rows, of distinct values and of missing
+            values of IdaDataFrames in their default state are read from the
+            statistics of the catalog (SYSCAT.TABLES and SYSCAT.COLUMNS)
+            when they are newer than the last alteration of the table,
+            instead of being computed with a scan. These statistics are as
+            accurate as the last RUNSTATS.
+
         Attributes
         ----------
         data_source_name : str
@@ -113,11 +145,23 @@ class IdaDataBase(object):
             Connection string use for connecting via ODBC or JDBC.
 
         _con : connection object
-            Connection object to the remote Database.
+            Connection object to the remote Database. In pooled mode, this
+            is the connection held by the current thread.
+
+        _pool : ConnectionPool or None
+            Pool of connections, None if the pooled mode is not enabled.
 
         _idadfs : list
             List of IdaDataFrame objects opened under this connection.
 
+        liveness_ttl : int or float
+            Number of seconds during which the connection is not probed
+            after a successful round trip. It can be modified at any time.
+
+        use_catalog_stats : bool
+            Whether statistics are read from the catalog when they are up
+            to date. It can be modified at any time.
+
         Returns
         -------
         IdaDataBase object
@@ -169,6 +213,29 @@ class IdaDataBase(object):
 
         self._idadfs = []
 
+        self.liveness_ttl = liveness_ttl
+        self.use_catalog_stats = use_catalog_stats
+        self._closed = False
+
+        if pool_size is not None:
+            if not isinstance(pool_size, six.integer_types) or pool_size < 1:
+                raise ValueError("pool_size should be a positive integer.")
+        self._pool_size = pool_size
+        self._pool = None
+        self._local = threading.local()
+
+        # Whether the driver supports parameterized bulk inserts, unknown
+        # until the first upload
+        self._bulk_insert = None
+
+        # Outcome of the last call to append
+        self.last_upload = None
+
+        # States of IdaDataFrames that queries refer to as common table
+        # expressions, by name, see _register_state
+        self._states = {}
+        self._state_ids = itertools.count()
+
         if self._con_type == 'odbc':
             self._connection_string = "DSN=%s; UID=%s; PWD=%s;LONGDATACOMPAT=1;"%(dsn,uid,pwd)
             """
@@ -354,6 +421,12 @@ class IdaDataBase(object):
             #not anymore, reported problems with ODBC
             #better mention DB2GSE explicitly when accessing its functions
                 
+        self._last_alive = time()
+
+        if pool_size is not None:
+            self._pool = self._create_pool([self._con])
+            self._pool.warm_up()
+
         # Setting Autocommit and verbose environment variables
         set_autocommit(autocommit)
         set_verbose(verbose)
@@ -774,7 +847,8 @@ class IdaDataBase(object):
         else:
             return False
 
-    def ida_query(self, query, silent=False, first_row_only=False, autocommit = False):
+    def ida_query(self, query, silent=False, first_row_only=False, autocommit = False,
+                  chunksize = None):
         """
         Prepare, execute and format the result of a query in a dataframe or
         in a Tuple. If nothing is expected to be returned for the SQL command,
@@ -792,10 +866,16 @@ class IdaDataBase(object):
              If True, only the first row of the result is returned as a Tuple.
         autocommit: bool, default: False
             If True, the autocommit function is available.
+        chunksize : int, optional
+            If given, return a generator yielding the result as DataFrames
+            of at most chunksize rows instead of a single DataFrame. Rows are
+            fetched from the database as the chunks are consumed, so that
+            only one chunk is held in memory at a time.
 
         Returns
         -------
-        DataFrame or Tuple (if first_row_only=False)
+        DataFrame or Tuple (if first_row_only=False), or generator of
+        DataFrames (if chunksize is given)
 
         Examples
         --------
@@ -810,6 +890,11 @@ class IdaDataBase(object):
         >>> idadb.ida_query("SELECT COUNT(*) FROM IRIS")
         (150, 150, 150, 150)
 
+        >>> for chunk in idadb.ida_query("SELECT * FROM IRIS", chunksize=100):
+        ...     print(len(chunk))
+        100
+        50
+
         Notes
         -----
         If first_row_only argument is True, then even if the actual result of 
@@ -817,7 +902,8 @@ class IdaDataBase(object):
         returned.
         """
         self._check_connection()
-        return sql.ida_query(self, query, silent, first_row_only, autocommit)
+        return sql.ida_query(self, query, silent, first_row_only, autocommit,
+                             chunksize)
 
     def ida_scalar_query(self, query, silent=False, autocommit = False):
         """
@@ -856,7 +942,8 @@ class IdaDataBase(object):
     ###############################################################################
 
     @timed
-    def as_idadataframe(self, dataframe, tablename=None, clear_existing=False, primary_key=None, indexer=None):
+    def as_idadataframe(self, dataframe, tablename=None, clear_existing=False, primary_key=None, indexer=None,
+                        parallel=None, dtype=None):
         """
         Upload a dataframe and return its corresponding IdaDataFrame. The target
         table (tablename) will be created or replaced if the option clear_existing
@@ -879,6 +966,13 @@ class IdaDataBase(object):
             name already exists  in the database.
         primary_key : str
             Name of a column to be used as primary key.
+        parallel : int, optional
+            Number of chunks uploaded concurrently over separate connections.
+            See IdaDataBase.append.
+        dtype : dict, optional
+            SQL type to be used for some columns, by column name, instead of
+            the one inferred from the values. For example:
+            {"NAME": "VARCHAR(40)"}.
 
         Returns
         -------
@@ -934,19 +1028,11 @@ class IdaDataBase(object):
                                       "table " + tablename + " because it contains" +
                                       " non unique values")
 
-        if self.exists_table_or_view(tablename):
-            if clear_existing:
-                try:
-                    self.drop_table(tablename)
-                except:
-                    self.drop_view(tablename)
-            else:
-                raise NameError(("%s already exists, choose a different name "+
-                                "or use clear_existing option.")%tablename)
+        self._clear_existing(tablename, clear_existing)
 
-        self._create_table(dataframe, tablename, primary_key=primary_key)
+        self._create_table(dataframe, tablename, primary_key=primary_key, dtype=dtype)
         idadf = ibmdbpy.frame.IdaDataFrame(self, tablename, indexer)
-        self.append(idadf, dataframe)
+        self.append(idadf, dataframe, parallel=parallel)
 
         ############## Experimental ##################
         # dataframe.to_sql(tablename, self._con, index=False)
@@ -958,6 +1044,182 @@ class IdaDataBase(object):
         if primary_key:
             idadf._indexer=primary_key
         return idadf
+
+    def upload_stream(self, source, tablename=None, clear_existing=False,
+                      chunksize=100000, indexer=None, dtype=None, **kwargs):
+        """
+        Upload data that does not fit in memory, read chunk by chunk from a
+        CSV file or from an iterable of DataFrames, and return its
+        corresponding IdaDataFrame.
+
+        The table is created from the first chunk, then each chunk is
+        inserted while the next one is being read, so that at most three
+        chunks are held in memory at a time, whatever the size of the data.
+
+        Parameters
+        ----------
+        source : str, DataFrame or iterable of DataFrames
+            Path to a CSV file, a DataFrame, or an iterable such as a
+            generator or a pandas reader yielding DataFrames which all have
+            the same columns.
+        tablename : str, optional
+            Name to be given to the table created in the database. If not
+            given, a valid tablename is generated. See
+            IdaDataBase.as_idadataframe.
+        clear_existing : bool, default: False
+            If set to True, a table will be replaced when a table with the
+            same name already exists in the database.
+        chunksize : int, default: 100000
+            Number of rows per chunk when reading a CSV file or splitting a
+            DataFrame. Ignored for other iterables.
+        indexer : str, optional
+            Name of a column to be used as indexer of the IdaDataFrame.
+        dtype : dict, optional
+            SQL type to be used for some columns, by column name, instead of
+            the one inferred from the first chunk. For example:
+            {"NAME": "VARCHAR(40)"}.
+        **kwargs
+            Additional arguments passed to pandas.read_csv when source is a
+            path.
+
+        Returns
+        -------
+        IdaDataFrame
+
+        Raises
+        ------
+        TypeError
+            * chunksize is not an integer.
+            * source does not yield DataFrames.
+        ValueError
+            * chunksize is not strictly positive.
+            * source does not yield any chunk.
+            * A chunk does not have the same columns as the first chunk.
+        NameError
+            The name already exists in the database and clear_existing is
+            False.
+
+        Examples
+        --------
+        >>> idadf = idadb.upload_stream("trips.csv", "TRIPS", chunksize=50000)
+        >>> def chunks():
+        ...     for month in range(1, 13):
+        ...         yield load_month(month)
+        >>> idadf = idadb.upload_stream(chunks(), "TRIPS_2016")
+
+        Notes
+        -----
+        The column types are inferred from the first chunk only. Unlike
+        as_idadataframe, which narrows integers to SMALLINT or INTEGER and
+        floats to REAL when the values allow it, upload_stream uses wide
+        types so that later chunks fit: BIGINT for integers, DOUBLE for
+        floats, TIMESTAMP for dates and VARCHAR columns of at least 255
+        bytes for strings. Use dtype for columns whose values in the first
+        chunk are not representative, for example strings that get longer
+        later on, or to choose a narrower type. Changes are committed after
+        each chunk if autocommit is enabled, so a failure leaves the rows
+        uploaded so far in the table.
+        """
+        if not isinstance(chunksize, six.integer_types):
+            raise TypeError("chunksize is not an integer")
+        if chunksize < 1:
+            raise ValueError("chunksize should be stricly positive")
+
+        if isinstance(source, six.string_types):
+            chunks = pd.read_csv(source, chunksize=chunksize, **kwargs)
+        elif isinstance(source, pd.DataFrame):
+            chunks = (source.iloc[start:start + chunksize]
+                      for start in range(0, max(source.shape[0], 1), chunksize))
+        else:
+            chunks = iter(source)
+
+        # Chunks are read by a separate thread while the current one is
+        # inserted. The queue bounds the number of chunks held in memory.
+        pipeline = queue.Queue(maxsize=1)
+        stop = threading.Event()
+        end_of_stream = object()
+
+        def read():
+            try:
+                for chunk in chunks:
+                    while not stop.is_set():
+                        try:
+                            pipeline.put(chunk, timeout=0.1)
+                            break
+                        except queue.Full:
+                            pass
+                    if stop.is_set():
+                        return
+                item = end_of_stream
+            except Exception as error:
+                item = error
+            while not stop.is_set():
+                try:
+                    pipeline.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        reader = threading.Thread(target=read)
+        reader.daemon = True
+        reader.start()
+
+        def next_chunk():
+            item = pipeline.get()
+            if isinstance(item, Exception):
+                raise item
+            if item is end_of_stream:
+                return None
+            if not isinstance(item, pd.DataFrame):
+                raise TypeError("source should yield pandas DataFrames")
+            return item
+
+        try:
+            first = next_chunk()
+            if first is None:
+                raise ValueError("source does not contain any data")
+            columns = list(first.columns)
+
+            if tablename is None:
+                tablename = self._get_valid_tablename(prefix="DATA_FRAME_")
+            tablename = ibmdbpy.utils.check_tablename(tablename)
+            self._clear_existing(tablename, clear_existing)
+            # Later chunks may not fit the narrowest types of the first one
+            self._create_table(first, tablename, dtype=dtype, narrow=False)
+            self._autocommit()
+            idadf = ibmdbpy.frame.IdaDataFrame(self, tablename, indexer)
+
+            # The encoding of the columns is inferred once for all chunks.
+            # Dates keep their time of day, which later chunks may have.
+            kinds = [upload.DATETIME if kind == upload.DATE and column not in (dtype or {})
+                     else kind for column, kind in zip(columns, upload.column_kinds(first))]
+            self.last_upload = {"chunks": 0, "failures": {}, "failed_rows": first.iloc[0:0]}
+
+            nrows = 0
+            chunk = first
+            while chunk is not None:
+                if list(chunk.columns) != columns:
+                    raise ValueError("All chunks should have the same columns " +
+                                     "as the first one: \n" +
+                                     "Expected : \t" + str(columns) + "\n" +
+                                     "Found : \t" + str(list(chunk.columns)) + "\n")
+                if chunk.shape[0]:
+                    self._insert_into_database(chunk, idadf.schema, idadf.tablename,
+                                               silent=True, kinds=kinds)
+                    self._autocommit()
+                    nrows += chunk.shape[0]
+                    self.last_upload["chunks"] += 1
+                    print("Uploaded: %s rows... "%nrows, end="\r")
+                # Release the current chunk before waiting for the next one
+                chunk = None
+                chunk = next_chunk()
+            print("Uploaded: %s rows... "%nrows, end="")
+            print("[DONE]")
+        finally:
+            stop.set()
+
+        idadf._reset_attributes(['shape', 'axes', 'dtypes', 'index'])
+        return idadf
         
     ###########################################################################
     #### Delete DataBase objects
@@ -1271,6 +1533,8 @@ class IdaDataBase(object):
             self.rename(new_idadf, idadf.tablename)
 
             # Updating internal state
+            # The columns of the table changed
+            idadf.internal_state._table_info.clear()
             # prepend the columndict OrderedDict
             items = idadf.internal_state.columndict.items()
             idadf.internal_state.columndict = OrderedDict()
@@ -1349,6 +1613,8 @@ class IdaDataBase(object):
             self.rename(new_idadf, idadf.tablename)
 
             # updating internal state
+            # The columns of the table changed
+            idadf.internal_state._table_info.clear()
             del idadf.internal_state.columndict[column_name]
             idadf.internal_state.update()
             self._reset_attributes("cache_show_tables")
@@ -1363,13 +1629,16 @@ class IdaDataBase(object):
             idadf._reset_attributes(["_indexer"])
 
 
-    def append(self, idadf, df, maxnrow=None):
+    def append(self, idadf, df, maxnrow=None, parallel=None):
         """
         Append rows of a DataFrame to an IdaDataFrame. The DataFrame must have 
         the same structure (same column names and datatypes). Optionally, the 
         DataFrame to be added can be splitted into several chunks. This 
-        improves performance and prevents SQL overflows. By default, chunks are 
-        limited to 100.000 cells.
+        improves performance and prevents SQL overflows. By default, the first 
+        chunk is limited to 100.000 cells, then the size of the chunks is 
+        adapted to the measured throughput, see upload.ChunkSizeController. 
+        Rows are sent with a parameterized INSERT statement when the driver 
+        supports it, see _insert_into_database.
 
         Parameters
         ----------
@@ -1379,11 +1648,18 @@ class IdaDataBase(object):
             Dataframe whose rows are added to IdaDataFrame idadf.
         maxnrow : int, optional
             number corresponding to the maximum number of rows for each chunks.
+            If given, all chunks have this size instead of an adaptive one.
+        parallel : int, optional
+            Number of chunks uploaded concurrently, each one over its own
+            connection and in its own transaction. In pooled mode, the
+            connections are taken from the pool. By default, chunks are
+            uploaded one after another.
 
         Raises
         ------
         TypeError
             * maxnrow should be an interger.
+            * parallel should be an integer.
             * Argument idadf should be an IdaDataFrame.
             * Argument df should be a pandas DataFrame.
         ValueErrpr
@@ -1391,11 +1667,30 @@ class IdaDataBase(object):
             * Other should be a Pandas DataFrame.
             * Other dataframe has not the same number of columns as self.
             * Some columns in other have different names that are different from the names of the columns in self.
+            * parallel should be greater than 1 or left blank.
+        IdaDataBaseError
+            Some chunks could not be uploaded in parallel mode.
+
+        Notes
+        -----
+        In parallel mode, the first chunk is uploaded by the current
+        connection, then the pending changes are committed so that they
+        are visible to the other connections. Chunks that fail do not abort
+        the upload: they are collected in the last_upload attribute, whose
+        "failed_rows" entry can be appended again to retry them, and an
+        IdaDataBaseError is raised once all chunks were processed. Chunks
+        have a fixed size in parallel mode.
+
+        After the upload, the last_upload attribute also holds the chosen
+        chunk size ("chunksize") and the observed throughput
+        ("rows_per_second" and "bytes_per_second").
         """
         # SANITY CHECK : maxnrow
+        adaptive = maxnrow is None
         if maxnrow is None:
             # Note : it has been measured on a big dataset (>1 million rows) that int(100000 / len(df.columns)) 
             # performs better than the previous empirical value int(8000 / len(df.columns)) 
+            # It is only the size of the first chunk, see upload.ChunkSizeController
             maxnrow = int(100000 / len(df.columns))
         else:
             if not isinstance(maxnrow, six.integer_types):
@@ -1405,6 +1700,13 @@ class IdaDataBase(object):
             if maxnrow > 15000:
                 warnings.warn("Performance may decrease if maxnrow is bigger than 15000", UserWarning)
 
+        # SANITY CHECK : parallel
+        if parallel is not None:
+            if not isinstance(parallel, six.integer_types):
+                raise TypeError("parallel is not an integer")
+            if parallel < 1:
+                raise ValueError("parallel should be stricly positive or omitted")
+
         # SANITY CHECK : idadf & other
         if not isinstance(idadf, ibmdbpy.frame.IdaDataFrame):
             raise TypeError("Argument idadf is not an IdaDataFrame")
@@ -1420,29 +1722,117 @@ class IdaDataBase(object):
                 zip(idadf.columns, df.columns)]):
             raise ValueError("Order or columns in other and" + idadf._name + "does not match.")
 
-        if df.shape[0] > 1.5 * maxnrow:
+        # The encoding of the columns is inferred once for all chunks
+        kinds = upload.column_kinds(df)
+
+        row_bytes = upload.estimate_row_bytes(df, kinds)
+        self.last_upload = {"chunks": 1, "failures": {}, "failed_rows": df.iloc[0:0]}
+        started = time()
+
+        if df.shape[0] > 1.5 * maxnrow and adaptive and not (parallel is not None and parallel > 1):
+            print("DataFrame will be splitted into chunks of adaptive size. (" +
+                  str(maxnrow) + " rows in the first chunk)")
+            self._append_adaptively(idadf, df, kinds, maxnrow, row_bytes)
+        elif df.shape[0] > 1.5 * maxnrow:
             split_into = math.ceil(df.shape[0] / maxnrow)
-            split = np.array_split(df, split_into)
+            split = [df.iloc[positions] for positions in
+                     np.array_split(np.arange(df.shape[0]), split_into)]
+            self.last_upload["chunks"] = split_into
             print("DataFrame will be splitted into " + str(split_into) +
                   " chunks. (" + str(maxnrow) + " rows per chunk)")
-            for i, chunk in enumerate(split, 0):
-                percentage = int(i / split_into * 100)
-                print("Uploaded: " + str(percentage) + "%... ", end="\r")
-                try:
-                    self._insert_into_database(chunk, idadf.schema, idadf.tablename, silent=True)
-                except:
-                    raise
-            print("Uploaded: %s/%s... "%(split_into,split_into), end="")
-            print("[DONE]")
+            if parallel is not None and parallel > 1:
+                self._append_in_parallel(idadf, split, kinds, parallel)
+            else:
+                for i, chunk in enumerate(split, 0):
+                    percentage = int(i / split_into * 100)
+                    print("Uploaded: " + str(percentage) + "%... ", end="\r")
+                    try:
+                        self._insert_into_database(chunk, idadf.schema, idadf.tablename,
+                                                   silent=True, kinds=kinds)
+                    except:
+                        raise
+                print("Uploaded: %s/%s... "%(split_into,split_into), end="")
+                print("[DONE]")
         else:
             print("Uploading %s rows (maxnrow was set to %s)"%(df.shape[0], maxnrow))
             try:
-                self._insert_into_database(df, idadf.schema, idadf.tablename, silent=True)
+                self._insert_into_database(df, idadf.schema, idadf.tablename,
+                                           silent=True, kinds=kinds)
             except:
                 raise
 
+        if "rows_per_second" not in self.last_upload:
+            elapsed = max(time() - started, 1e-6)
+            self.last_upload.update({"chunksize": maxnrow,
+                                     "rows_per_second": df.shape[0] / elapsed,
+                                     "bytes_per_second": df.shape[0] * row_bytes / elapsed})
+
+        idadf.internal_state._forget_rows()
         idadf._reset_attributes(['shape', 'axes', 'dtypes', 'index'])
 
+        failures = self.last_upload["failures"]
+        if failures:
+            raise IdaDataBaseError(("%s out of %s chunks could not be uploaded, " +
+                                    "see last_upload for details. First error: %s")
+                                   %(len(failures), self.last_upload["chunks"],
+                                     failures[min(failures)]))
+
+    def _append_adaptively(self, idadf, df, kinds, initial, row_bytes):
+        """
+        Upload a DataFrame chunk by chunk, adapting the size of the chunks to
+        the measured throughput. See IdaDataBase.append.
+        """
+        controller = upload.ChunkSizeController(initial, row_bytes,
+                                                bulk=self._bulk_insert is not False)
+        start = 0
+        nb_chunks = 0
+        while start < df.shape[0]:
+            print("Uploaded: " + str(int(start / df.shape[0] * 100)) + "%... ", end="\r")
+            chunk = df.iloc[start:start + controller.chunksize]
+            chunk_started = time()
+            self._insert_into_database(chunk, idadf.schema, idadf.tablename,
+                                       silent=True, kinds=kinds)
+            # The first chunk tells whether rows are bound or sent as literals
+            controller.bulk = self._bulk_insert is not False
+            controller.record(chunk.shape[0], time() - chunk_started)
+            start += chunk.shape[0]
+            nb_chunks += 1
+        print("Uploaded: %s/%s... "%(nb_chunks, nb_chunks), end="")
+        print("[DONE]")
+        self.last_upload["chunks"] = nb_chunks
+        self.last_upload.update(controller.summary())
+
+    def _append_in_parallel(self, idadf, chunks, kinds, parallel):
+        """
+        Upload the chunks of a DataFrame concurrently. See IdaDataBase.append.
+        """
+        split_into = len(chunks)
+
+        def progress(processed):
+            percentage = int(processed / split_into * 100)
+            print("Uploaded: " + str(percentage) + "%... ", end="\r")
+
+        # The first chunk settles how rows are sent and makes the table
+        # visible to the other connections once committed
+        self._insert_into_database(chunks[0], idadf.schema, idadf.tablename,
+                                   silent=True, kinds=kinds)
+        self.commit()
+        progress(1)
+
+        failures = upload.insert_in_parallel(self, chunks[1:], idadf.schema,
+                                             idadf.tablename, kinds, parallel,
+                                             bulk=self._bulk_insert,
+                                             progress=lambda processed: progress(processed + 1))
+        failures = dict((index + 1, error) for index, error in failures.items())
+        self.last_upload["failures"] = failures
+        if failures:
+            self.last_upload["failed_rows"] = pd.concat([chunks[index] for index in sorted(failures)])
+            print("Uploaded: %s/%s... "%(split_into - len(failures), split_into), end="")
+            print("[FAILED]")
+        else:
+            print("Uploaded: %s/%s... "%(split_into,split_into), end="")
+            print("[DONE]")
+
     def merge(self, idadf, other, key):
         # TODO:
         pass
@@ -1468,6 +1858,8 @@ class IdaDataBase(object):
         self._con.commit()
         if os.getenv('VERBOSE') == 'True':
             print("<< COMMIT >>")
+        self._local.dirty = False
+        self._release_connection()
         self._reset_attributes("cache_show_tables")
 
     def rollback(self):
@@ -1484,6 +1876,8 @@ class IdaDataBase(object):
         self._con.rollback()
         if os.getenv('VERBOSE') == 'True':
             print("<< ROLLBACK >>")
+        self._local.dirty = False
+        self._release_connection()
         self._reset_attributes("cache_show_tables")
 
     def close(self):
@@ -1497,40 +1891,38 @@ class IdaDataBase(object):
         changes after the last commit are committed, otherwise they are 
         discarded.
 
+        In pooled mode, only the changes of the current thread are committed
+        or discarded. The connections held by other threads are closed when
+        they are given back to the pool.
         """
         if os.getenv('AUTOCOMMIT') == 'True':
             self.commit()
         else:
             self.rollback()
         self._reset_attributes("cache_show_tables")
-        self._con.close()
+        if self._pool is None:
+            self._con.close()
+        else:
+            self._pool.close()
+        self._closed = True
         print("Connection closed.")
 
     def reconnect(self):
         """
         Try to reopen the connection.
         """
-        try:
-            self._check_connection()
-        except IdaDataBaseError:
-            if self._con_type == 'odbc':
-                import pypyodbc
-                try:
-                    self._con = pypyodbc.connect(self._connection_string)
-                except:
-                    raise
-                else:
-                    print("The connection was successfully restored")
-            elif self._con_type == 'jdbc':
-                try:
-                    import jaydebeapi
-                    self._con = jaydebeapi.connect('com.ibm.db2.jcc.DB2Driver', self._connection_string)
-                except:
-                    raise
-                else:
-                    print("The connection was successfully restored")
-        else:
+        if not self._closed and self._ping():
+            self._last_alive = time()
             print("The connection for current IdaDataBase is valid")
+        else:
+            if self._pool is not None and self._closed:
+                self._pool = self._create_pool()
+                self._local = threading.local()
+            else:
+                self._con = self._open_connection()
+            self._closed = False
+            self._last_alive = time()
+            print("The connection was successfully restored")
 
         ###############################################################################
         #### Private methods
@@ -1640,6 +2032,27 @@ class IdaDataBase(object):
             self._reset_attributes("cache_show_tables")
             return True
 
+    def _clear_existing(self, tablename, clear_existing):
+        """
+        Make sure that no table or view called tablename exists before it is
+        created, dropping it if clear_existing is True.
+
+        Raises
+        ------
+        NameError
+            The name already exists in the database and clear_existing is
+            False.
+        """
+        if self.exists_table_or_view(tablename):
+            if clear_existing:
+                try:
+                    self.drop_table(tablename)
+                except:
+                    self.drop_view(tablename)
+            else:
+                raise NameError(("%s already exists, choose a different name "+
+                                "or use clear_existing option.")%tablename)
+
     def _upper_columns(self, dataframe):
         # Could be moved to utils (then move in the test too)
         """
@@ -1722,6 +2135,32 @@ class IdaDataBase(object):
         name = "%s%s_%s" % (prefix, random.randint(0, 100000), int(time()))
         return name
 
+    def _register_state(self, query):
+        """
+        Register the state of an IdaDataFrame so that queries can refer to it
+        by name. Queries that refer to it get its definition as a common table
+        expression, instead of a view being created in the database.
+
+        Parameters
+        ----------
+        query : str
+            SELECT statement that describes the state.
+
+        Returns
+        -------
+        str
+            Name under which the state is registered.
+        """
+        name = "%s%s"%(sql.STATE_PREFIX, next(self._state_ids))
+        self._states[name] = query
+        return name
+
+    def _unregister_state(self, name):
+        """
+        Forget a state registered with _register_state.
+        """
+        self._states.pop(name, None)
+
     def _get_valid_viewname(self, prefix="VIEW_"):
         """
         Convenience function : Alternative name for _get_valid_tablename.
@@ -1760,7 +2199,8 @@ class IdaDataBase(object):
         """
         return self._get_valid_tablename(prefix)
 
-    def _create_table(self, dataframe, tablename, primary_key=None):
+    def _create_table(self, dataframe, tablename, primary_key=None, dtype=None,
+                      narrow=True):
         """
         Create a new table in the database by declaring its name and columns 
         based on an existing DataFrame. It is possible declare a column as 
@@ -1774,11 +2214,18 @@ class IdaDataBase(object):
             Name to be given to the table at its creation.
         primary_key: str
             Name of a column to declare as primary key.
+        dtype : dict, optional
+            SQL type to be used for some columns, by column name, instead of
+            the inferred one. For example: {"NAME": "VARCHAR(40)"}.
+        narrow : bool, default: True
+            If False, wide types are chosen, so that the table can hold
+            values that are not in dataframe. See upload.column_types.
 
         Notes
         -----
         The columns and their data type is deducted from the Pandas DataFrame 
-        given as parameter.
+        given as parameter. The narrowest type fitting the values is chosen,
+        see upload.column_types.
 
         Examples
         --------
@@ -1787,14 +2234,9 @@ class IdaDataBase(object):
         'IRIS'
         >>> idadb._create_table(iris)
         'DATA_FRAME_4956'
+        >>> idadb._create_table(iris, "IRIS2", dtype={"species": "VARCHAR(32)"})
+        'IRIS2'
         """
-        # TODO : Handle more types
-        # integer_attributes =
-        # ['int_', 'intc','BIGINT','REAL','DOUBLE','FLOAT','DECIMAL','NUMERIC']
-        # double_attributes =
-        # ['SMALLINT', 'INTEGER','BIGINT','REAL','DOUBLE','FLOAT','DECIMAL','NUMERIC']
-        # self._check_connection()
-
         if not isinstance(dataframe, pd.DataFrame):
             raise TypeError("_create_table is valid only for DataFrame objects")
 
@@ -1805,33 +2247,15 @@ class IdaDataBase(object):
         # Check the tablename
         tablename = ibmdbpy.utils.check_tablename(tablename)
 
+        kinds = upload.column_kinds(dataframe)
+        datatypes = upload.column_types(dataframe, kinds, dtype, narrow)
+
         column_string = ''
-        for column in dataframe.columns:
-            if dataframe.dtypes[column] in [object,bool]:
-                # Handle boolean type
-                if set(dataframe[column].unique()).issubset([True, False, 0, 1, np.nan]):
-                    column_string += "\"%s\" SMALLINT," % str(column).strip()
-                else:
-                    if column == primary_key:
-                        column_string += "\"%s\" VARCHAR(255) NOT NULL, PRIMARY KEY (\"%s\")," % (str(column).strip(), str(column).strip())
-                    else:
-                        column_string += "\"%s\" VARCHAR(255)," % str(column).strip()
-            elif dataframe.dtypes[column] == np.dtype('datetime64[ns]'):
-                # This is a first patch for handling dates
-                # TODO: Dates as timestamp in the database
-                column_string += "\"%s\" VARCHAR(255)," % str(column).strip()
+        for column, datatype in zip(dataframe.columns, datatypes):
+            if column == primary_key:
+                column_string += "\"%s\" %s NOT NULL, PRIMARY KEY (\"%s\")," % (str(column).strip(), datatype, str(column).strip())
             else:
-                if dataframe.dtypes[column] in [np.int64, np.int, np.int8, np.int32]:
-                    if abs(dataframe[column].max()) < 2147483647/2: # might get bigger 
-                        datatype = "INT"
-                    else:
-                        datatype = "BIGINT"
-                else:
-                    datatype = "DOUBLE"
-                if column == primary_key:
-                    column_string += "\"%s\" %s NOT NULL, PRIMARY KEY (\"%s\")," % (str(column).strip(), datatype, str(column).strip())
-                else:
-                    column_string += "\"%s\" %s," %(str(column.strip()), datatype)
+                column_string += "\"%s\" %s," % (str(column).strip(), datatype)
         if column_string[-1] == ',':
             column_string = column_string[:-1]
 
@@ -1936,7 +2360,8 @@ class IdaDataBase(object):
     
         return viewname
 
-    def _insert_into_database(self, dataframe, schema, tablename, silent=True):
+    def _insert_into_database(self, dataframe, schema, tablename, silent=True,
+                              kinds=None):
         """
         Populate an existing table with data from a dataframe.
 
@@ -1952,65 +2377,71 @@ class IdaDataBase(object):
         silent : bool, default: True
             If True, the INSERT statement is not printed. Avoids flooding the 
             console.
+        kinds : list of str, optional
+            Encoding of each column, as returned by upload.column_kinds. It is
+            inferred from the dataframe if not given. Callers inserting a
+            dataframe in several chunks should infer it once on the whole
+            dataframe.
 
+        Notes
+        -----
+        The rows are sent with an INSERT statement using parameter markers,
+        executed with executemany so that the driver binds the rows in
+        batches and the statement is compiled only once. If the driver does
+        not support it, which is detected on the first upload under a
+        savepoint, the rows are inserted with a literal multi-row INSERT
+        statement instead.
         """
-        # TODO : Handle more datatypes
         if schema is None or schema.strip() == '':
             schema = self.current_schema
         tablename = ibmdbpy.utils.check_tablename(tablename)
-        column_string = '\"%s\"' % '\", \"'.join([str(x).strip() for x in dataframe.columns])
-        row_string = ''
-
-        # Save in a list columns that are booleans
-        boolean_flaglist = []
-        for column in dataframe.columns:
-            if set(dataframe[column].unique()).issubset([True, False, 0, 1, np.nan]):
-                boolean_flaglist.append(1)
+        if kinds is None:
+            kinds = upload.column_kinds(dataframe)
+
+        if self._bulk_insert is not None:
+            self._insert_rows(dataframe, schema, tablename, kinds,
+                              self._bulk_insert, silent)
+        else:
+            # Probe the support of parameterized inserts by the driver under
+            # a savepoint, so that a failed attempt leaves no rows behind
+            savepoint = "IBMDBPY_BULK_INSERT"
+            self._prepare_and_execute("SAVEPOINT %s ON ROLLBACK RETAIN CURSORS"%savepoint,
+                                      autocommit=False, silent=True)
+            try:
+                self._insert_rows(dataframe, schema, tablename, kinds, True, silent)
+            except Exception as bulk_error:
+                try:
+                    self._prepare_and_execute("ROLLBACK TO SAVEPOINT %s"%savepoint,
+                                              autocommit=False, silent=True)
+                    self._insert_rows(dataframe, schema, tablename, kinds, False, silent)
+                except Exception:
+                    raise bulk_error
+                self._bulk_insert = False
             else:
-                boolean_flaglist.append(0)
-
-        for rows in dataframe.values:
-            value_string = ''
-            for colindex, value in enumerate(rows):
-                if pd.isnull(value): # handles np.nan and None
-                    value_string += "NULL,"  # Handle missing values
-                elif isinstance(value, six.string_types):
-                    ## Handle apostrophe in values
-                    value = value.replace("\\", "'")
-                    value_string += '\'%s\',' % value.replace("'", "''")
-                # REMARK: it is the best way to handle booleans ?
-                elif isinstance(value, bool):
-                    if boolean_flaglist[colindex] == True:
-                        if value in [1, True]:
-                            value_string += '1,'
-                        elif value in [0, False]:
-                            value_string += '0,'
-                    else:
-                        value_string += '\'%s\',' % value
-                # TODO: Handle datetime better than strings
-                elif isinstance(value, datetime.datetime):
-                    value_string += '\'%s\',' % value
-                else:
-                    value_string += '%s,' % value
-            if value_string[-1] == ',':
-                value_string = value_string[:-1]
-            row_string += "(%s)," % value_string
-        if row_string[-2:] == '),':
-            row_string = row_string[:-2]
-        if row_string[0] == '(':
-            row_string = row_string[1:]
-
-        query = ("INSERT INTO \"%s\".\"%s\" (%s) VALUES (%s)" % (schema, tablename, column_string, row_string))
-
-        #print(query)
-        # TODO: Good idea : create a savepoint before creating the table
-        # Rollback in to savepoint in case of failure
-        self._prepare_and_execute(query, autocommit=False, silent=silent)
+                self._bulk_insert = True
+            self._prepare_and_execute("RELEASE SAVEPOINT %s"%savepoint,
+                                      autocommit=False, silent=True)
 
         for idadf in self._idadfs:
-            if idadf._name == tablename:
+            if idadf.tablename == tablename and idadf.schema == schema:
+                idadf.internal_state._forget_rows()
                 idadf._reset_attributes(["shape", "index"])
 
+    def _insert_rows(self, dataframe, schema, tablename, kinds, bulk, silent=True):
+        """
+        Insert the rows of a dataframe either with a parameterized INSERT
+        statement executed with executemany (bulk is True) or with a
+        multi-row INSERT statement in which the values are written as
+        literals. See _insert_into_database.
+        """
+        query, parameters = upload.insert_query(dataframe, schema, tablename,
+                                                kinds, bulk)
+        if bulk:
+            self._prepare_and_executemany(query, parameters, autocommit=False,
+                                          silent=silent)
+        else:
+            self._prepare_and_execute(query, autocommit=False, silent=silent)
+
     def _prepare_and_execute(self, query, autocommit=True, silent=False):
         """
         Prepare and execute a query by using the cursor of an idaobject.
@@ -2028,6 +2459,26 @@ class IdaDataBase(object):
         self._check_connection()
         return sql._prepare_and_execute(self, query, autocommit, silent)
 
+    def _prepare_and_executemany(self, query, parameters, autocommit=True, silent=False):
+        """
+        Prepare a query containing parameter markers and execute it for each
+        sequence of parameters by using the cursor of an idaobject.
+
+        Parameters
+        ----------
+        query: str
+            Query to be executed.
+        parameters: list of tuples
+            Values to be bound to the parameter markers, one tuple per
+            execution.
+        autocommit: bool, default: True
+            If True, the autocommit function is available.
+        silent: bool, default: False
+            If True, the SQL statement is not printed.
+        """
+        self._check_connection()
+        return sql._prepare_and_executemany(self, query, parameters, autocommit, silent)
+
     def _check_procedure(self, proc_name, alg_name=None):
         """
         Check if a procedure is available in the database.
@@ -2121,26 +2572,137 @@ class IdaDataBase(object):
         """
         if os.getenv('AUTOCOMMIT') == 'True':
             self._con.commit()
+            self._local.dirty = False
             if os.getenv('VERBOSE') == 'True':
                 print("<< AUTOCOMMIT >>")
 
     def _check_connection(self):
         """
-        Check if the connection still exists by trying to open a cursor.
-        """
-        if self._con_type == "odbc":
-            try:
-                self._con.cursor()
-            except Exception as e:
-                raise IdaDataBaseError(e.value[-1])
-        elif self._con_type == "jdbc":
+        Check if the connection still exists.
+
+        The connection is assumed to be alive if a round trip to the database
+        succeeded less than liveness_ttl seconds ago. Otherwise, it is probed
+        with a lightweight statement and transparently reopened if it was
+        lost.
+
+        Raises
+        ------
+        IdaDataBaseError
+            The connection was closed with close(), or it was lost and could
+            not be reopened.
+        """
+        if self._closed:
+            raise IdaDataBaseError("The connection is closed")
+        if self._pool is not None and getattr(self._local, "con", None) is None:
+            # The connection will be validated by the pool at checkout
+            return
+        if time() - self._last_alive < self.liveness_ttl:
+            return
+        if not self._ping():
             try:
-                # Avoid infinite recursion
-                sql.ida_query(self,"SELECT distinct TABSCHEMA, TABNAME, OWNER,"+
-                              " TYPE from SYSCAT.TABLES WHERE (OWNERTYPE = 'U')",
-                              True, True)
-            except Exception as e:
+                self._con = self._open_connection()
+            except Exception:
                 raise IdaDataBaseError("The connection is closed")
+            warnings.warn("The connection to the database was lost and has " +
+                          "been reopened, uncommitted changes were discarded.",
+                          RuntimeWarning)
+        self._last_alive = time()
+
+    def _ping(self, con=None):
+        """
+        Probe a connection with a lightweight round trip to the database.
+        Return True if the connection is usable, False otherwise. If no
+        connection is given, the connection of the IdaDataBase is probed.
+        """
+        try:
+            if con is None:
+                con = self._con
+            if self._con_type == "jdbc" and hasattr(con, "jconn"):
+                return bool(con.jconn.isValid(5))
+            cursor = con.cursor()
+            try:
+                cursor.execute("VALUES 1")
+                cursor.fetchone()
+            finally:
+                cursor.close()
+        except Exception:
+            return False
+        return True
+
+    def _open_connection(self):
+        """
+        Open a new connection to the database using the connection string
+        of the current IdaDataBase.
+        """
+        if self._con_type == 'odbc':
+            import pypyodbc
+            return pypyodbc.connect(self._connection_string)
+        else:
+            import jaydebeapi
+            return jaydebeapi.connect('com.ibm.db2.jcc.DB2Driver', self._connection_string)
+
+    def _create_pool(self, connections=None):
+        """
+        Create the connection pool used in pooled mode.
+        """
+        return ConnectionPool(self._open_connection, self._pool_size,
+                              validate=self._ping,
+                              validate_after=self.liveness_ttl,
+                              connections=connections)
+
+    @property
+    def _con(self):
+        """
+        Connection object to the remote database. In pooled mode, this is the
+        connection held by the current thread, which is checked out from the
+        pool if the thread does not hold one yet.
+        """
+        if self._pool is None:
+            return self._connection
+        con = getattr(self._local, "con", None)
+        if con is None:
+            if self._con_type == 'jdbc':
+                # Threads other than the main one must be attached to the JVM
+                import jpype
+                if not jpype.isThreadAttachedToJVM():
+                    jpype.attachThreadToJVM()
+            con = self._pool.checkout()
+            self._local.con = con
+            self._local.dirty = False
+        return con
+
+    @_con.setter
+    def _con(self, value):
+        if self._pool is None:
+            self._connection = value
+        else:
+            # Replace the connection held by the current thread, which keeps
+            # its slot in the pool
+            previous = getattr(self._local, "con", None)
+            if previous is not None and previous is not value:
+                ConnectionPool._close_quietly(previous)
+            self._local.con = value
+
+    def _release_connection(self, dirty=False):
+        """
+        In pooled mode, give the connection held by the current thread back
+        to the pool, unless it holds changes that are not committed yet. Those
+        are kept by the thread until commit or rollback is called.
+
+        Parameters
+        ----------
+        dirty : bool, default: False
+            True if the last statement left uncommitted changes.
+        """
+        if self._pool is None:
+            return
+        if dirty:
+            self._local.dirty = True
+            return
+        con = getattr(self._local, "con", None)
+        if con is not None and not getattr(self._local, "dirty", False):
+            self._local.con = None
+            self._pool.checkin(con)
 
     def _retrieve_cache(self, cache):
         """
@@ -12,12 +12,88 @@ from future import standard_library
 standard_library.install_aliases()
 from ibmdbpy.internals import idadf_state
 from ibmdbpy.utils import timed
+from ibmdbpy import plan
+from ibmdbpy.statistics import _MAX_SELECT_ITEMS
 from collections import OrderedDict
 
+import numpy as np
 import pandas as pd
 
 import six
 
+def _entropy_queries(idadf, groups):
+    """
+    Return the queries computing, for each group of columns, the sum of
+    a*LN(a) and the sum of a, a being the number of rows of each distinct
+    combination of the values of the columns, missing values included.
+    
+    All the groups are aggregated by a single GROUP BY GROUPING SETS, unless
+    they refer to more columns than a GROUP BY allows. Each row of the
+    grouping sets is labeled with the position of its group, which is the
+    largest group whose columns are not aggregated over, according to
+    GROUPING.
+    
+    Returns
+    -------
+    list of tuple
+        Pairs of a query and of the groups it labels 0, 1, ...
+    """
+    name = idadf.internal_state.current_state
+    chunks = []
+    for group in groups:
+        if chunks and len(set(chunks[-1][1]) | set(group)) <= _MAX_SELECT_ITEMS:
+            chunks[-1][0].append(group)
+            chunks[-1][1].update(group)
+        else:
+            chunks.append(([group], set(group)))
+    
+    queries = []
+    for chunk, _ in chunks:
+        if len(chunk) == 1:
+            label = "0"
+            grouping = ", ".join(plan.quote(column) for column in chunk[0])
+        else:
+            cases = []
+            for position in sorted(range(len(chunk)), key=lambda i: -len(chunk[i])):
+                condition = " AND ".join("GROUPING(%s) = 0"%plan.quote(column)
+                                         for column in chunk[position])
+                cases.append("WHEN %s THEN %s"%(condition, position))
+            label = "CASE %s END"%" ".join(cases)
+            grouping = "GROUPING SETS (%s)"%", ".join(
+                "(%s)"%", ".join(plan.quote(column) for column in group)
+                for group in chunk)
+        subquery = ("SELECT %s AS S, COUNT(*) AS A FROM %s GROUP BY %s"
+                    %(label, name, grouping))
+        query = "SELECT S, SUM(A*LN(A)), SUM(A) FROM (%s) GROUP BY S"%subquery
+        queries.append((query, chunk))
+    return queries
+
+def _entropy_terms(idadf, groups):
+    """
+    Compute, in one scan unless there are too many columns, the sum of
+    a*ln(a) over the frequencies a of the distinct combinations of the
+    values of each group of columns, and the sum of the frequencies, that is
+    the number of rows.
+    
+    Returns
+    -------
+    tuple of numpy.ndarray
+        The sums of a*ln(a) and the numbers of rows of each group.
+    """
+    positions = OrderedDict()
+    for group in groups:
+        positions.setdefault(tuple(group), len(positions))
+    sums = np.zeros(len(positions))
+    totals = np.zeros(len(positions))
+    for query, chunk in _entropy_queries(idadf, [list(group) for group in positions]):
+        data = idadf.ida_query(query)
+        for label, total_sum, total in data.itertuples(index=False):
+            position = positions[tuple(chunk[int(label)])]
+            sums[position] = total_sum
+            totals[position] = total
+    order = [positions[tuple(group)] for group in groups]
+    return sums[order], totals[order]
+
 @idadf_state
 def entropy(idadf, target=None, mode="normal", execute=True, ignore_indexer=True):
     """
@@ -49,46 +125,50 @@ def entropy(idadf, target=None, mode="normal", execute=True, ignore_indexer=True
     Input column should be categorical, otherwise this measure does not make 
     much sense. 
     
+    The frequencies of the values of all the columns are computed by a single
+    query over the current state of idadf, from which the entropies are
+    derived. 
+    
     Examples
     --------
     >>> idadf = IdaDataFrame(idadb, "IRIS")
     >>> entropy(idadf)
     """
+    if mode not in ("normal", "raw"):
+        raise ValueError("Admissible values for mode argument are 'normal' and 'raw'.")
+    
     if target is not None:
         if isinstance(target, six.string_types):
             target = [target]
-            
-        targetstr = "\",\"".join(target)
-        subquery = "SELECT COUNT(*) AS a FROM %s GROUP BY \"%s\""%(idadf.name,targetstr)
-        if mode == "normal":
-            length = len(idadf)
-            query = "SELECT(SUM(-a*LOG(a))/%s+LOG(%s))/LOG(2)FROM(%s)"%(length, length, subquery)
-        elif mode == "raw":
-            query = "SELECT SUM(-a*LOG(a)) FROM(%s)"%(subquery)
-        
-        if not execute:
-            query = query[:query.find("FROM")] + ",'%s'"%"\',\'".join(target) + query[query.find("FROM"):]
-            return query
-        return idadf.ida_scalar_query(query)
+        groups = [list(target)]
     else:
-        entropy_dict = OrderedDict()
         columns = list(idadf.columns)
         # Remove indexer
         if ignore_indexer:
             if idadf.indexer:
                 if idadf.indexer in columns:
                     columns.remove(idadf.indexer)
-                    
-        for column in columns:
-           entropy_dict[column] = entropy(idadf, column, mode = mode)
-                    
-        # Output
-        if len(columns) > 1:
-            result = pd.Series(entropy_dict)
-            result.sort_values(ascending = False)
+        groups = [[column] for column in columns]
+    
+    if not execute:
+        queries = [query for query, _ in _entropy_queries(idadf, groups)]
+        if len(queries) == 1:
+            return queries[0]
+        return queries
+    
+    sums, totals = _entropy_terms(idadf, groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if mode == "normal":
+            values = (-sums/totals + np.log(totals))/np.log(2)
         else:
-            result = entropy_dict[columns[0]]
-        return result
+            values = -sums
+    
+    # Output
+    if target is not None or len(groups) == 1:
+        return values[0]
+    result = pd.Series(values, index=[group[0] for group in groups])
+    result.sort_values(ascending = False)
+    return result
     
 def entropy_stats(idadf, target=None, mode="normal", execute = True, ignore_indexer=True):
     """
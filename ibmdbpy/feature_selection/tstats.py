@@ -19,6 +19,7 @@ import pandas as pd
 
 #from ibmdbpy.internals import idadf_state
 from ibmdbpy.feature_selection.private import _check_input
+from ibmdbpy.statistics import _grouped_moments
 
 #@idadf_state#(force=True)
 def ttest(idadf, target=None, features=None, ignore_indexer=True):
@@ -61,8 +62,8 @@ def ttest(idadf, target=None, features=None, ignore_indexer=True):
     The target columns should be categorical, while the feature columns should
     be numerical.
     
-    The scalability of this approach is not very good. Should not be used on 
-    high dimensional data. 
+    The moments of all the features within the classes of a target are
+    computed in one scan, from which the statistics are derived.
     
     Examples
     --------
@@ -72,11 +73,6 @@ def ttest(idadf, target=None, features=None, ignore_indexer=True):
     # Check input
     target, features = _check_input(idadf, target, features, ignore_indexer)
     ttest_dict = OrderedDict()
-    length = len(idadf)
-    
-    S_dict = dict()
-    M_dict = dict()
-    class_mean_dict = dict()
     
     numerical_columns = idadf._get_numerical_columns()
     
@@ -84,43 +80,27 @@ def ttest(idadf, target=None, features=None, ignore_indexer=True):
     features = [feature for feature in features if feature in numerical_columns]
     if not features:
         raise TypeError("No numerical features.")
-        
-    #mean = idadf[features].mean() # This is broken
-    mean = idadf.mean()
     
     if target is None:
         target = list(idadf.columns)
             
     for t in target:
         features_notarget = [x for x in features if (x != t)]
-    
-        if t not in M_dict:
-            count = idadf.count_groupby(t)    
-            target_count = count["count"]
-            target_count.index = count[t]
-            M_dict[t] = np.sqrt(1/target_count + 1/length)     
         
-        if t not in S_dict:
-            S_dict[t] = idadf.within_class_std(target = t, features = features_notarget)
+        # Class sizes, class means, overall means and within class variances
+        # all derive from the moments of the features within each class
+        moments = _grouped_moments(idadf, t, features_notarget)
+        length = moments.total()
         
-        if t not in class_mean_dict:
-            class_mean_dict[t] = idadf.mean_groupby(t, features = features_notarget)
-            
-        M = M_dict[t]
-        S = S_dict[t]
-        class_mean = class_mean_dict[t]
+        M = np.sqrt(1/moments.class_size() + 1/length)
+        S = np.sqrt(moments.within_class_var())
+        class_mean = moments.class_mean()
+        mean = moments.overall_mean()
         
+        ratio = (class_mean - mean).abs().div(M, axis=0).div(S, axis=1)
         ttest_dict[t] = OrderedDict()
         for feature in features_notarget:
-            ttest_dict[t][feature] = OrderedDict()
-            for target_class in class_mean.index:
-                numerator = abs(class_mean.loc[target_class][feature] - mean[feature])
-                denominator = M[target_class] * S[feature]
-                
-                ttest_dict[t][feature][target_class] = numerator / denominator
-                    
-        for feature in features_notarget:
-            ttest_dict[t][feature] = max(ttest_dict[t][feature].values())
+            ttest_dict[t][feature] = ratio[feature].max()
         
     result = pd.DataFrame(ttest_dict)
     
@@ -54,10 +54,11 @@ import ibmdbpy.aggregation
 import ibmdbpy.filtering
 import ibmdbpy.utils
 
-from ibmdbpy.utils import timed, chunklist
+from ibmdbpy import sql
+from ibmdbpy.utils import timed
 from ibmdbpy.internals import InternalState
 from ibmdbpy.exceptions import IdaDataFrameError
-from ibmdbpy.internals import idadf_state
+from ibmdbpy.internals import idadf_state, ColumnMap
 
 
 class IdaDataFrame(object):
@@ -207,7 +208,6 @@ class IdaDataFrame(object):
 
 
     @property
-    @idadf_state
     def name(self):
         return self.internal_state.current_state
 
@@ -271,11 +271,14 @@ class IdaDataFrame(object):
         return self._get_type()
 
     @lazy
-    @idadf_state(force = True)
     def dtypes(self):
         """
         Data type in database for each column in self.
 
+        The types of the columns of a modified IdaDataFrame are inferred from
+        its internal state and the types of the columns of its table. They
+        are looked up in the catalog only if they cannot be inferred.
+
         Returns
         -------
         DataFrame
@@ -291,8 +294,15 @@ class IdaDataFrame(object):
         petal_width    DOUBLE
         species       VARCHAR
         """
-        #import pdb ; pdb.set_trace()
-        return self._get_columns_dtypes()
+        if self.internal_state.views:
+            dtypes = self.internal_state._infer_dtypes()
+            if dtypes is not None:
+                return dtypes
+        dtypes = self._get_columns_dtypes_in_view()
+        if not self.internal_state.views:
+            self.internal_state._table_info["types"] = OrderedDict(
+                zip(dtypes.index, dtypes["TYPENAME"]))
+        return dtypes
 
     @lazy
     @idadf_state
@@ -338,11 +348,9 @@ class IdaDataFrame(object):
         'species'],
         dtype='object')
         """
-        if hasattr(self, "internal_state"):
-            self.internal_state._create_view()
-            cols = self._get_columns()
-            self.internal_state._delete_view()
-            return cols
+        if hasattr(self, "internal_state") and self.internal_state.views:
+            # The columns of a modified state are known from its plan
+            return Index(list(self.internal_state.columndict.keys()))
         else:
             return self._get_columns()
 
@@ -470,17 +478,14 @@ class IdaDataFrame(object):
                 newidaseries = self._clone_as_serie(item)
 
                 # Form the new columndict
-                for column in list(newidaseries.internal_state.columndict):
-                    if column != item:
-                        del newidaseries.internal_state.columndict[column]
-                newColumndict = newidaseries.internal_state.columndict
+                newColumndict = ColumnMap([(item, self.internal_state.columndict[item])])
 
                 # Erase attributes
                 newidaseries._reset_attributes(["columns", "shape", "dtypes"])
                 # Set columns and columndict attributes
                 newidaseries.internal_state.columns = ["\"%s\""%col for col in item]
                 newidaseries.internal_state.columndict = newColumndict
-                # Update, i.e. appends an entry to internal_state._cumulative
+                # Update, i.e. cumulates the selection of columns in internal_state
                 newidaseries.internal_state.update()
 
                 # Performance improvement
@@ -507,7 +512,7 @@ class IdaDataFrame(object):
             # Set columns and columndict attributes
             newidadf.internal_state.columns = ["\"%s\""%col for col in item]
             newidadf.internal_state.columndict = newColumndict
-            # Update, i.e. appends an entry to internal_state._cumulative
+            # Update, i.e. cumulates the selection of columns in internal_state
             newidadf.internal_state.update()
 
             # Performance improvement
@@ -547,7 +552,7 @@ class IdaDataFrame(object):
         #set columns and columndict attributes
         self.internal_state.columndict = newColumndict
         self.internal_state.columns = ["\"%s\""%col for col in newColumndict.keys()]
-        #update, i.e. appends an entry to internal_state._cumulative
+        #update, i.e. cumulates the selection of columns in internal_state
         self.internal_state.update()
 
         # Flush the "unique" cache
@@ -594,9 +599,9 @@ class IdaDataFrame(object):
         allow possible views related to the IdaDataFrame with be deleted when
         the object goes out of scope
         """
-        while self.internal_state.viewstack:
+        while self.internal_state.physical_views:
             try :
-                view = self.internal_state.viewstack.pop()
+                view = self.internal_state.physical_views.pop()
                 # Just a last check to make sure not to drop user's db
                 if view != self.tablename:
                     drop = "DROP VIEW \"%s\"" %view
@@ -990,14 +995,16 @@ class IdaDataFrame(object):
 
     # Should we maybe allow this only in IdaDataBase object ?
     #@timed
-    def ida_query(self, query, silent = False, first_row_only = False, autocommit = False):
+    def ida_query(self, query, silent = False, first_row_only = False, autocommit = False,
+                  chunksize = None):
         """
         Convenience function delegated from IdaDataBase.
 
         Prepare, execute and format the result of a query in a data frame or in
         a tuple. See the IdaDataBase.ida_query documentation.
         """
-        return self._idadb.ida_query(query, silent, first_row_only, autocommit)
+        return self._idadb.ida_query(query, silent, first_row_only, autocommit,
+                                     chunksize)
 
     def ida_scalar_query(self, query, silent = False, autocommit = False):
         """
@@ -1176,8 +1183,9 @@ class IdaDataFrame(object):
             List of columns that is used as an index and by which the
             dataframe is grouped.
         max_entries: int, default=1000
-            The maximum number of cells to be part of the output. By default,
-            set to 1000.
+            The maximum number of cells to be part of the output, counted as
+            the number of combinations of the levels of the columns times the
+            square of the number of columns. By default, set to 1000.
         sort: str, optional
             Admissible values are: “alpha” and “factors”.
                 * If “alpha”, the index of the output is sorted according to the alphabetical order.
@@ -1201,6 +1209,14 @@ class IdaDataFrame(object):
         -------
         Pandas Series with Multi-index (columns)
 
+        Notes
+        -----
+        The table is computed by a single statement, which also tells
+        whether it has more than max_entries entries. The numbers of
+        distinct values of the columns are only computed when columns are
+        selected automatically, when sorting by factors or when reporting
+        an overflow.
+
         Examples
         --------
         >>> val = ['sepal_length', 'sepal_width', 'petal_length', 'petal_width']
@@ -1227,10 +1243,50 @@ class IdaDataFrame(object):
                            factor_threshold=factor_threshold,
                            interactive=interactive, aggfunc=aggfunc)
 
-    @idadf_state
-    def groupby(self, by):
-        # TODO: create an IdadataFrame groupby
-        raise NotImplementedError()
+    def groupby(self, by, subtotals=None, dropna=True, margins_name="All"):
+        """
+        Group the rows of self by the values of one or several columns.
+        All the aggregations requested at once on the groups are computed by
+        a single GROUP BY query.
+
+        Parameters
+        ----------
+        by : str or list of str
+            Columns of self by which the rows are grouped.
+        subtotals : str, optional
+            "rollup" or "cube" to add subtotals over the columns in by, as
+            the ROLLUP and CUBE grouping clauses of DB2 do.
+        dropna : bool, default: True
+            If True, the rows that have missing values in the columns in by
+            are left out, like in pandas.
+        margins_name : str, default: "All"
+            Value taken by the columns in by that are aggregated over in the
+            subtotals.
+
+        Returns
+        -------
+        IdaGroupBy
+
+        Examples
+        --------
+        >>> ida_iris.groupby("species").agg({"sepal_length": ["mean", "max"],
+        ...                                  "petal_width": "count"})
+                  sepal_length      petal_width
+                          mean  max       count
+        species
+        setosa           5.006  5.8          50
+        versicolor       5.936  7.0          50
+        virginica        6.588  7.9          50
+        >>> ida_iris.groupby("species").size()
+        species
+        setosa        50
+        versicolor    50
+        virginica     50
+        dtype: int64
+        """
+        from ibmdbpy.groupby import IdaGroupBy
+        return IdaGroupBy(self, by, subtotals=subtotals, dropna=dropna,
+                          margins_name=margins_name)
 
     @idadf_state
     def merge(self):
@@ -1320,10 +1376,16 @@ class IdaDataFrame(object):
             return idadf
 
     @idadf_state
-    def levels(self, columns = None):
+    def levels(self, columns = None, fast = None):
         # TODO: Test, doc, name?
         """
         Return the numbers of distinct values
+
+        Missing values are not counted. If fast is True, or if fast is None
+        and the use_catalog_stats attribute of the IdaDataBase is True, the
+        numbers are read from the statistics of the catalog when self is its
+        table or a selection of its columns and the statistics of its table
+        are up to date.
         """
         if columns is not None:
             if isinstance(columns, six.string_types):
@@ -1336,15 +1398,20 @@ class IdaDataFrame(object):
                     raise ValueError(message)
         else:
             columns = self.columns
+        columns = list(columns)
 
-        agglist = []
-        for column in columns:
-            agglist.append("COUNT(DISTINCT \"%s\")"%column)
+        levels = OrderedDict()
+        if ibmdbpy.statistics._use_catalog_statistics(self, fast):
+            stats = ibmdbpy.statistics._catalog_column_statistics(self, columns)
+            if stats is not None:
+                for column in stats.index:
+                    levels[column] = int(stats.loc[column, "COLCARD"])
+        remaining = [column for column in columns if column not in levels]
 
-        aggstr = ",".join(agglist)
-
-        query = "SELECT %s FROM %s"%(aggstr, self.name)
-        levels_tuple = self.ida_query(query, first_row_only = True)
+        if remaining:
+            values = ibmdbpy.statistics._aggregate(self, "levels", remaining).loc["levels"]
+            levels.update(zip(remaining, [int(value) for value in values]))
+        levels_tuple = tuple(levels[column] for column in columns)
 
         if len(levels_tuple) == 1:
             return levels_tuple[0]
@@ -1464,7 +1531,7 @@ class IdaDataFrame(object):
     # TODO: to implement for categorical attributes
     @timed
     @idadf_state
-    def describe(self, percentiles=[0.25, 0.50, 0.75]):
+    def describe(self, percentiles=[0.25, 0.50, 0.75], approx=False, error=0.01):
         """
         A basic statistical summary about current IdaDataFrame. If at least one
         numerical column exists, the summary includes:
@@ -1481,6 +1548,12 @@ class IdaDataFrame(object):
         percentiles : Float or list of floats, default: [0.25, 0.50, 0.75].
             percentiles to be computed on numerical columns.
             All values in percentiles must be > 0  and < 1.
+        approx : bool, default: False
+            If True, the percentiles are approximated without sorting the
+            data, see quantile, and an "error" row gives their largest
+            error for each column.
+        error : float, default: 0.01
+            Acceptable error of the approximate percentiles.
 
         Returns
         -------
@@ -1490,7 +1563,42 @@ class IdaDataFrame(object):
 
         """
         from ibmdbpy.statistics import describe
-        return describe(idadf=self, percentiles=percentiles)
+        return describe(idadf=self, percentiles=percentiles, approx=approx,
+                        error=error)
+
+    @timed
+    @idadf_state
+    def agg(self, func):
+        """
+        Aggregate the columns of self with one or several statistics, all
+        of them being computed in one scan of the data.
+
+        Parameters
+        ----------
+        func : str, list of str or dict
+            Statistics to be computed: "count", "nulls" (the number of
+            missing values), "mean", "std", "var", "min", "max", "sum" or
+            "levels" (the number of distinct values). A dict maps the name
+            of columns to the statistics to be computed on them. Statistics
+            other than count, nulls, min, max and levels are only computed
+            on numerical columns.
+
+        Returns
+        -------
+        Series or DataFrame
+            A Series indexed by the columns of self for a single statistic,
+            a DataFrame indexed by the statistics otherwise. For an
+            IdaSeries, a scalar or a Series indexed by the statistics.
+
+        Examples
+        --------
+        >>> ida_iris.agg(["min", "max"])
+              sepal_length  sepal_width  petal_length  petal_width species
+        min           4.3          2.0           1.0          0.1  setosa
+        max           7.9          4.4           6.9          2.5  virginica
+        """
+        from ibmdbpy.statistics import agg
+        return agg(idadf=self, func=func)
 
     @timed
     @idadf_state
@@ -1505,6 +1613,13 @@ class IdaDataFrame(object):
         covariance matrix: DataFrame
             The axes are the columns of self and the values are the covariance
             coefficients.
+
+        Notes
+        -----
+        The moments from which the coefficients are derived are kept for
+        the rows of self, and shared with its clones. They are forgotten when
+        rows are inserted through ibmdbpy, but not when the table is modified
+        by other means, in which case clear_cache should be called.
         """
         from ibmdbpy.statistics import cov
         return cov(idadf=self)
@@ -1538,29 +1653,65 @@ class IdaDataFrame(object):
         correlation method. This strategy has the property that the sum of the
         ranking numbers is the same as under ordinal ranking. We then apply
         the pearson correlation coefficient method to these ranks.
+
+        The moments from which the coefficients are derived are kept for
+        the rows of self, and shared with its clones. They are forgotten when
+        rows are inserted through ibmdbpy, but not when the table is modified
+        by other means, in which case clear_cache should be called.
         """
         from ibmdbpy.statistics import corr
         return corr(idadf=self, features=features, ignore_indexer=ignore_indexer)
 
-    # TODO: to implement
     @timed
     @idadf_state
     def corrwith(self, other):
         """
-        Compute the correlation matrix, composed of correlation coefficients
-        between the columns of self and the columns of another IdaDataFrame.
+        Compute the Pearson correlation coefficients between the numerical
+        columns of self and the columns of other, which must be columns of
+        the same rows, for example selected from self or derived from its
+        columns. The coefficients are computed from the same moments as
+        cov and corr, so that no new scan is needed after one of them.
 
         Parameters
         ----------
-        other : DataFrame
+        other : IdaDataFrame or IdaSeries
+            If other is an IdaSeries, each column of self is correlated with
+            it. Otherwise, the columns of self are correlated with the columns
+            of other of the same name.
 
         Returns
         -------
-        correlation matrix: DataFrame
-            The columns are the columns of self and the index the columns
-            of other. The values are the covariance coefficients.
+        correlations: Series
+            The index consists of the columns of self that were correlated.
+
+        Examples
+        --------
+        >>> ida_iris.corrwith(ida_iris["petal_width"])
+        sepal_length    0.817954
+        sepal_width    -0.356544
+        petal_length    0.962757
+        petal_width     1.000000
+        dtype: float64
+
+        Notes
+        -----
+        The moments from which the coefficients are derived are kept for
+        the rows of self, and shared with its clones. They are forgotten when
+        rows are inserted through ibmdbpy, but not when the table is modified
+        by other means, in which case clear_cache should be called.
         """
-        raise NotImplementedError("TODO")
+        from ibmdbpy.statistics import corrwith
+        return corrwith(idadf=self, other=other)
+
+    def clear_cache(self):
+        """
+        Forget what was computed about the rows of the table of self and of
+        its clones: their number and the moments used by cov, corr and
+        corrwith. To be called after the table was modified other than
+        through ibmdbpy, for example by another connection.
+        """
+        self.internal_state._forget_rows()
+        self._reset_attributes(["shape"])
 
     # TODO: to implement
     @timed
@@ -1577,7 +1728,7 @@ class IdaDataFrame(object):
 
     @timed
     @idadf_state
-    def quantile(self, q=0.5):
+    def quantile(self, q=0.5, interpolation="linear", approx=False, error=0.01):
         """
         Compute row wise quantiles for each numeric column.
 
@@ -1585,6 +1736,22 @@ class IdaDataFrame(object):
         ----------
         q : float or array-like, default 0.5 (50% quantile)
             0 <= q <= 1, the quantile(s) to compute
+        interpolation : {"linear", "lower", "higher", "midpoint", "nearest"}
+            Value returned when a quantile lies between two values i < j,
+            as in pandas. Default: "linear", i + (j - i) * fraction.
+            "midpoint", (i + j) / 2, is the result of previous versions.
+        approx : bool, default: False
+            If True, the quantiles are approximated without sorting the
+            data. For a table or a selection of its columns whose statistics
+            are up to date, they are interpolated from the quantiles kept in
+            the catalog (SYSCAT.COLDIST) if these are fine enough for error,
+            otherwise they are computed over a sample of the rows. Only
+            available with a linear interpolation.
+        error : float, default: 0.01
+            Acceptable error of the approximate quantiles, as a difference
+            between the fraction of the values below a returned quantile and
+            the requested one. Sampled quantiles are within their error with
+            95% confidence.
 
         Returns
         -------
@@ -1593,10 +1760,13 @@ class IdaDataFrame(object):
             index is q. The columns are the columns of sel, and the values are
             the quantiles. If q is a float, a Series is returned where the
             index is the columns of self and the values are the quantiles.
+            If approx is True, a tuple of the quantiles and of their error,
+            in the same format.
 
         """
         from ibmdbpy.statistics import quantile
-        return quantile(idadf=self, q=q)
+        return quantile(idadf=self, q=q, interpolation=interpolation,
+                        approx=approx, error=error)
 
     @timed
     @idadf_state
@@ -1657,18 +1827,26 @@ class IdaDataFrame(object):
 
     @timed
     @idadf_state
-    def count_distinct(self):
+    def count_distinct(self, fast=None):
         # deprecated, use levels instead
         """
         Compute the count of distinct values for all numeric columns of self.
 
+        Parameters
+        ----------
+        fast : bool, optional
+            If True, the counts are read from the statistics of the catalog
+            when self is its table or a selection of its columns and the
+            statistics of its table are newer than its last alteration. Defaults to the
+            use_catalog_stats attribute of the IdaDataBase.
+
         Returns
         -------
         disctinct count: Series
             The index consists of the columns of self and values are the number of distinct values.
         """
         from ibmdbpy.statistics import count_distinct
-        return count_distinct(idadf=self)
+        return count_distinct(idadf=self, fast=fast)
 
     @timed
     @idadf_state
@@ -1687,80 +1865,35 @@ class IdaDataFrame(object):
     @timed
     @idadf_state
     def within_class_var(self, target, features = None, ignore_indexer=True):
+        """
+        Compute the within-class variance of numeric columns of self, the
+        classes being the values of target: the sum of the squared deviations
+        from the mean of each class, divided by the number of rows minus the
+        number of classes.
+
+        The moments of all the columns in each class are computed by a
+        single grouped query, from which the variances are derived.
+
+        Returns
+        -------
+        within_class_var: Series
+            The index consists of the features and the values are the variance.
+        """
         if features is None:
             numerical_columns = self._get_numerical_columns()
             features = [x for x in numerical_columns if x != target]
         else:
             if isinstance(features, six.string_types):
                 features = [features]
+            features = list(features)
 
         if ignore_indexer is True:
             if self.indexer:
                 if self.indexer in features:
                     features.remove(self.indexer)
 
-        result = pd.Series()
-
-        #C = self.levels(target)
-        N = len(self)
-
-        if len(features) < 5:
-
-            avglist = ["AVG(\"%s\") as \"average%s\""%(feature, index) for index, feature in enumerate(features)]
-            sumlist = ["SUM(CAST(POWER(\"%s\" - \"average%s\", 2) as DOUBLE))"%(feature, index) for index, feature in enumerate(features)]
-
-            avgstr = ", ".join(avglist)
-            sumstr = ", ".join(sumlist)
-
-            subquery = "(SELECT \"%s\", %s FROM %s GROUP BY \"%s\") AS B"%(target, avgstr, self.name, target)
-            condition = "ON A.\"%s\" = B.\"%s\""%(target, target)
-            groupby = "GROUP BY A.\"%s\""%target
-            query = "SELECT %s FROM %s AS A INNER JOIN %s %s %s"%(sumstr, self.name, subquery, condition, groupby)
-
-            classvar = self.ida_query(query)
-            if len(features) == 1:
-                classvar = pd.DataFrame(classvar)
-
-            C = len(classvar)
-            if N == C:
-                N += 1
-
-
-            classvar.columns = pd.Index(features)
-            result = pd.Series()
-            for attr in classvar:
-                result[attr] = classvar[attr].sum()/(N -C)
-
-        else:
-            chunkgen = chunklist(features, 5)
-            result = pd.Series()
-            for chunk in chunkgen:
-                avglist = ["AVG(\"%s\") as \"average%s\""%(feature, index) for index, feature in enumerate(chunk)]
-                sumlist = ["SUM(CAST(POWER(\"%s\" - \"average%s\", 2) as DOUBLE))"%(feature, index) for index, feature in enumerate(chunk)]
-
-                avgstr = ", ".join(avglist)
-                sumstr = ", ".join(sumlist)
-
-                subquery = "(SELECT \"%s\", %s FROM %s GROUP BY \"%s\") AS B"%(target, avgstr, self.name, target)
-                condition = "ON A.\"%s\" = B.\"%s\""%(target, target)
-                groupby = "GROUP BY A.\"%s\""%target
-                query = "SELECT %s FROM %s AS A INNER JOIN %s %s %s"%(sumstr, self.name, subquery, condition, groupby)
-
-                classvar = self.ida_query(query)
-
-                if len(chunk) == 1:
-                    classvar = pd.DataFrame(classvar)
-
-                C = len(classvar)
-                if N == C:
-                    N += 1
-
-                classvar.columns = pd.Index(chunk)
-
-                for attr in classvar:
-                    result[attr] = classvar[attr].sum()/(N -C)
-
-        return result
+        from ibmdbpy.statistics import _grouped_moments
+        return _grouped_moments(self, target, features).within_class_var()
 
     @timed
     @idadf_state
@@ -1973,6 +2106,49 @@ class IdaDataFrame(object):
 #        data = ibmdbpy.utils._convert_dtypes(self, data)
         return data
 
+    def iter_batches(self, batch_size=10000):
+        """
+        Iterate over the dataset as a sequence of Pandas DataFrames of at most
+        batch_size rows.
+
+        Rows are fetched from the database as the batches are consumed, so
+        that only one batch is held in memory at a time and the first rows
+        can be processed before the whole dataset is downloaded.
+
+        Parameters
+        ----------
+        batch_size : int, default: 10000
+            Maximum number of rows in each batch.
+
+        Returns
+        -------
+        generator of DataFrames
+            Columns and records are the same as in self. The dtypes are
+            derived from the database types of the columns, so that all
+            batches are consistent: integer columns containing missing values
+            are returned as float64, dates and timestamps as datetime64.
+
+        Examples
+        --------
+        >>> for batch in ida_iris.iter_batches(batch_size=100):
+        ...     print(batch.shape)
+        (100, 5)
+        (50, 5)
+        """
+        if not isinstance(batch_size, six.integer_types) or batch_size < 1:
+            raise ValueError("batch_size should be a positive integer.")
+        typenames = dict(self.dtypes['TYPENAME'])
+        columns = self.columns
+        self._idadb._check_connection()
+        chunks = sql._ida_query_chunks(self._idadb, self.internal_state.get_state(),
+                                       False, batch_size, False, typenames)
+
+        def _batches():
+            for batch in chunks:
+                batch.columns = columns
+                yield batch
+        return _batches()
+
 ###############################################################################
 ### Connection Management
 ###############################################################################
@@ -2015,45 +2191,55 @@ class IdaDataFrame(object):
 ### Private functions
 ###############################################################################
 
-    def _clone(self):
-        """
-        Clone the actual object.
+    def _derive(self, cls, **attributes):
         """
-        newida = IdaDataFrame(self._idadb, self._name, self.indexer)
-        newida.columns = self.columns
-        newida.dtypes = self.dtypes     # avoid recomputing it
-        # otherwise risk of infinite loop between
-        # idadf.columns and internalstate.columndict
+        Create an object of class cls open on the same table as self, with a
+        copy of its internal state. The existence of the table is not checked
+        again, and the plan and columns of the state are shared with self, so
+        that deriving is O(1) whatever the number of columns.
 
+        Parameters
+        ----------
+        cls : class
+            IdaDataFrame or one of its subclasses.
+        **attributes
+            Additional attributes of the new object, such as the column of an
+            IdaSeries.
+        """
         # This is not possible to use deepcopy on an IdaDataFrame object
         # because the reference to the parents IdaDataBase with the connection
         # object is not pickleable. As a consequence, we create a new
         # IdaDataFrame and copy all the relevant attributes
+        newida = cls.__new__(cls)
+        newida._idadb = self._idadb
+        newida._indexer = self._indexer
+        newida.loc = ibmdbpy.indexing.Loc(newida)
+        newida.schema = self.schema
+        newida._name = self._name
+        newida.tablename = self.tablename
+        newida._unique = dict()
+        for attribute, value in six.iteritems(attributes):
+            setattr(newida, attribute, value)
+        newida.internal_state = self.internal_state._fork(newida)
+        self._idadb._idadfs.append(newida)
+        return newida
 
-        newida.internal_state.name = deepcopy(self.internal_state.name)
-        newida.internal_state.ascending = deepcopy(self.internal_state.ascending)
-        #newida.internal_state.views = deepcopy(self.internal_state.views)
-        newida.internal_state._views = deepcopy(self.internal_state._views)
-        newida.internal_state._cumulative = deepcopy(self.internal_state._cumulative)
-        newida.internal_state.order = deepcopy(self.internal_state.order)
-        newida.internal_state.columndict = deepcopy(self.internal_state.columndict)
+    def _clone(self):
+        """
+        Clone the actual object.
+        """
+        newida = self._derive(IdaDataFrame)
+        # Avoid recomputing columns and dtypes, if they are known
+        for attribute in ("columns", "dtypes"):
+            if attribute in self.__dict__:
+                setattr(newida, attribute, self.__dict__[attribute])
         return newida
 
     def _clone_as_serie(self, column):
         """
         Clone the actual object as an IdaSeries and select one of its columns.
         """
-        newida = ibmdbpy.IdaSeries(idadb = self._idadb, tablename = self._name,
-                                   indexer = self.indexer, column = column)
-
-        newida.internal_state.name = deepcopy(self.internal_state.name)
-        newida.internal_state.ascending = deepcopy(self.internal_state.ascending)
-        #newida.internal_state.views = deepcopy(self.internal_state.views)
-        newida.internal_state._views = deepcopy(self.internal_state._views)
-        newida.internal_state._cumulative = deepcopy(self.internal_state._cumulative)
-        newida.internal_state.order = deepcopy(self.internal_state.order)
-        newida.internal_state.columndict = deepcopy(self.internal_state.columndict)
-        return newida
+        return self._derive(ibmdbpy.IdaSeries, column = column)
 
     def _get_type(self):
         """
@@ -2068,22 +2254,27 @@ class IdaDataFrame(object):
 
     def _get_columns(self):
         """
-        Index containing a list of the columns in self.
+        Index containing a list of the columns of the physical table or view
+        of self. The columns of a modified state are given by its columndict.
         """
-        tablename = self.internal_state.current_state
+        # current_state may be a subquery or the alias of a state, which the
+        # catalog and the raw cursors below know nothing about
         if self._idadb._con_type == 'odbc':
-            if '.' in tablename:
-                schema = tablename.split('.')[-2]
-                tablename = tablename.split('.')[-1]
-            else:
-                schema = self._idadb.current_schema
-            columns = self._idadb._con.cursor().columns(table=tablename, schema=schema)
-            columnlist = [column[3] for column in columns]
+            try:
+                columns = self._idadb._con.cursor().columns(table=self.tablename,
+                                                             schema=self.schema)
+                columnlist = [column[3] for column in columns]
+            finally:
+                self._idadb._release_connection()
             return Index(columnlist)
         elif self._idadb._con_type == 'jdbc':
-            cursor = self._idadb._con.cursor()
-            cursor.execute("SELECT * FROM %s"%tablename)
-            columnlist = [column[0] for column in cursor.description]
+            try:
+                cursor = self._idadb._con.cursor()
+                cursor.execute("SELECT * FROM %s"%self._name)
+                columnlist = [column[0] for column in cursor.description]
+                cursor.close()
+            finally:
+                self._idadb._release_connection()
             return Index(columnlist)
 
     def _get_all_columns_in_table(self):
@@ -2103,13 +2294,34 @@ class IdaDataFrame(object):
     def _get_shape(self):
         """
         Tuple containing the number of rows and the number of columns in self.
+        The rows are counted only if their number cannot be proven from the
+        plan of the current state.
         """
-        name = self.internal_state.current_state
-
-        nrow = self.ida_scalar_query("SELECT CAST(COUNT(*) AS INTEGER) FROM %s"%name)
+        nrow = self.internal_state._count_rows()
+        if nrow is None:
+            name = self.internal_state.current_state
+            nrow = self.ida_scalar_query("SELECT CAST(COUNT(*) AS INTEGER) FROM %s"%name)
         ncol = len(self.columns)
         return (nrow, ncol)
 
+    @idadf_state(force = True)
+    def _get_columns_dtypes_in_view(self):
+        """
+        DataFrame containing the column names and database types in self,
+        looked up in the catalog on a view of the current state if needed.
+        """
+        return self._get_columns_dtypes()
+
+    def _get_table_dtypes(self):
+        """
+        Ordered dictionary of the database types of the columns of the table
+        self is open on, whatever the state of self.
+        """
+        data = self.ida_query(("SELECT COLNAME, TYPENAME FROM SYSCAT.COLUMNS "+
+                               "WHERE TABNAME=\'%s\' AND TABSCHEMA=\'%s\' "+
+                               "ORDER BY COLNO")%(self.tablename, self.schema))
+        return OrderedDict(zip(data.iloc[:, 0], data.iloc[:, 1]))
+
     def _get_columns_dtypes(self):
         """
         DataFrame containing the column names and database types in self.
@@ -2152,7 +2364,9 @@ class IdaDataFrame(object):
             attributes = [attributes]
 
         # Special case : resetting columns
-        if "columns" in attributes:
+        # The columndict of a modified state defines its columns in terms of
+        # the plan, so it is kept up to date instead of being recomputed
+        if "columns" in attributes and not self.internal_state.views:
              try:
                  del self.internal_state.columndict
              except:
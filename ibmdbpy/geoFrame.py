@@ -29,7 +29,6 @@ import ibmdbpy
 from ibmdbpy.frame import IdaDataFrame
 from ibmdbpy.geoSeries import IdaGeoSeries
 
-from copy import deepcopy
 
 import six
 
@@ -278,19 +277,14 @@ class IdaGeoDataFrame(IdaDataFrame):
         else:
             # TODO: check if it's better to only change the .__base__ attribute
 
+            if geometry is not None and not isinstance(geometry, six.string_types):
+                raise TypeError("geometry must be a string")
             #behavior based on _clone() method of IdaDataFrame
-            newida = IdaGeoDataFrame(
-                    idadf._idadb, idadf._name, idadf.indexer, geometry)
+            newida = idadf._derive(IdaGeoDataFrame, _geometry_colname = None)
             newida.columns = idadf.columns 
             newida.dtypes = idadf.dtypes
-            
-            newida.internal_state.name = deepcopy(idadf.internal_state.name)
-            newida.internal_state.ascending = deepcopy(idadf.internal_state.ascending)
-            #newida.internal_state.views = deepcopy(idadf.internal_state.views)
-            newida.internal_state._views = deepcopy(idadf.internal_state._views)
-            newida.internal_state._cumulative = deepcopy(idadf.internal_state._cumulative)
-            newida.internal_state.order = deepcopy(idadf.internal_state.order)
-            newida.internal_state.columndict = deepcopy(idadf.internal_state.columndict)
+            if geometry is not None:
+                newida.set_geometry(geometry)
             return newida
 
     def set_geometry(self, column_name):
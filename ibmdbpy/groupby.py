@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------
+# Copyright (c) 2015, IBM Corp.
+# All rights reserved.
+#
+# Distributed under the terms of the BSD Simplified License.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#-----------------------------------------------------------------------------
+
+"""
+GroupBy object of IdaDataFrames, whose aggregations are all computed by a
+single GROUP BY query in the database
+"""
+
+# Python 2 Compatibility
+from __future__ import print_function
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from builtins import object
+from builtins import zip
+from builtins import str
+from builtins import range
+from future import standard_library
+standard_library.install_aliases()
+
+from collections import OrderedDict
+
+import pandas as pd
+import six
+
+from ibmdbpy import plan
+from ibmdbpy.internals import idadf_state
+from ibmdbpy.statistics import _AGGREGATES, _aggregate_expression
+
+# Statistics that are computed on all columns, other ones only on numerical
+# columns
+_ANY_TYPE_AGGREGATES = ["count", "nulls", "min", "max", "levels"]
+
+# Statistics that transform can compute over the groups of each row
+_WINDOW_AGGREGATES = ["count", "mean", "std", "var", "min", "max", "sum"]
+
+class IdaGroupBy(object):
+    """
+    Grouping of the rows of an IdaDataFrame by the values of one or several
+    of its columns, returned by IdaDataFrame.groupby. All the statistics
+    requested at once are computed by a single GROUP BY query.
+
+    Parameters
+    ----------
+    idadf : IdaDataFrame
+        IdaDataFrame whose rows are grouped.
+    by : str or list of str
+        Columns of idadf by which the rows are grouped.
+    subtotals : str, optional
+        "rollup" or "cube" to add the groups of the GROUP BY ROLLUP or
+        GROUP BY CUBE clauses of DB2, which aggregate over all the values of
+        some of the columns in by.
+    dropna : bool, default: True
+        If True, the rows that have missing values in the columns in by are
+        left out, like in pandas.
+    margins_name : str, default: "All"
+        Value taken by the columns in by that are aggregated over in the
+        groups added by subtotals.
+    selection : str or list of str, optional
+        Columns that are aggregated, by default all the columns of idadf
+        that are not in by. A str makes the IdaGroupBy behave like a pandas
+        SeriesGroupBy.
+
+    Examples
+    --------
+    >>> ida_iris.groupby("species").agg(["mean", "max"])
+    >>> ida_iris.groupby("species")["sepal_length"].mean()
+    >>> ida_iris.groupby("species").size()
+    """
+    def __init__(self, idadf, by, subtotals=None, dropna=True,
+                 margins_name="All", selection=None):
+        if isinstance(by, six.string_types):
+            by = [by]
+        by = list(by)
+        if not by:
+            raise ValueError("No column to group by.")
+        for column in by:
+            if column not in idadf.columns:
+                raise KeyError(column)
+        if subtotals is not None and subtotals not in ("rollup", "cube"):
+            raise ValueError("Admissible values for subtotals argument are " +
+                             "'rollup' and 'cube'.")
+
+        if selection is None:
+            columns = [column for column in idadf.columns if column not in by]
+        else:
+            columns = [selection] if isinstance(selection, six.string_types) else list(selection)
+            for column in columns:
+                if column not in idadf.columns:
+                    raise KeyError(column)
+
+        self._idadf = idadf
+        self.keys = by
+        self.subtotals = subtotals
+        self.dropna = dropna
+        self.margins_name = margins_name
+        self._selection = selection
+        self._columns = columns
+
+    @property
+    def internal_state(self):
+        """
+        Internal state of the grouped IdaDataFrame, so that its current
+        state is available to the queries of self, see idadf_state.
+        """
+        return self._idadf.internal_state
+
+    def __getitem__(self, item):
+        """
+        Select the columns that are aggregated, a str selects a single column
+        and makes the aggregations return Series.
+        """
+        return IdaGroupBy(self._idadf, self.keys, self.subtotals, self.dropna,
+                          self.margins_name, selection=item)
+
+    def __repr__(self):
+        return "<IdaGroupBy of %s by %s>"%(self._idadf.name, ", ".join(self.keys))
+
+    ###########################################################################
+    ### Aggregations
+    ###########################################################################
+
+    def agg(self, func, chunksize=None):
+        """
+        Aggregate the groups with one or several statistics, all of them
+        being computed in a single scan of the data.
+
+        Parameters
+        ----------
+        func : str, list of str or dict
+            Statistics to be computed, as in IdaDataFrame.agg: "count",
+            "nulls", "mean", "std", "var", "min", "max", "sum", "levels",
+            or numbers between 0 and 1 for percentiles. A dict maps the
+            aggregated columns to the statistics to be computed on them.
+            Statistics other than count, nulls, min, max and levels are only
+            computed on numerical columns, unless given in a dict.
+        chunksize : int, optional
+            If given, the groups are retrieved as an iterator over
+            DataFrames of at most chunksize groups, which avoids holding a
+            large result in memory at once.
+
+        Returns
+        -------
+        DataFrame or Series, or an iterator over them
+            Indexed by the values of the columns in by. The columns are the
+            aggregated columns for a single statistic, the pairs of the
+            aggregated columns and of the statistics otherwise, like in
+            pandas. Series are returned if a single column is selected.
+        """
+        if isinstance(func, dict):
+            requested = OrderedDict()
+            for column, stats in func.items():
+                if column not in self._idadf.columns:
+                    raise KeyError(column)
+                requested[column] = [stats] if isinstance(stats, six.string_types) else list(stats)
+            flat = all(isinstance(stats, six.string_types) for stats in func.values())
+        else:
+            stats = [func] if isinstance(func, six.string_types) else list(func)
+            columns = self._columns
+            if not set(stats) <= set(_ANY_TYPE_AGGREGATES):
+                numerical = set(self._idadf._get_numerical_columns())
+                columns = [column for column in columns if column in numerical]
+            requested = OrderedDict((column, stats) for column in columns)
+            flat = isinstance(func, six.string_types)
+
+        if not any(requested.values()):
+            raise TypeError("No column to aggregate with %s."%(func,))
+
+        labels = []
+        expressions = []
+        for column, stats in requested.items():
+            for stat in stats:
+                labels.append(column if flat else (column, stat))
+                expressions.append(_aggregate_expression(stat, column))
+
+        series = isinstance(self._selection, six.string_types) and not isinstance(func, dict)
+        if series:
+            name = labels[0] if flat else None
+            labels = [labels[0]] if flat else [stat for _, stat in labels]
+        elif not flat:
+            labels = pd.MultiIndex.from_tuples(labels)
+
+        def _format(data):
+            result = self._format(data, labels)
+            if series and flat:
+                result = result[labels[0]]
+                result.name = name
+            return result
+
+        return self._query(expressions, _format, chunksize)
+
+    aggregate = agg
+
+    def count(self):
+        """Count the non-missing values of each column in each group."""
+        return self.agg("count")
+
+    def sum(self):
+        """Compute the sum of each numerical column in each group."""
+        return self.agg("sum")
+
+    def mean(self):
+        """Compute the mean of each numerical column in each group."""
+        return self.agg("mean")
+
+    def std(self):
+        """Compute the sample standard deviation of each numerical column in each group."""
+        return self.agg("std")
+
+    def var(self):
+        """Compute the sample variance of each numerical column in each group."""
+        return self.agg("var")
+
+    def min(self):
+        """Compute the minimum of each column in each group."""
+        return self.agg("min")
+
+    def max(self):
+        """Compute the maximum of each column in each group."""
+        return self.agg("max")
+
+    def size(self, chunksize=None):
+        """
+        Count the rows of each group.
+
+        Parameters
+        ----------
+        chunksize : int, optional
+            If given, the counts are retrieved as an iterator over Series
+            of at most chunksize groups.
+
+        Returns
+        -------
+        Series, or an iterator over Series
+            Indexed by the values of the columns in by.
+        """
+        def _format(data):
+            result = self._format(data, ["size"])["size"]
+            result.name = None
+            return result
+        return self._query(["COUNT(*)"], _format, chunksize)
+
+    ###########################################################################
+    ### Window variants
+    ###########################################################################
+
+    def transform(self, func):
+        """
+        Compute a statistic over the group of each row, without grouping the
+        rows. The statistic is computed by a window function partitioned by
+        the columns in by, when the result gets evaluated.
+
+        Parameters
+        ----------
+        func : str
+            "count", "mean", "std", "var", "min", "max" or "sum". Statistics
+            other than count, min and max are only computed on numerical
+            columns.
+
+        Returns
+        -------
+        IdaDataFrame or IdaSeries
+            Same rows as the grouped IdaDataFrame, with the aggregated columns,
+            an IdaSeries if a single column is selected. If dropna is True,
+            the rows with missing values in the columns in by get missing
+            values.
+
+        Examples
+        --------
+        >>> ida_iris["centered"] = (ida_iris["sepal_length"] -
+        ...     ida_iris.groupby("species")["sepal_length"].transform("mean"))
+        """
+        if func not in _WINDOW_AGGREGATES:
+            raise ValueError("Admissible values for func argument are %s."
+                             %", ".join(_WINDOW_AGGREGATES))
+        if self.subtotals is not None:
+            raise ValueError("transform does not support subtotals.")
+
+        columns = self._columns
+        if func not in _ANY_TYPE_AGGREGATES:
+            numerical = set(self._idadf._get_numerical_columns())
+            columns = [column for column in columns if column in numerical]
+
+        columndict = self._idadf.internal_state.columndict
+        partition = ", ".join(columndict[key] for key in self.keys)
+        missing = " OR ".join("%s IS NULL"%columndict[key] for key in self.keys)
+        newColumndict = OrderedDict()
+        for column in columns:
+            expression = ("%s OVER (PARTITION BY %s)"
+                          %(_AGGREGATES[func]%columndict[column], partition))
+            if self.dropna:
+                # Rows left out of the groups get missing values, as in pandas
+                expression = "CASE WHEN %s THEN NULL ELSE %s END"%(missing, expression)
+            newColumndict[column] = expression
+
+        if isinstance(self._selection, six.string_types):
+            newidadf = self._idadf._clone_as_serie(self._selection)
+        else:
+            newidadf = self._idadf._clone()
+        newidadf._reset_attributes(["columns", "shape", "dtypes"])
+        newidadf.internal_state.columns = ["\"%s\""%col for col in newColumndict]
+        newidadf.internal_state.columndict = newColumndict
+        newidadf.internal_state.update()
+        return newidadf
+
+    ###########################################################################
+    ### Private
+    ###########################################################################
+
+    @idadf_state
+    def _query(self, expressions, formatter, chunksize=None):
+        """
+        Evaluate aggregate expressions over each group with a single
+        GROUP BY query, and format the result with formatter, or each chunk
+        of it if chunksize is given.
+        """
+        keys = ", ".join(plan.quote(key) for key in self.keys)
+        items = [keys]
+        grouping = keys
+        if self.subtotals is not None:
+            items += ["GROUPING(%s)"%plan.quote(key) for key in self.keys]
+            grouping = "%s(%s)"%(self.subtotals.upper(), keys)
+        items += list(expressions)
+
+        query = "SELECT %s FROM %s"%(", ".join(items), self.internal_state.current_state)
+        if self.dropna:
+            query += " WHERE " + " AND ".join("%s IS NOT NULL"%plan.quote(key)
+                                              for key in self.keys)
+        query += " GROUP BY %s ORDER BY %s"%(grouping, keys)
+
+        if chunksize is None:
+            return formatter(self._idadf.ida_query(query))
+        chunks = self._idadf._idadb.ida_query(query, chunksize=chunksize)
+        return (formatter(chunk) for chunk in chunks)
+
+    def _format(self, data, labels):
+        """
+        Make a DataFrame indexed by the values of the columns in by from
+        the result of _query, whose columns get labels.
+        """
+        if isinstance(data, pd.Series):
+            data = data.to_frame()
+        nkeys = len(self.keys)
+        arrays = [list(data.iloc[:, position]) for position in range(nkeys)]
+        offset = nkeys
+        if self.subtotals is not None:
+            for position in range(nkeys):
+                flags = data.iloc[:, nkeys + position]
+                arrays[position] = [self.margins_name if flag else value
+                                    for value, flag in zip(arrays[position], flags)]
+            offset += nkeys
+
+        if nkeys == 1:
+            index = pd.Index(arrays[0], name=self.keys[0])
+        else:
+            index = pd.MultiIndex.from_arrays(arrays, names=self.keys)
+        result = data.iloc[:, offset:].copy()
+        result.index = index
+        result.columns = labels
+        return result
@@ -26,52 +26,117 @@ standard_library.install_aliases()
 from functools import wraps, partial
 from numbers import Number
 from collections import OrderedDict
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
 
-from lazy import lazy
+import pandas as pd
 import six
 
 import ibmdbpy
-
-from copy import deepcopy
+from ibmdbpy import plan
 
 def idadf_state(function=None, force=False):
     """
-    View management for IdaDataFrame.
-    This decorator creates the view reflecting the current state of an
-    IdaDataFrame, so that the operation it decorates can work on this "virtual"
-    version.
+    State management for IdaDataFrame.
+    This decorator makes the current state of an IdaDataFrame available under
+    the name of the IdaDataFrame, so that the operation it decorates can work
+    on this "virtual" version. The state is registered in the IdaDataBase as
+    a common table expression, which gets defined in the queries that refer
+    to it. If force is True, a view is created in the database instead, for
+    operations that need a physical object, such as stored procedures or
+    catalog lookups.
     """
     if function is None:
         return partial(idadf_state, force=force)
     @wraps(function)
     def wrapper(self, *args, **kwds):
-        # Note: 5 is arbitrary. Maybe not the most relevant threshold
-        # Means that not view should be created if the idadataframe was 
-        # not modified at least 5 times. 
-        if (len(self.internal_state.views) < 5)&(force is False): 
-            # Here, avoid creating a view but putting in the stack the string
-            # that corresponds to the state of the idadataframe
-            if self.internal_state.views:
-                self.internal_state.viewstack.append("(" + self.internal_state.get_state() + ")")
+        if not self.internal_state.views:
+            return function(self, *args, **kwds)
+        if force is False:
+            self.internal_state._push_state()
             try:
-                result = function(self, *args, **kwds)
-            except:
-                raise
+                return function(self, *args, **kwds)
             finally:
-                if self.internal_state.views:
-                    if self.internal_state.viewstack:
-                        self.internal_state.viewstack.pop()
+                self.internal_state._pop_state()
         else:
             self.internal_state._create_view()
             try:
-                result = function(self, *args, **kwds)
-            except:
-                raise
+                return function(self, *args, **kwds)
             finally:
                 self.internal_state._delete_view()
-        return result
     return wrapper
 
+class ColumnMap(MutableMapping):
+    """
+    Ordered mapping of column names to their expressions, which shares its
+    content with its copies until one of them gets modified. Copying a
+    ColumnMap is thus O(1), whatever the number of columns.
+
+    As in Python 2, keys, values and items return lists, so that the mapping
+    can be modified while iterating on them.
+    """
+    def __init__(self, items=()):
+        self._data = OrderedDict(items)
+        self._shared = False
+
+    def copy(self):
+        """
+        Returns a copy of self, which shares its content until one of them
+        gets modified.
+        """
+        new = ColumnMap.__new__(ColumnMap)
+        new._data = self._data
+        new._shared = self._shared = True
+        return new
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        # Keys and values are strings, there is nothing more to copy
+        return self.copy()
+
+    def _own(self):
+        """
+        Makes sure that the content of self is not shared before modifying it.
+        """
+        if self._shared:
+            self._data = OrderedDict(self._data)
+            self._shared = False
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        self._own()
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        self._own()
+        del self._data[key]
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(list(self._data))
+
+    def __len__(self):
+        return len(self._data)
+
+    def keys(self):
+        return list(self._data.keys())
+
+    def values(self):
+        return list(self._data.values())
+
+    def items(self):
+        return list(self._data.items())
+
+    def __repr__(self):
+        return "ColumnMap(%r)"%self.items()
+
 class InternalState(object):
     """
     Records and maintains an internal state of an IdaDataFrame.
@@ -96,27 +161,33 @@ class InternalState(object):
             In database Name of the idaobject its belongs to.
         ascending : bool, default: True
             Indicate if the dataframe should be sorted in ascending or descending order.
-        columns: str, default: '*'
-            Columns that are selected in the IdaDataFrame, the order determine
-            the order they are displayed too. Follow this model : ""Col1", "Col2", "Col3"".
-        order: str, default: ''
-            "Order by" part of a corresponding SQL query. Follow this model :
-            " ORDER BY "Col1", "Col2", "Col3" ASC".
-        _views : list of str
-            List of nested SQL queries that describe the state of the
-            IdaDataFrame. String that are stored  in this list may not be
-            modified.
-        _cumulative : str
-            Cumulative represent the most current nested SQL queries. The main
-            different with those in _views is that cumulative may still be
-            modified. When the state of the IdaDataFrame is modified in the way
-            that it is not possible to modify cumulative without violating the
-            order the operation where may, the cumulative function is stored
-            in _views, and a new cumulative gets created.
+        columndict: OrderedDict
+            Columns that are selected in the IdaDataFrame and their
+            expressions in terms of the columns of plan, the order determine
+            the order they are displayed too.
+        order: list of str, default: None
+            Columns by which the IdaDataFrame is being sorted.
+        plan : ibmdbpy.plan.Node
+            Logical plan that describes the state of the IdaDataFrame, up to
+            the selection of columns in columndict. Plans are immutable, so
+            that they can be shared between IdaDataFrames.
+        _cumulating : bool
+            True if columndict was modified since the last operation that was
+            recorded in plan. Selections of columns are accumulated in
+            columndict until an operation that can not be reordered with them,
+            such as a filter, a sort or a selection of rows, is recorded.
         viewstack : list of str
-            Stack of view names that are created dynamically. Used to memorize
-            the name of the temporary views so that they can get  deleted when
-            the operation is finished.
+            Stack of the names under which the state is available, either
+            registered states or temporary views, for the operations in
+            progress.
+        _table_info : dict
+            Information about the table, shared by all the states derived
+            from the same IdaDataFrame, such as the types of its columns
+            under the key "types".
+        physical_views : list of str
+            Temporary views that were created in the database and not deleted
+            yet, so that they can be dropped if the IdaDataFrame goes out of
+            scope.
         """
         self._idadf = idadf
         self.name = idadf._name
@@ -125,19 +196,60 @@ class InternalState(object):
         self.index = None
         self.order = None
 
-        self._views = []
-        self._cumulative = []
+        self.plan = plan.Scan()
+        self._cumulating = False
+        self._columndict = None
+        self._table_info = {}
         self.viewstack = []
+        self.physical_views = []
+
+    def _fork(self, idadf):
+        """
+        Returns a copy of self for idadf, a clone of the IdaDataFrame self
+        relates to. The plan and the columns are shared with the copy, so
+        that forking is O(1) whatever the number of columns.
+        """
+        state = InternalState(idadf)
+        state.name = self.name
+        state.ascending = self.ascending
+        if self.order is not None:
+            state.order = list(self.order)
+        state.plan = self.plan
+        state._cumulating = self._cumulating
+        state._table_info = self._table_info
+        if self._columndict is not None:
+            state._columndict = self._columndict.copy()
+        return state
 
-    @lazy
+    @property
     def columndict(self):
         """
         Returns an ordered dictionnary that contains available columns as keys
         and their "real" expression as values, exactly in the way they should
         appear in modified SQL queries for creating views.
         """
+        if self._columndict is None:
+            self._columndict = self._default_columndict()
+        return self._columndict
+
+    @columndict.setter
+    def columndict(self, columndict):
+        if not isinstance(columndict, ColumnMap):
+            columndict = ColumnMap(columndict.items())
+        self._columndict = columndict
+
+    @columndict.deleter
+    def columndict(self):
+        if self._columndict is None:
+            raise AttributeError("columndict")
+        self._columndict = None
+
+    def _default_columndict(self):
+        """
+        Returns the columndict of an IdaDataFrame that was not modified.
+        """
         #return OrderedDict((cols,"\""+cols+"\"") for cols in self._idadf.columns)
-        columns = deepcopy(OrderedDict((cols,"\""+cols+"\"") for cols in self._idadf.columns))
+        columns = ColumnMap((cols,"\""+cols+"\"") for cols in self._idadf.columns)
         
         #Remove the quotation marks enclosing DB2GSE functions
         #ibmdbpy stores and keeps track of columns internally enclosing them
@@ -164,22 +276,47 @@ class InternalState(object):
     @property
     def views(self):
         """
-        Returns the set of all views, including the cumulating view.
+        Returns the list of all operations recorded in the plan, including
+        the selection of columns that is cumulating. Selections of columns
+        that were recorded below another operation are merged with it.
         """
-        return self._views + self._cumulative
+        lineage = plan.lineage(self.plan)
+        nodes = [node for node in lineage[:-1] if not isinstance(node, plan.Project)]
+        nodes.extend(lineage[-1:])
+        if self._cumulating:
+            nodes.append(self._projection())
+        return nodes
 
     @property
     def current_state(self):
         """
-        If some temporary view have been created, i.e. the InternalState was
-        modified and viewstack in not empty, returns the name of the last
-        created view, otherwise returns the name of the table.
+        Returns the name under which the state is available for the operation
+        in progress, if any. Otherwise, returns the state as a subquery if the
+        InternalState was modified, or the name of the table.
         """
         if self.viewstack:
             return self.viewstack[-1]
+        elif self.views:
+            return "(" + self.get_state() + ")"
         else:
             return self.name
 
+    def _push_state(self):
+        """
+        Registers the current state in the IdaDataBase and makes it
+        available under the name it gets.
+        """
+        name = self._idadf._idadb._register_state(self.get_state())
+        self.viewstack.append(name)
+        return name
+
+    def _pop_state(self):
+        """
+        Unregisters the state registered by the last call to _push_state.
+        """
+        if self.viewstack:
+            self._idadf._idadb._unregister_state(self.viewstack.pop())
+
     def _create_view(self, viewname = None):
         """
         Creates a view that represent the current state of the idea dataframe
@@ -200,6 +337,7 @@ class InternalState(object):
         query = "CREATE VIEW \"%s\" AS (%s)"%(view, self.get_state())
         self._idadf._prepare_and_execute(query, autocommit = True)
         self.viewstack.append(view)
+        self.physical_views.append(view)
         return
 
     def _delete_view(self, viewname = None):
@@ -215,10 +353,12 @@ class InternalState(object):
         if viewname:
             view = viewname
         else:
-            if self.viewstack:
+            if self.viewstack and self.viewstack[-1] in self.physical_views:
                 view = self.viewstack.pop()
             else:
                 return
+        if view in self.physical_views:
+            self.physical_views.remove(view)
         query = "DROP VIEW \"" + view + "\""
         self._idadf._prepare_and_execute(query, autocommit = True)
         return
@@ -226,48 +366,67 @@ class InternalState(object):
     def __del__(self):
         """
         Overriding the destructor for InternalState object.
-        Making sure all the views in the stack are deleted before deleting self.
+        Making sure all the temporary views are deleted before deleting self.
         """
-        if self.viewstack:
-            while self.viewstack:
-                self._delete_view(self.viewstack.pop())
+        while self.physical_views:
+            self._delete_view(self.physical_views[-1])
+
+    def _projection(self):
+        """
+        Returns the plan node that selects the columns in columndict.
+        """
+        return plan.Project(self.plan, self.columndict.items())
+
+    def _pending(self):
+        """
+        Returns the plan including the selection of columns that is
+        cumulating, if any.
+        """
+        if self._cumulating:
+            return self._projection()
+        return self.plan
+
+    def _reset_columns(self, names=None):
+        """
+        Makes columndict refer to the columns produced by plan, under the
+        same names. This has to be done each time the columns expressions
+        get recorded in plan, otherwise they would be applied twice.
+        """
+        if names is None:
+            names = list(self.columndict.keys())
+        self.columndict = ColumnMap((name, plan.quote(name)) for name in names)
+        self._cumulating = False
 
     def update(self, filter_query=None):
         """
-        Update _views and/or _cumulative with an SQL select expression that
-        corresponds to the lastest modification of the internal state.
-        Determines automatically if it is enough to replace _cumulative
-        or to store it in _views and create a new _cumulative view.
-        The situation, in which we should stop cumulating are :
-        Filter, order, selection (of rows)
+        Record the lastest modification of the internal state in the plan.
+        Selections of columns are cumulated in columndict, while filters,
+        orders and selections of rows become new nodes of the plan, on top
+        of the selection of columns cumulated so far.
         """
         if isinstance(filter_query, ibmdbpy.filtering.FilterQuery):
-            query = filter_query.query
-            #self.stop_cumulating_columns() # not sure ?
-            self._views = self._views + self._cumulative
-            self._cumulative = []
-            self._views.append(query)
+            self.plan = plan.Filter(self._pending(), filter_query.wherestr)
+            self._reset_columns()
         elif self.order is not None:
-            # Assumption : order is the only modification
-            query = "SELECT * FROM (SELECT * FROM %s"+self.get_order()+")"
+            self.plan = plan.Sort(self._pending(), self.order, self.ascending)
             self.order = None
-            #self.stop_cumulating_columns()
-            self._views = self._views + self._cumulative
-            self._cumulative = []
-            self._views.append(query)
+            self._reset_columns()
         else:
             if self.index is None:
-                query = ("SELECT " + self.get_columns() + " FROM %s")
-                self._cumulative = [query]
+                self._cumulating = True
             else:
+                positions = None
                 if isinstance(self.index, Number):
                     indexstring = " = " + str(self.index)
+                    if self.index == int(self.index):
+                        positions = [int(self.index)]
                 elif isinstance(self.index, six.string_types):
-                    if "'" in self.index:
-                        self.index = self.index.replace("'", "\'")
-                    indexstring = " = '" + str(self.index) + "'"
+                    indexstring = " = '" + self.index.replace("'", "''") + "'"
                 elif isinstance(self.index, list):
                     indexstring = " in (" + str(self.index)[1:-1] + ")" #[1:-1] to strip the brackets
+                    if all(isinstance(value, Number) and value == int(value)
+                           for value in self.index):
+                        positions = [int(value) for value in self.index]
                 elif isinstance(self.index, slice):
                     start = self.index.start
                     if not start:
@@ -280,48 +439,93 @@ class InternalState(object):
                         # This would prevent SQL overflow for big datasets
                         indexlist = list(range(start, stop)[start:stop:self.index.step])
                         indexstring = " in (" + str(indexlist)[1:-1] + ")"
+                        positions = indexlist
                     else:
                         indexstring = " BETWEEN " + str(start) + " AND " + str(stop)
+                        positions = range(start, stop + 1)
 
-                columns = self.get_columns()
-                #columns = self._idadf._get_columns()
-                
-                #columns = "\"" + "\",\"".join(set(self._idadf._get_columns())|set(self._idadf.columns)) + "\"" # TODO: Check if it is good
-                #if columns == "*":
-                    #columns = "\"" + "\",\"".join(self._idadf.columns) + "\""
-
+                names = list(self.columndict.keys())
+                selection = self._projection()
                 if self._idadf.indexer:
-                    query = ("SELECT " + columns + " FROM %s "+ "WHERE " +
-                             self._idadf.indexer + indexstring)
+                    self.plan = plan.Filter(selection,
+                                            plan.quote(self._idadf.indexer) + indexstring)
                 else:
-                    query = ("SELECT " + columns + " FROM (SELECT TEMP.*, "+
-                            "(ROWNUMBER() OVER()-1) AS RN FROM %s AS TEMP) "+
-                            "WHERE RN " + indexstring)
+                    numbered = plan.Filter(plan.RowNumber(selection, "RN"),
+                                           "\"RN\"" + indexstring, positions)
+                    self.plan = plan.Project(numbered,
+                                             [(name, plan.quote(name)) for name in names])
                 self.index = None
+                self._reset_columns(names)
 
-                #self.stop_cumulating_columns()
-                self._views = self._views + self._cumulative
-                self._cumulative = []
-                self._views.append(query)
+    def _infer_dtypes(self):
+        """
+        Infers the database types of the columns in the current state from
+        the plan and the types of the columns of the table, which are looked
+        up once for all the clones.
 
+        Returns
+        -------
+        DataFrame
+            In-Database type for each columns, in the format of
+            IdaDataFrame.dtypes, or None if some type cannot be inferred.
+        """
+        if "types" not in self._table_info:
+            self._table_info["types"] = self._idadf._get_table_dtypes()
+        types = plan.output_types(self._pending(), self._table_info["types"])
+        if None in types.values():
+            return None
+        return pd.DataFrame({"TYPENAME": list(types.values())},
+                            index=list(types.keys()))
+
+    def _forget_rows(self):
+        """
+        Forgets what is known about the rows of the table, after some were
+        inserted.
+        """
+        for key in ("rows", "moments"):
+            self._table_info.pop(key, None)
+
+    def _count_rows(self):
+        """
+        Returns the number of rows in the current state if it can be proven
+        from the plan and the number of rows in the table, which is counted
+        once for all the clones when it is needed, or read from the catalog
+        statistics if the IdaDataBase uses them.
+
+        Returns
+        -------
+        int
+            Number of rows, or None if the rows of the current state have to
+            be counted.
+        """
+        node = self._pending()
+        rows, bound = plan.cardinality(node, self._table_info.get("rows"))
+        if rows is None and bound != 0 and "rows" not in self._table_info:
+            # Count the table only when it determines the number of rows,
+            # that is when no filter stands between the table and the state
+            if plan.cardinality(node, 1)[0] is not None:
+                statistics = ibmdbpy.statistics
+                if statistics._use_catalog_statistics(self._idadf):
+                    # Not cached, as it is an estimate
+                    table_rows = statistics._catalog_table_cardinality(self._idadf)
+                    if table_rows is not None:
+                        return plan.cardinality(node, table_rows)[0]
+                self._table_info["rows"] = self._idadf.ida_scalar_query(
+                    "SELECT CAST(COUNT(*) AS INTEGER) FROM %s"%self.name)
+                rows = plan.cardinality(node, self._table_info["rows"])[0]
+        if rows is None and bound == 0:
+            rows = 0
+        return rows
 
     def get_state(self):
         """
         Returns the sql query corresponding to the current state of the
-        IdaDataFrame. The query is created by nesting of all strings in views
-        (which is the concatenation of _views and _cumulative).
+        IdaDataFrame. The query is rendered from the plan, merging nested
+        SELECT statements whenever possible.
         """
         if not self.views:
             return ("SELECT " + self.get_columns() + " FROM " + self.name)
-
-        query = "%s"
-        for index, view in enumerate(self.views[::-1]):
-            if index == (len(self.views)-1):
-                view = view % self.name
-            if index != 0:
-                view = "(" + view + ")"
-            query = query %(view)
-        return query
+        return plan.render(self._pending(), self.name)
 
     def get_columns(self):
         """
@@ -369,7 +573,7 @@ class InternalState(object):
             1 : The InternalState has default values
             0 : The InternalState is modifed
         """
-        return self.get_state() == InternalState(self.name).get_state()
+        return not self.views
 
     def set_order(self, order, ascending):
         """
@@ -380,58 +584,16 @@ class InternalState(object):
 
     def reset_order(self):
         """
-        Resets the state to original order. Delete all views that have an ORDER
-        clause. Based on the assumption that ORDER is the only modification
-        of those queries.
+        Resets the state to original order, by removing all sorts from the
+        plan.
         """
-        # This is based on the assumption than no other modifications than
-        # sorting was done when sorting the idadf
-        self._views = [view for view in self._views if "ORDER BY" not in view]
+        self.plan = plan.without_sort(self.plan)
 
     def stop_cumulating_columns(self):
-        # TODO: do not use anymore ??
-        # You actually don't want to use column that you have not selected anymore ? 
-        # except if you want to sum maybe ...
-        """
-        Management of views to ensure that some specific operations such as
-        Filter, order, selection are registred in the list of views so that
-        the real order of operation is respected.
-        Here is what the function does:
-        If _cumulative is not None,
-        then the _cumulative is augmented with all available columns in the
-        database, if any and then appended in _views.
-        _cumulative is then reset to new query that only select the columns
-        that were selected on that point. This is made so, because it allows
-        users to still use all available columns in the table, even if they are
-        not selected in the current state.
-        """
-        # TODO: Improve documentation for this method (experimental)
-
-        # Add all columns available originally in the table in the history
-        if self._cumulative:
-            all_columns = self._idadf._get_all_columns_in_table()
-            deleted_columns = []
-            for column in all_columns:
-                if column not in list(self.columndict.keys()):
-                    deleted_columns.append(column)
-
-            if deleted_columns:
-                for column in deleted_columns:
-                     self.columndict[column] = ("\""+column+"\"")
-                self._cumulative = ["SELECT " + self.get_columns() + " FROM %s"]
-
-            self._views = self._views + self._cumulative
-            self._cumulative = []
-
-            # Select only the columns that were available in the representation
-            # Those 2 steps are made so to enable users to still use columns
-            # that were not selected anymore in the current table representation
-            # but still existing in the idadataframe
-
-            if deleted_columns:
-                for column in deleted_columns:
-                    del self.columndict[column]
-                self.columndict = OrderedDict((cols,"\""+cols+"\"") for cols in self.columndict)
-                self._cumulative = ["SELECT " + self.get_columns() + " FROM %s"]
-            else:
-                self.columndict = OrderedDict((cols,"\""+cols+"\"") for cols in self.columndict)
+        """
+        Records the selection of columns that is cumulating in the plan, so
+        that the next operations apply on top of it.
+        """
+        if self._cumulating:
+            self.plan = self._projection()
+            self._reset_columns()
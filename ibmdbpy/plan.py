@@ -0,0 +1,809 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------
+# Copyright (c) 2015, IBM Corp.
+# All rights reserved.
+#
+# Distributed under the terms of the BSD Simplified License.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#-----------------------------------------------------------------------------
+
+"""
+Logical query plans describing the state of IdaDataFrames.
+
+The state of an IdaDataFrame is a tree of immutable nodes (Scan, Project,
+Filter, Sort, Limit, RowNumber) rooted in the table it was opened on. The
+tree is rendered as a single SQL query, merging nested SELECT statements
+whenever this does not change the result: adjacent projections are merged,
+filters are pushed below projections and columns that are not used by an
+outer query are pruned from inner ones.
+
+Column expressions and filtering conditions refer to the columns of the
+child node by their double quoted names, for example "(\\"A\\" + 1)".
+"""
+
+# Python 2 compatibility
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from builtins import object
+from builtins import range
+from future import standard_library
+standard_library.install_aliases()
+
+import re
+from collections import OrderedDict
+
+#-----------------------------------------------------------------------------
+# Nodes
+
+class Node(object):
+    """
+    Base class of the nodes of a plan. Nodes are immutable, so that plans
+    can be shared between IdaDataFrames.
+    """
+    __slots__ = ("child",)
+
+    def __init__(self, child):
+        object.__setattr__(self, "child", child)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Plan nodes are immutable")
+
+    def _replace(self, **changes):
+        """
+        Return a copy of self in which some attributes are replaced.
+        """
+        node = object.__new__(type(self))
+        for slot in self._all_slots():
+            object.__setattr__(node, slot, changes.get(slot, getattr(self, slot)))
+        return node
+
+    @classmethod
+    def _all_slots(cls):
+        slots = []
+        for klass in reversed(cls.__mro__):
+            slots.extend(getattr(klass, "__slots__", ()))
+        return slots
+
+    def __repr__(self):
+        fields = ", ".join("%s=%r"%(slot, getattr(self, slot))
+                           for slot in self._all_slots() if slot != "child")
+        return "%s(%s)"%(type(self).__name__, fields)
+
+class Scan(Node):
+    """
+    Leaf of every plan: all columns of the table the IdaDataFrame was opened
+    on. The name of the table is given when the plan is rendered.
+    """
+    __slots__ = ()
+
+    def __init__(self):
+        super(Scan, self).__init__(None)
+
+class Project(Node):
+    """
+    Selection and computation of columns. columns is a tuple of
+    (name, expression) pairs.
+    """
+    __slots__ = ("columns",)
+
+    def __init__(self, child, columns):
+        super(Project, self).__init__(child)
+        object.__setattr__(self, "columns", tuple((name, expr) for name, expr in columns))
+
+class Filter(Node):
+    """
+    Selection of the rows for which condition holds. When the condition
+    selects rows by their position in the child, positions is a range or a
+    frozenset of these positions, so that the number of selected rows can
+    be known without running the query.
+    """
+    __slots__ = ("condition", "positions")
+
+    def __init__(self, child, condition, positions=None):
+        super(Filter, self).__init__(child)
+        object.__setattr__(self, "condition", condition)
+        if positions is not None and not isinstance(positions, range):
+            positions = frozenset(positions)
+        object.__setattr__(self, "positions", positions)
+
+class Sort(Node):
+    """
+    Ordering of the rows by the columns in keys.
+    """
+    __slots__ = ("keys", "ascending")
+
+    def __init__(self, child, keys, ascending=True):
+        super(Sort, self).__init__(child)
+        object.__setattr__(self, "keys", tuple(keys))
+        object.__setattr__(self, "ascending", bool(ascending))
+
+class Limit(Node):
+    """
+    Selection of the count first rows.
+    """
+    __slots__ = ("count",)
+
+    def __init__(self, child, count):
+        super(Limit, self).__init__(child)
+        object.__setattr__(self, "count", int(count))
+
+class RowNumber(Node):
+    """
+    Addition of a column containing the position of each row, starting from
+    0. Rows are numbered following keys if given, following the order of the
+    child otherwise.
+    """
+    __slots__ = ("name", "keys", "ascending")
+
+    def __init__(self, child, name="RN", keys=None, ascending=True):
+        super(RowNumber, self).__init__(child)
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "keys", tuple(keys) if keys else None)
+        object.__setattr__(self, "ascending", bool(ascending))
+
+def lineage(node):
+    """
+    Return the nodes of a plan from the closest to the Scan to node, the
+    Scan excluded.
+    """
+    nodes = []
+    while node is not None and not isinstance(node, Scan):
+        nodes.append(node)
+        node = node.child
+    return nodes[::-1]
+
+def without_sort(node):
+    """
+    Return a plan in which all Sort nodes are removed.
+    """
+    if node is None or isinstance(node, Scan):
+        return node
+    child = without_sort(node.child)
+    if isinstance(node, Sort):
+        return child
+    if child is node.child:
+        return node
+    return node._replace(child=child)
+
+def output_names(node):
+    """
+    Return the names of the columns of a plan, or None if they depend on the
+    columns of the table.
+    """
+    if node is None or isinstance(node, Scan):
+        return None
+    if isinstance(node, Project):
+        return [name for name, _ in node.columns]
+    names = output_names(node.child)
+    if isinstance(node, RowNumber) and names is not None:
+        names = names + [node.name]
+    return names
+
+#-----------------------------------------------------------------------------
+# Expressions
+
+_WINDOW = re.compile(r"\bOVER\s*\(", re.IGNORECASE)
+
+def tokenize(expr):
+    """
+    Split an SQL expression into a list of (kind, text) tokens, where kind is
+    "name" for double quoted identifiers, whose text is the unquoted name,
+    "string" for single quoted literals and "sql" for anything else.
+    """
+    tokens = []
+    position = 0
+    start = 0
+    length = len(expr)
+    while position < length:
+        char = expr[position]
+        if char in ("'", '"'):
+            if position > start:
+                tokens.append(("sql", expr[start:position]))
+            end = position + 1
+            while end < length:
+                if expr[end] == char:
+                    if end + 1 < length and expr[end + 1] == char:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            text = expr[position:end + 1]
+            if char == '"':
+                tokens.append(("name", text[1:-1].replace('""', '"')))
+            else:
+                tokens.append(("string", text))
+            position = start = end + 1
+        else:
+            position += 1
+    if start < length:
+        tokens.append(("sql", expr[start:]))
+    return tokens
+
+def quote(name):
+    """
+    Return name as a double quoted SQL identifier.
+    """
+    return '"%s"'%name.replace('"', '""')
+
+def references(expr):
+    """
+    Return the set of column names an expression refers to.
+    """
+    return set(text for kind, text in tokenize(expr) if kind == "name")
+
+def is_windowed(expr):
+    """
+    Return True if an expression contains a window function.
+    """
+    return any(kind == "sql" and _WINDOW.search(text)
+               for kind, text in tokenize(expr))
+
+def substitute(expr, mapping):
+    """
+    Replace the columns an expression refers to by their definition in
+    mapping. Columns that are not in mapping are left unchanged.
+    """
+    parts = []
+    for kind, text in tokenize(expr):
+        if kind == "name":
+            if text in mapping:
+                parts.append(_atomic(mapping[text]))
+            else:
+                parts.append(quote(text))
+        else:
+            parts.append(text)
+    return "".join(parts)
+
+def _atomic(expr):
+    """
+    Wrap an expression in parentheses unless it is a single identifier or is
+    already wrapped.
+    """
+    tokens = tokenize(expr.strip())
+    if len(tokens) == 1 and tokens[0][0] in ("name", "string"):
+        return expr.strip()
+    stripped = expr.strip()
+    if stripped.startswith("(") and _closing_parenthesis(stripped) == len(stripped) - 1:
+        return stripped
+    return "(%s)"%stripped
+
+def _closing_parenthesis(expr):
+    """
+    Return the position of the parenthesis closing the one that opens expr.
+    """
+    depth = 0
+    position = 0
+    for kind, text in tokenize(expr):
+        if kind == "sql":
+            for offset, char in enumerate(text):
+                if char == "(":
+                    depth += 1
+                elif char == ")":
+                    depth -= 1
+                    if depth == 0:
+                        return position + offset
+            position += len(text)
+        elif kind == "name":
+            position += len(quote(text))
+        else:
+            position += len(text)
+    return -1
+
+def _order_clause(keys, ascending):
+    direction = " ASC" if ascending else " DESC"
+    return ", ".join(key + direction for key in keys)
+
+#-----------------------------------------------------------------------------
+# Rendering
+
+class _Block(object):
+    """
+    A single SELECT statement being built from a plan.
+
+    Attributes
+    ----------
+    star : bool
+        True if all columns of the source are selected, followed by items.
+    items : list of tuples
+        (name, expression) of the selected columns, expressions refer to the
+        columns of the source.
+    source : str or _Block
+        Table or nested SELECT statement the rows come from.
+    where : list of str
+        Conditions on the columns of the source.
+    order : str
+        ORDER BY clause, on the columns of the block.
+    order_names : set of str
+        Columns of the block the ORDER BY clause refers to.
+    limit : int
+        Maximum number of rows.
+    windowed : bool
+        True if items contain window functions.
+    """
+    def __init__(self, source):
+        self.star = True
+        self.items = []
+        self.source = source
+        self.where = []
+        self.order = None
+        self.order_names = set()
+        self.limit = None
+        self.windowed = False
+
+    def mapping(self):
+        """
+        Definition of the columns of the block, in terms of its source.
+        Columns selected with the star map to themselves and are omitted.
+        """
+        return dict(self.items)
+
+    def wrap(self, hoist=True):
+        """
+        Return a new block selecting all columns of self. If hoist is True,
+        the order of self is moved to the new block, where it is guaranteed
+        to hold, and kept in self only if it is needed by its limit.
+        """
+        block = _Block(self)
+        if hoist and self.order is not None:
+            block.order, block.order_names = self.order, self.order_names
+            if self.limit is None:
+                self.order, self.order_names = None, set()
+        return block
+
+def compile_plan(node, source):
+    """
+    Turn a plan into a tree of _Block objects, merging nodes into the same
+    SELECT statement whenever the result is the same.
+    """
+    if node is None or isinstance(node, Scan):
+        return _Block(source)
+
+    block = compile_plan(node.child, source)
+
+    if isinstance(node, Project):
+        windowed = any(is_windowed(expr) for _, expr in node.columns)
+        if block.order is not None and not all(
+                dict(node.columns).get(name) == quote(name) for name in block.order_names):
+            # The sort keys would be hidden or redefined by the projection
+            block = block.wrap(hoist=False)
+        elif windowed and block.limit is not None:
+            block = block.wrap()
+        mapping = block.mapping()
+        block.items = [(name, substitute(expr, mapping)) for name, expr in node.columns]
+        block.star = False
+        block.windowed = block.windowed or windowed
+        return block
+
+    if isinstance(node, Filter):
+        if block.limit is not None or block.windowed:
+            # Filtering before numbering or limiting the rows changes them
+            block = block.wrap()
+        block.where.append(substitute(node.condition, block.mapping()))
+        return block
+
+    if isinstance(node, Sort):
+        if block.limit is not None:
+            block = block.wrap()
+        block.order = _order_clause([quote(key) for key in node.keys], node.ascending)
+        block.order_names = set(node.keys)
+        return block
+
+    if isinstance(node, Limit):
+        block.limit = node.count if block.limit is None else min(block.limit, node.count)
+        return block
+
+    if isinstance(node, RowNumber):
+        if block.limit is not None or block.windowed:
+            block = block.wrap()
+        if node.keys:
+            keys, ascending = node.keys, node.ascending
+        elif block.order is not None:
+            keys, ascending = None, None
+        else:
+            keys, ascending = (), True
+        mapping = block.mapping()
+        if keys is None:
+            # Number the rows following the current order of the block
+            over = "ORDER BY " + substitute(block.order, mapping)
+        elif keys:
+            over = "ORDER BY " + _order_clause([_atomic(substitute(quote(key), mapping))
+                                                for key in keys], ascending)
+        else:
+            over = ""
+        if not block.star:
+            block.items = list(block.items)
+        block.items.append((node.name, "(ROW_NUMBER() OVER(%s)-1)"%over))
+        block.windowed = True
+        return block
+
+    raise TypeError("Unknown plan node: %s"%type(node).__name__)
+
+def _prune(block, required):
+    """
+    Remove the columns that are not required by the enclosing statement from
+    block and, recursively, from the statements it is built on. required is
+    None if all columns are required.
+    """
+    if required is not None:
+        required = set(required) | block.order_names
+        if not block.star:
+            kept = [item for item in block.items if item[0] in required]
+            block.items = kept or block.items[:1]
+        else:
+            block.items = [item for item in block.items if item[0] in required]
+
+    if not isinstance(block.source, _Block):
+        return
+
+    if block.star and required is None:
+        child_required = None
+    else:
+        child_required = set()
+        for _, expr in block.items:
+            child_required |= references(expr)
+        if block.star:
+            child_required |= set(required) - set(name for name, _ in block.items)
+    if child_required is not None:
+        for condition in block.where:
+            child_required |= references(condition)
+        if block.star:
+            child_required |= block.order_names
+    _prune(block.source, child_required)
+
+def _render_block(block):
+    items = []
+    for name, expr in block.items:
+        if expr == quote(name):
+            items.append(expr)
+        else:
+            items.append("%s AS %s"%(expr, quote(name)))
+    if isinstance(block.source, _Block):
+        source = "(" + _render_block(block.source) + ")"
+    else:
+        source = block.source
+    if block.star and items:
+        select = "TEMP.*, " + ", ".join(items)
+        source += " AS TEMP"
+    elif block.star:
+        select = "*"
+    else:
+        select = ", ".join(items)
+    query = "SELECT %s FROM %s"%(select, source)
+    if block.where:
+        query += " WHERE " + " AND ".join(block.where)
+    if block.order is not None:
+        query += " ORDER BY " + block.order
+    if block.limit is not None:
+        query += " FETCH FIRST %s ROWS ONLY"%block.limit
+    return query
+
+def render(node, source):
+    """
+    Render a plan as an SQL query.
+
+    Parameters
+    ----------
+    node : Node
+        Root of the plan.
+    source : str
+        Name of the table the Scan of the plan refers to.
+
+    Returns
+    -------
+    str
+        SELECT statement, as flat as possible.
+
+    Examples
+    --------
+    >>> node = Filter(Project(Scan(), [("A", '"A"'), ("B2", '("B" * 2)')]),
+    ...               '("B2" > 4)')
+    >>> render(node, "SCHEMA.TABLE")
+    'SELECT "A", ("B" * 2) AS "B2" FROM SCHEMA.TABLE WHERE (("B" * 2) > 4)'
+    """
+    block = compile_plan(node, source)
+    _prune(block, None)
+    return _render_block(block)
+
+#-----------------------------------------------------------------------------
+# Types
+
+# Data types as they are named in SYSCAT.COLUMNS
+_INTEGER_TYPES = ("SMALLINT", "INTEGER", "BIGINT")
+_NUMERIC_TYPES = _INTEGER_TYPES + ("DECIMAL", "REAL", "DOUBLE", "DECFLOAT")
+
+_TYPE_SYNONYMS = {"INT": "INTEGER", "DEC": "DECIMAL", "NUMERIC": "DECIMAL",
+                  "NUM": "DECIMAL", "FLOAT": "DOUBLE", "DOUBLE PRECISION": "DOUBLE",
+                  "CHAR": "CHARACTER", "CHAR VARYING": "VARCHAR",
+                  "CHARACTER VARYING": "VARCHAR"}
+
+# Result types of the DB2GSE functions used by IdaGeoSeries
+_DB2GSE_TYPES = {
+    "ST_AREA": "DOUBLE", "ST_LENGTH": "DOUBLE", "ST_PERIMETER": "DOUBLE",
+    "ST_X": "DOUBLE", "ST_Y": "DOUBLE", "ST_Z": "DOUBLE", "ST_M": "DOUBLE",
+    "ST_MINX": "DOUBLE", "ST_MINY": "DOUBLE", "ST_MINZ": "DOUBLE", "ST_MINM": "DOUBLE",
+    "ST_MAXX": "DOUBLE", "ST_MAXY": "DOUBLE", "ST_MAXZ": "DOUBLE", "ST_MAXM": "DOUBLE",
+    "ST_COORDDIM": "INTEGER", "ST_DIMENSION": "INTEGER", "ST_SRID": "INTEGER",
+    "ST_NUMGEOMETRIES": "INTEGER", "ST_NUMINTERIORRING": "INTEGER",
+    "ST_NUMLINESTRINGS": "INTEGER", "ST_NUMPOINTS": "INTEGER",
+    "ST_NUMPOLYGONS": "INTEGER", "ST_IS3D": "INTEGER", "ST_ISCLOSED": "INTEGER",
+    "ST_ISEMPTY": "INTEGER", "ST_ISMEASURED": "INTEGER", "ST_ISSIMPLE": "INTEGER",
+    "ST_ISVALID": "INTEGER", "ST_GEOMETRYTYPE": "VARCHAR", "ST_SRSNAME": "VARCHAR",
+    "ST_BOUNDARY": "ST_GEOMETRY", "ST_BUFFER": "ST_GEOMETRY",
+    "ST_CONVEXHULL": "ST_GEOMETRY", "ST_GENERALIZE": "ST_GEOMETRY",
+    "ST_MBR": "ST_GEOMETRY", "ST_ENVELOPE": "ST_POLYGON",
+    "ST_CENTROID": "ST_POINT", "ST_STARTPOINT": "ST_POINT",
+    "ST_ENDPOINT": "ST_POINT", "ST_MIDPOINT": "ST_POINT",
+    "ST_EXTERIORRING": "ST_LINESTRING"}
+
+_LEXEME = re.compile(r"\s*(?:(?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)|"
+                     r"(?P<word>[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*)|"
+                     r"(?P<symbol>\S))")
+
+def _lex(expr):
+    """
+    Split an SQL expression into a list of (kind, text) lexemes, where kind
+    is "name", "string", "number", "word" or "symbol".
+    """
+    lexemes = []
+    for kind, text in tokenize(expr):
+        if kind != "sql":
+            lexemes.append((kind, text))
+            continue
+        position = 0
+        text = text.rstrip()
+        while position < len(text):
+            match = _LEXEME.match(text, position)
+            kind = match.lastgroup
+            value = match.group(kind)
+            lexemes.append((kind, value.upper() if kind == "word" else value))
+            position = match.end()
+    return lexemes
+
+def arithmetic_type(left, right):
+    """
+    Return the type of the result of an arithmetic operation (+, -, *, /) on
+    two operands, following the promotion rules of Db2, or None if it is
+    unknown.
+    """
+    if left not in _NUMERIC_TYPES or right not in _NUMERIC_TYPES:
+        return None
+    operands = (left, right)
+    if "DECFLOAT" in operands:
+        return "DECFLOAT"
+    if "REAL" in operands or "DOUBLE" in operands:
+        return "REAL" if operands == ("REAL", "REAL") else "DOUBLE"
+    if "DECIMAL" in operands:
+        return "DECIMAL"
+    if "BIGINT" in operands:
+        return "BIGINT"
+    return "INTEGER"
+
+def _literal_type(number):
+    if "e" in number or "E" in number:
+        return "DOUBLE"
+    if "." in number:
+        return "DECIMAL"
+    value = int(number)
+    if value < 2**31:
+        return "INTEGER"
+    if value < 2**63:
+        return "BIGINT"
+    return "DECIMAL"
+
+def _normalize_type(words):
+    name = " ".join(words)
+    return _TYPE_SYNONYMS.get(name, name)
+
+class _TypeParser(object):
+    """
+    Recursive descent parser computing the type of an expression.
+    Raises ValueError if the expression is not understood.
+    """
+    def __init__(self, expr, types):
+        self.lexemes = _lex(expr)
+        self.position = 0
+        self.types = types
+
+    def peek(self):
+        if self.position < len(self.lexemes):
+            return self.lexemes[self.position]
+        return (None, None)
+
+    def take(self, text=None):
+        lexeme = self.peek()
+        if lexeme[0] is None or (text is not None and lexeme[1] != text):
+            raise ValueError("Unexpected %s"%(lexeme[1],))
+        self.position += 1
+        return lexeme
+
+    def parse(self):
+        result = self.expression()
+        if self.position != len(self.lexemes):
+            raise ValueError("Unexpected %s"%(self.peek()[1],))
+        return result
+
+    def expression(self):
+        result = self.term()
+        while self.peek() in (("symbol", "+"), ("symbol", "-")):
+            self.take()
+            result = arithmetic_type(result, self.term())
+        return result
+
+    def term(self):
+        result = self.unary()
+        while self.peek() in (("symbol", "*"), ("symbol", "/")):
+            self.take()
+            result = arithmetic_type(result, self.unary())
+        return result
+
+    def unary(self):
+        if self.peek() == ("symbol", "-"):
+            self.take()
+            result = self.unary()
+            if result == "SMALLINT":
+                return "INTEGER"
+            return result if result in _NUMERIC_TYPES else None
+        if self.peek() == ("symbol", "+"):
+            self.take()
+        return self.primary()
+
+    def arguments(self):
+        self.take("(")
+        arguments = []
+        if self.peek() != ("symbol", ")"):
+            arguments.append(self.expression())
+            while self.peek() == ("symbol", ","):
+                self.take()
+                arguments.append(self.expression())
+        self.take(")")
+        return arguments
+
+    def skip_parentheses(self):
+        self.take("(")
+        depth = 1
+        while depth:
+            kind, text = self.take()
+            if kind == "symbol" and text == "(":
+                depth += 1
+            elif kind == "symbol" and text == ")":
+                depth -= 1
+
+    def primary(self):
+        kind, text = self.take()
+        if kind == "name":
+            return self.types.get(text)
+        if kind == "number":
+            return _literal_type(text)
+        if kind == "string":
+            return "VARCHAR"
+        if kind == "symbol" and text == "(":
+            result = self.expression()
+            self.take(")")
+            return result
+        if kind != "word":
+            raise ValueError("Unexpected %s"%text)
+        if text == "CAST":
+            self.take("(")
+            self.expression()
+            self.take("AS")
+            words = []
+            while self.peek()[0] == "word":
+                words.append(self.take()[1])
+            if self.peek() == ("symbol", "("):
+                self.skip_parentheses()
+            self.take(")")
+            return _normalize_type(words)
+        if text in ("ROW_NUMBER", "ROWNUMBER", "RANK", "DENSE_RANK"):
+            self.arguments()
+            self.take("OVER")
+            self.skip_parentheses()
+            return "BIGINT"
+        arguments = self.arguments()
+        function = text.split(".")[-1]
+        if function == "FLOOR" and len(arguments) == 1:
+            result = arguments[0]
+            if result == "SMALLINT":
+                return "INTEGER"
+            return result if result in _NUMERIC_TYPES else None
+        if function == "MOD" and len(arguments) == 2:
+            result = arithmetic_type(*arguments)
+            return "DOUBLE" if result == "REAL" else result
+        if function == "POWER" and len(arguments) == 2:
+            if None in arguments:
+                return None
+            if all(argument in _INTEGER_TYPES for argument in arguments):
+                return "BIGINT" if "BIGINT" in arguments else "INTEGER"
+            if "DECFLOAT" in arguments:
+                return "DECFLOAT"
+            return "DOUBLE" if all(argument in _NUMERIC_TYPES for argument in arguments) else None
+        if text.startswith("DB2GSE.") or function.startswith("ST_"):
+            return _DB2GSE_TYPES.get(function)
+        return None
+
+def expression_type(expr, types):
+    """
+    Return the type of an expression, given the types of the columns it
+    refers to, or None if it cannot be inferred.
+
+    Examples
+    --------
+    >>> expression_type('(FLOOR("A"/2) + 1.5)', {"A": "SMALLINT"})
+    'DECIMAL'
+    """
+    try:
+        return _TypeParser(expr, types).parse()
+    except ValueError:
+        return None
+
+def output_types(node, source_types):
+    """
+    Return the types of the columns of a plan, as an ordered dictionary,
+    given the types of the columns of the table its Scan refers to. Types
+    that cannot be inferred are None.
+    """
+    if node is None or isinstance(node, Scan):
+        return OrderedDict(source_types)
+    types = output_types(node.child, source_types)
+    if isinstance(node, Project):
+        return OrderedDict((name, expression_type(expr, types)) for name, expr in node.columns)
+    if isinstance(node, RowNumber):
+        types[node.name] = "BIGINT"
+    return types
+
+#-----------------------------------------------------------------------------
+# Cardinalities
+
+def _count_positions(positions, rows):
+    """
+    Number of positions that refer to a row when there are rows rows, or
+    number of positions if rows is None.
+    """
+    if isinstance(positions, range):
+        if rows is None:
+            return len(positions)
+        if positions.step < 0:
+            positions = positions[::-1]
+        stop = max(positions.start, min(positions.stop, rows))
+        return len(range(positions.start, stop, positions.step))
+    if rows is None:
+        return len(positions)
+    return sum(1 for position in positions if 0 <= position < rows)
+
+def cardinality(node, table_rows=None):
+    """
+    Return the number of rows in the result of a plan, as far as it can be
+    proven without running the query. Projections and orders keep the
+    number of rows, limits and selections of rows by position bound it and
+    other filters make it unknown.
+
+    Parameters
+    ----------
+    node : Node
+        Root of the plan.
+    table_rows : int, optional
+        Number of rows in the table scanned by the plan, if known.
+
+    Returns
+    -------
+    tuple
+        Exact number of rows, or None if it cannot be proven, and upper
+        bound of the number of rows, or None if there is none.
+    """
+    rows, bound = table_rows, table_rows
+    for step in lineage(node):
+        if isinstance(step, Limit):
+            if rows is not None:
+                rows = min(rows, step.count)
+            bound = step.count if bound is None else min(bound, step.count)
+        elif isinstance(step, Filter):
+            if step.positions is not None:
+                if rows is not None:
+                    rows = _count_positions(step.positions, rows)
+                bound = _count_positions(step.positions, bound)
+            elif rows != 0:
+                rows = None
+    return rows, bound
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------
+# Copyright (c) 2015, IBM Corp.
+# All rights reserved.
+#
+# Distributed under the terms of the BSD Simplified License.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#-----------------------------------------------------------------------------
+
+"""
+Thread-safe pool of database connections used by IdaDataBase in pooled mode.
+"""
+
+# Python 2 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+from builtins import object
+from future import standard_library
+standard_library.install_aliases()
+
+import threading
+from time import time
+
+import six
+
+from ibmdbpy.exceptions import IdaDataBaseError
+
+class ConnectionPool(object):
+    """
+    A ConnectionPool hands out database connections to concurrent threads.
+    Connections are opened lazily up to a maximum number, reused once they
+    are checked in, validated before being reused when they stayed idle for
+    a while and closed when they stayed idle for too long.
+    """
+
+    def __init__(self, connect, size, validate=None, validate_after=60,
+                 idle_timeout=600, connections=None):
+        """
+        Constructor for ConnectionPool objects.
+
+        Parameters
+        ----------
+        connect : function
+            Function without arguments returning a new connection.
+        size : int
+            Maximum number of connections opened at the same time.
+        validate : function, optional
+            Function taking a connection and returning True if it is usable.
+            If None, connections are never validated.
+        validate_after : int or float, default: 60
+            Number of seconds a connection can stay idle before it gets
+            validated again at checkout.
+        idle_timeout : int or float, default: 600
+            Number of seconds after which an idle connection is closed. One
+            connection is always kept open.
+        connections : list, optional
+            Connections already opened, to be managed by the pool.
+        """
+        if not isinstance(size, six.integer_types) or size < 1:
+            raise ValueError("size should be a positive integer.")
+        self._connect = connect
+        self.size = size
+        self._validate = validate
+        self.validate_after = validate_after
+        self.idle_timeout = idle_timeout
+        self._idle = [(con, time()) for con in (connections or [])]
+        self._in_use = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        """
+        Number of connections currently opened by the pool.
+        """
+        with self._condition:
+            return len(self._idle) + self._in_use
+
+    def warm_up(self, nb_connections=None):
+        """
+        Open connections in advance so that the first checkouts do not have
+        to wait for a connection to be established.
+
+        Parameters
+        ----------
+        nb_connections : int, optional
+            Number of connections the pool should hold after the warm-up.
+            Defaults to the size of the pool.
+        """
+        if nb_connections is None:
+            nb_connections = self.size
+        nb_connections = min(nb_connections, self.size)
+        with self._condition:
+            if self._closed:
+                return
+            missing = nb_connections - len(self._idle) - self._in_use
+            # Reserve the slots while the connections are being opened
+            self._in_use += max(missing, 0)
+        for opened in range(missing):
+            try:
+                con = self._connect()
+            except:
+                with self._condition:
+                    self._in_use -= missing - opened
+                    self._condition.notify_all()
+                raise
+            with self._condition:
+                self._in_use -= 1
+                self._idle.append((con, time()))
+                self._condition.notify()
+
+    def checkout(self, timeout=None):
+        """
+        Get a connection from the pool, opening one if none is idle and the
+        pool is not full, or waiting for one to be checked in otherwise.
+
+        Parameters
+        ----------
+        timeout : int or float, optional
+            Maximum number of seconds to wait for a connection. Wait forever
+            if None.
+
+        Returns
+        -------
+        connection object
+
+        Raises
+        ------
+        IdaDataBaseError
+            The pool is closed or no connection became available in time.
+        """
+        deadline = None if timeout is None else time() + timeout
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise IdaDataBaseError("The connection pool is closed")
+                self._evict_idle()
+                if self._idle:
+                    con, last_used = self._idle.pop()
+                    break
+                if self._in_use < self.size:
+                    con, last_used = None, None
+                    break
+                if deadline is None:
+                    self._condition.wait()
+                else:
+                    remaining = deadline - time()
+                    if remaining <= 0:
+                        raise IdaDataBaseError("No connection available in " +
+                                               "the pool after %s seconds"%timeout)
+                    self._condition.wait(remaining)
+            self._in_use += 1
+
+        # Open or validate the connection outside of the lock
+        try:
+            if con is None:
+                con = self._connect()
+            elif (self._validate is not None and
+                  time() - last_used >= self.validate_after and
+                  not self._validate(con)):
+                self._close_quietly(con)
+                con = self._connect()
+        except:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+        return con
+
+    def checkin(self, con, discard=False):
+        """
+        Give a connection back to the pool.
+
+        Parameters
+        ----------
+        con : connection object
+            Connection obtained with checkout.
+        discard : bool, default: False
+            If True, the connection is closed instead of being reused, for
+            example because it is known to be broken.
+        """
+        with self._condition:
+            self._in_use -= 1
+            if self._closed or discard:
+                self._close_quietly(con)
+            else:
+                self._idle.append((con, time()))
+                self._evict_idle()
+            self._condition.notify()
+
+    def close(self):
+        """
+        Close all idle connections. Connections still checked out are closed
+        when they are checked in.
+        """
+        with self._condition:
+            self._closed = True
+            for con, _ in self._idle:
+                self._close_quietly(con)
+            self._idle = []
+            self._condition.notify_all()
+
+    def _evict_idle(self):
+        """
+        Close the connections that stayed idle for more than idle_timeout
+        seconds, keeping at least one connection open. The lock must be held
+        by the caller.
+        """
+        now = time()
+        # Idle connections are reused in LIFO order, the oldest come first
+        while (len(self._idle) + self._in_use > 1 and self._idle and
+               now - self._idle[0][1] > self.idle_timeout):
+            con, _ = self._idle.pop(0)
+            self._close_quietly(con)
+
+    @staticmethod
+    def _close_quietly(con):
+        """
+        Close a connection, ignoring errors raised by broken connections.
+        """
+        try:
+            con.close()
+        except Exception:
+            pass
@@ -22,8 +22,6 @@ from builtins import super
 from future import standard_library
 standard_library.install_aliases()
 
-from copy import deepcopy
-
 from lazy import lazy
 
 import ibmdbpy
@@ -61,11 +59,4 @@ class IdaSeries(ibmdbpy.IdaDataFrame):
         """
         Clone an IdaSeries.
         """
-        newida = IdaSeries(self._idadb, self._name, self.indexer, self.column)
-        newida.internal_state.name = deepcopy(self.internal_state.name)
-        newida.internal_state.ascending = deepcopy(self.internal_state.ascending)
-        #newida.internal_state.views = deepcopy(self.internal_state.views)
-        newida.internal_state._views = deepcopy(self.internal_state._views)
-        newida.internal_state._cumulative = deepcopy(self.internal_state._cumulative)
-        newida.internal_state.order = deepcopy(self.internal_state.order)
-        return newida
\ No newline at end of file
+        return self._derive(IdaSeries, column = self.column)
\ No newline at end of file
@@ -23,9 +23,23 @@ standard_library.install_aliases()
 import decimal
 import numpy as np
 import os
+import re
+from time import time
 
 import pandas as pd
-from pandas.io.sql import read_sql
+import six
+
+# Number of rows retrieved per round trip when reading a result set
+_FETCH_BATCH_SIZE = 10000
+
+_FLOAT_TYPES = ("REAL", "DOUBLE", "FLOAT", "DECIMAL", "NUMERIC", "DECFLOAT")
+_INTEGER_TYPES = ("SMALLINT", "INTEGER", "BIGINT")
+_DATETIME_TYPES = ("DATE", "TIMESTAMP")
+
+# Names under which the states of IdaDataFrames are registered as common
+# table expressions, see IdaDataBase._register_state
+STATE_PREFIX = "IBMDBPY_STATE_"
+_STATE_NAME = re.compile(r"\b%s\d+\b"%STATE_PREFIX)
 
 def _prepare_query(query_string, silent = False):
     """
@@ -47,17 +61,91 @@ def _prepare_query(query_string, silent = False):
             print("> " + query_string)
     return query_string
 
+def _expand_states(query, states):
+    """
+    Define the states of IdaDataFrames a query refers to.
+
+    Queries (SELECT, VALUES or WITH statements) get the states as common
+    table expressions in a WITH clause. In other statements, in which a WITH
+    clause may not be allowed at the beginning, each reference to a state is
+    replaced by its definition.
+
+    Parameters
+    ----------
+    query : str
+        Query which may refer to registered states.
+    states : dict
+        Definition of the registered states, by name.
+
+    Returns
+    -------
+    str
+
+    Examples
+    --------
+    >>> _expand_states('SELECT COUNT(*) FROM IBMDBPY_STATE_0',
+    ...                {'IBMDBPY_STATE_0': 'SELECT * FROM IRIS WHERE ("A" > 1)'})
+    'WITH IBMDBPY_STATE_0 AS (SELECT * FROM IRIS WHERE ("A" > 1)) SELECT COUNT(*) FROM IBMDBPY_STATE_0'
+    """
+    if not states:
+        return query
+    names = []
+    for name in _STATE_NAME.findall(query):
+        if name in states and name not in names:
+            names.append(name)
+    if not names:
+        return query
+
+    statement = query.lstrip()
+    keyword = statement[:6].upper()
+    if keyword.startswith(("SELECT", "WITH", "VALUES", "(")):
+        definitions = ", ".join("%s AS (%s)"%(name, states[name]) for name in names)
+        if keyword.startswith("WITH") and not statement[4:5].isalnum():
+            return "WITH %s, %s"%(definitions, statement[4:].lstrip())
+        return "WITH %s %s"%(definitions, statement)
+    return _STATE_NAME.sub(lambda match: "(%s)"%states[match.group(0)]
+                           if match.group(0) in states else match.group(0), query)
+
 def _prepare_and_execute(idaobject, query, autocommit = True, silent = False):
     """
     See IdaDataBase._prepare_and_execute
     """
+    query = _expand_states(query, idaobject._states)
     # Open a cursor
     cursor = idaobject._con.cursor()
+    dirty = False
 
     try:
         query = _prepare_query(query, silent)
         #print(query)
         cursor.execute(query)
+        idaobject._last_alive = time()
+        dirty = _is_uncommitted(autocommit)
+        if autocommit is True:
+            idaobject._autocommit()
+    except:
+        raise
+    else:
+        return True
+    finally:
+        cursor.close()
+        idaobject._release_connection(dirty)
+
+def _prepare_and_executemany(idaobject, query, parameters, autocommit = True,
+                             silent = False):
+    """
+    See IdaDataBase._prepare_and_executemany
+    """
+    query = _expand_states(query, idaobject._states)
+    # Open a cursor
+    cursor = idaobject._con.cursor()
+    dirty = False
+
+    try:
+        query = _prepare_query(query, silent)
+        cursor.executemany(query, parameters)
+        idaobject._last_alive = time()
+        dirty = _is_uncommitted(autocommit)
         if autocommit is True:
             idaobject._autocommit()
     except:
@@ -66,8 +154,17 @@ def _prepare_and_execute(idaobject, query, autocommit = True, silent = False):
         return True
     finally:
         cursor.close()
+        idaobject._release_connection(dirty)
+
+def _is_uncommitted(autocommit):
+    """
+    Return True if the changes made by a statement executed with the given
+    autocommit parameter are left uncommitted.
+    """
+    return not (autocommit is True and os.getenv('AUTOCOMMIT') == 'True')
 
-def ida_query(idadb, query, silent=False, first_row_only=False, autocommit = False):
+def ida_query(idadb, query, silent=False, first_row_only=False, autocommit = False,
+              chunksize = None):
     """
     See IdaDataBase.ida_query
     
@@ -75,8 +172,15 @@ def ida_query(idadb, query, silent=False, first_row_only=False, autocommit = Fal
     -----
     This method calls as appropriate either 
     _ida_query_ODBC(), or 
-    _ida_query_JDBC()
+    _ida_query_JDBC(), or
+    _ida_query_chunks() if a chunksize is given.
     """
+    # States are expanded now, before the chunks get lazily retrieved
+    query = _expand_states(query, idadb._states)
+    if chunksize is not None:
+        if not isinstance(chunksize, six.integer_types) or chunksize < 1:
+            raise ValueError("chunksize should be a positive integer.")
+        return _ida_query_chunks(idadb, query, silent, chunksize, autocommit)
     if idadb._con_type == 'odbc':
         return _ida_query_ODBC(idadb, query, silent, first_row_only, autocommit)
     else:
@@ -87,49 +191,34 @@ def _ida_query_ODBC(idadb, query, silent, first_row_only, autocommit):
     For ODBC connections no further work needs to be done regarding
     CLOB retrieval because it's fixed with a configuration keyword at
     connection creation point. See IdaDataBase.__init__
+
+    The result set is read from the cursor that executed the query, so
+    that the statement runs only once in the database.
     """
     cursor = idadb._con.cursor()
+    dirty = False
     try:
         query = _prepare_query(query, silent)
         cursor.execute(query)
+        idadb._last_alive = time()
 
         if autocommit is True:
             idadb._autocommit()            
         try:
             firstRow = cursor.fetchone()
         except:
+            dirty = _is_uncommitted(autocommit)
             return None #non-SELECT query, didn't return anything
         else:
             #query with SELECT statement, mind that resultset might be empty
             if first_row_only is True:
-                if firstRow is not None:
-                    #this following processing was proposed by Edouard
-                    tuple_as_list = list(tuple(firstRow))
-                    for index, element in enumerate(tuple_as_list):
-                        if element is None:
-                            tuple_as_list[index] = np.nan
-                        if isinstance(element, decimal.Decimal):
-                            tuple_as_list[index] = int(element)
-                    result = tuple(tuple_as_list)
-                else:
-                    #first_row_only is True but the query retuned nothing
-                    return tuple()
-            else:
-                result = read_sql(query, idadb._con) 
-                #convert to Series if only one column   
-                
-                # Note: This may solve problem in case the interface does not
-                # get properly the column names. This is just a suggestion. 
-                # Uncomment it if you feel you need it, but so far it worked well without
-                # result.columns = [column[0] for column in cursor.description]
-                
-                if len(result.columns) == 1:
-                    result = result[result.columns[0]]                        
-            return result
+                return _first_row_as_tuple(firstRow)
+            return _fetch_dataframe(cursor, firstRow)
     except:
         raise
     finally:
         cursor.close()
+        idadb._release_connection(dirty)
         
 def _ida_query_JDBC(idadb, query, silent, first_row_only, autocommit):
     """
@@ -146,101 +235,235 @@ def _ida_query_JDBC(idadb, query, silent, first_row_only, autocommit):
     for JDBC would be needed, as the CLOB would be retrieved as actual strings
     instead of handles.
     
-    If there are no CLOB columns, Pandas' read_sql method is used
+    If there are no CLOB columns, the rows are fetched in batches from the
+    cursor that executed the query.
     """
     cursor = idadb._con.cursor()
+    dirty = False
     try:
         query = _prepare_query(query, silent)
         cursor.execute(query)
+        idadb._last_alive = time()
 
         if autocommit is True:
             idadb._autocommit()            
         try:
             firstRow = cursor.fetchone()
         except:
+            dirty = _is_uncommitted(autocommit)
             return None #non-SELECT query, didn't return anything
         else:        
             #query with SELECT statement, mind that resultset might be empty
             colNumbersWithCLOBs = []
             if firstRow is not None:
-               #identify CLOB columns               
-               for index, col in enumerate(firstRow):
-                   if hasattr(col, "getSubString") and hasattr(col, "length"):
-                       colNumbersWithCLOBs.append(index)
-               
-               firstRow = list(firstRow)
-               #replace CLOB's (if any) in the first row
-               if colNumbersWithCLOBs:
-                   for colNum in colNumbersWithCLOBs:
-                       firstRow[colNum] = firstRow[colNum].getSubString(1, firstRow[colNum].length())
-               
+                #identify CLOB columns
+                colNumbersWithCLOBs = _get_clob_columns(firstRow)
+                #replace CLOB's (if any) in the first row
+                firstRow = _convert_clobs(firstRow, colNumbersWithCLOBs)
+
             if first_row_only is True:
-                if firstRow is None:
-                    return tuple()
-                else:
-                    #this following processing was proposed by Edouard            
-                    for index, element in enumerate(firstRow):
-                        if element is None:
-                            firstRow[index] = np.nan
-                        if isinstance(element, decimal.Decimal):
-                            firstRow[index] = int(element)
-                    result = tuple(firstRow)
-                    return result
-
-            #first_row_only is False
-            if((not colNumbersWithCLOBs) or (firstRow is None)) :
-                #use Pandas' read_sql
-                #if firstRow is None, resultset was empty, so create an empty 
-                #DataFrame with the column names
-                result = read_sql(query, idadb._con)
-                # Note: This may solve problem in case the interface does not
-                # get properly the column names. This is just a suggestion. 
-                # Uncomment it if you feel you need it, but so far it worked well without
-                # result.columns = [column[0] for column in cursor.description]
-            else:
-                #get the column names for the DataFrame
-                colNames = [column[0] for column in cursor.description]
-                
-                #use the already retrieved row and retrieve the remaining
-                data = []
-                row = firstRow
-                while row is not None:
-                    data.append(row)
-                    row = cursor.fetchone() #this returns a tuple
-                    if row is not None:
-                        row = list(row)            
-                        for colNum in colNumbersWithCLOBs:                            
-                            try:
-                                # Check needed because some DB2GSE functions 
-                                # return Null, which is then interpreted as
-                                # None, which doesn't have getSubString method
-                                row[colNum] = row[colNum].getSubString(
-                                        1, row[colNum].length())
-                            except:
-                                pass
-                result = pd.DataFrame(data)
-                result.columns = colNames
-                
-            #convert to Series if only one column       
-            if len(result.columns) == 1:
-                result = result[result.columns[0]] 
-            return result                       
-            
+                return _first_row_as_tuple(firstRow)
+            return _fetch_dataframe(cursor, firstRow, colNumbersWithCLOBs)
     except:
         raise
     finally:
         cursor.close()
-            
+        idadb._release_connection(dirty)
+
+def _ida_query_chunks(idadb, query, silent, chunksize, autocommit, typenames = None):
+    """
+    Generator executing a query and yielding its result set as DataFrames of
+    at most chunksize rows. Only one chunk is held in memory at a time.
+
+    The query is executed when the first chunk is requested. The cursor, and
+    in pooled mode the connection, are released once the generator is
+    exhausted or closed.
+
+    For JDBC connections, result sets containing CLOBs are read row by row,
+    see _ida_query_JDBC.
+
+    Parameters
+    ----------
+    typenames : dict, optional
+        Database type of the columns, used to give the same dtypes to all
+        chunks. See _coerce_dtypes.
+    """
+    if not isinstance(chunksize, six.integer_types) or chunksize < 1:
+        raise ValueError("chunksize should be a positive integer.")
+    cursor = idadb._con.cursor()
+    dirty = False
+    try:
+        query = _prepare_query(query, silent)
+        cursor.execute(query)
+        idadb._last_alive = time()
+
+        if autocommit is True:
+            idadb._autocommit()
+        try:
+            firstRow = cursor.fetchone()
+        except:
+            dirty = _is_uncommitted(autocommit)
+            return #non-SELECT query, didn't return anything
+
+        colNames = [column[0] for column in cursor.description]
+        colNumbersWithCLOBs = []
+        if firstRow is not None and idadb._con_type == 'jdbc':
+            colNumbersWithCLOBs = _get_clob_columns(firstRow)
+            firstRow = _convert_clobs(firstRow, colNumbersWithCLOBs)
+
+        data = [] if firstRow is None else [firstRow]
+        exhausted = firstRow is None
+        nb_chunks = 0
+        while True:
+            while not exhausted and len(data) < chunksize:
+                if colNumbersWithCLOBs:
+                    row = cursor.fetchone()
+                    rows = [] if row is None else [_convert_clobs(row, colNumbersWithCLOBs)]
+                else:
+                    rows = cursor.fetchmany(chunksize - len(data))
+                if not rows:
+                    exhausted = True
+                data.extend(rows)
+            # An empty result set is returned as one empty chunk
+            if not data and nb_chunks:
+                break
+            chunk = pd.DataFrame.from_records(data, columns=colNames,
+                                              coerce_float=True)
+            if typenames is not None:
+                chunk = _coerce_dtypes(chunk, typenames)
+            data = []
+            nb_chunks += 1
+            yield chunk
+            if exhausted:
+                break
+    finally:
+        cursor.close()
+        idadb._release_connection(dirty)
+
+def _coerce_dtypes(dataframe, typenames):
+    """
+    Convert the columns of a DataFrame downloaded from the database to the
+    dtypes matching their database type, so that they do not depend on the
+    values which happen to be in a given chunk.
+
+    Columns of floating point and decimal types are converted to float64,
+    integer columns to int64, or float64 if they contain missing values, and
+    date and timestamp columns to datetime64. Other columns are left
+    unchanged.
+
+    Parameters
+    ----------
+    dataframe : DataFrame
+        Data to be converted.
+    typenames : dict
+        Database type name (as in SYSCAT.COLUMNS.TYPENAME) of the columns.
+    """
+    for column in dataframe.columns:
+        typename = typenames.get(column)
+        if typename in _FLOAT_TYPES:
+            dataframe[column] = dataframe[column].astype(np.float64)
+        elif typename in _INTEGER_TYPES:
+            if dataframe[column].isnull().any():
+                dataframe[column] = dataframe[column].astype(np.float64)
+            else:
+                dataframe[column] = dataframe[column].astype(np.int64)
+        elif typename in _DATETIME_TYPES:
+            dataframe[column] = pd.to_datetime(dataframe[column])
+    return dataframe
+
+def _get_clob_columns(row):
+    """
+    Return the positions of the columns of a JDBC row that hold CLOB handles.
+    """
+    return [index for index, col in enumerate(row)
+            if hasattr(col, "getSubString") and hasattr(col, "length")]
+
+def _convert_clobs(row, clob_columns):
+    """
+    Replace the CLOB handles of a JDBC row by the strings they refer to.
+    """
+    row = list(row)
+    for colNum in clob_columns:
+        try:
+            # Check needed because some DB2GSE functions 
+            # return Null, which is then interpreted as
+            # None, which doesn't have getSubString method
+            row[colNum] = row[colNum].getSubString(1, row[colNum].length())
+        except:
+            pass
+    return row
+
+def _first_row_as_tuple(row):
+    """
+    Format the first row of a result set as returned with first_row_only.
+    """
+    if row is None:
+        #first_row_only is True but the query retuned nothing
+        return tuple()
+    #this following processing was proposed by Edouard
+    tuple_as_list = list(row)
+    for index, element in enumerate(tuple_as_list):
+        if element is None:
+            tuple_as_list[index] = np.nan
+        if isinstance(element, decimal.Decimal):
+            tuple_as_list[index] = int(element)
+    return tuple(tuple_as_list)
+
+def _fetch_dataframe(cursor, first_row, clob_columns = None):
+    """
+    Build a DataFrame out of the result set of an already executed query.
+
+    Parameters
+    ----------
+    cursor : cursor
+        Cursor on which the query was executed. The first row of the result
+        set is expected to have been fetched already.
+    first_row : list or tuple or None
+        First row of the result set, None if the result set is empty.
+    clob_columns : list of int, optional
+        Positions of the columns holding JDBC CLOB handles. When given, the
+        remaining rows are fetched one at a time because a handle is closed
+        as soon as the cursor moves to the next row.
+
+    Returns
+    -------
+    DataFrame, or Series if the result set has only one column.
+    """
+    colNames = [column[0] for column in cursor.description]
+    data = []
+    if first_row is not None:
+        data.append(first_row)
+        if clob_columns:
+            row = cursor.fetchone()
+            while row is not None:
+                data.append(_convert_clobs(row, clob_columns))
+                row = cursor.fetchone()
+        else:
+            rows = cursor.fetchmany(_FETCH_BATCH_SIZE)
+            while rows:
+                data.extend(rows)
+                rows = cursor.fetchmany(_FETCH_BATCH_SIZE)
+
+    # coerce_float=True mirrors what pandas' read_sql does with the rows
+    result = pd.DataFrame.from_records(data, columns=colNames,
+                                       coerce_float=True)
+    #convert to Series if only one column
+    if len(result.columns) == 1:
+        result = result[result.columns[0]]
+    return result
+
 def ida_scalar_query(idadb, query, silent = False, autocommit = False):
     """
     See IdaDataBase.ida_scalar_query
     """
+    query = _expand_states(query, idadb._states)
     # Open a cursor
     cursor = idadb._con.cursor()
 
     try:
         query = _prepare_query(query, silent)
         cursor.execute(query)
+        idadb._last_alive = time()
         
         if autocommit is True:
             idadb._autocommit()
@@ -252,4 +475,5 @@ def ida_scalar_query(idadb, query, silent = False, autocommit = False):
         raise
     finally:
         cursor.close()
+        idadb._release_connection()
     return result
\ No newline at end of file
@@ -18,6 +18,7 @@ from builtins import dict
 from builtins import zip
 from builtins import str
 from builtins import int
+from builtins import range
 from future import standard_library
 standard_library.install_aliases()
 
@@ -32,12 +33,251 @@ import numpy as np
 import six
 
 import ibmdbpy
+from ibmdbpy import plan
 from ibmdbpy.utils import chunklist
 
 """
 Statistics module for IdaDataFrames
 """
 
+# Aggregate function computing each statistic supported by _aggregate
+_AGGREGATES = OrderedDict([
+    ("count", "COUNT(%s)"),
+    ("nulls", "COUNT(*) - COUNT(%s)"),
+    ("mean", "AVG(CAST(%s AS DOUBLE))"),
+    ("std", "STDDEV_SAMP(CAST(%s AS DOUBLE))"),
+    ("var", "VAR_SAMP(CAST(%s AS DOUBLE))"),
+    ("min", "MIN(%s)"),
+    ("max", "MAX(%s)"),
+    ("sum", "SUM(%s)"),
+    ("levels", "COUNT(DISTINCT %s)")])
+
+# Maximum number of items in the select list of a statement, DB2 allows 1012
+_MAX_SELECT_ITEMS = 1000
+
+# Minimum number of numerical columns from which _aggregate unpivots them,
+# see _unpivot_aggregate
+_UNPIVOT_THRESHOLD = 100
+
+# Statistics computed in DOUBLE whatever the type of the column, which do
+# not lose anything when the values are unpivoted as DOUBLE
+_DOUBLE_AGGREGATES = ("count", "nulls", "mean", "std", "var")
+
+# Types whose values are all converted to DOUBLE exactly
+_EXACT_IN_DOUBLE = ("SMALLINT", "INTEGER", "REAL", "DOUBLE", "FLOAT")
+
+# Interpolations supported by _get_percentiles, as in pandas
+_INTERPOLATIONS = ("linear", "lower", "higher", "midpoint", "nearest")
+
+def _select_first_row(idadf, expressions, source=None):
+    """
+    Evaluate aggregate expressions over the current state of an
+    IdaDataFrame, or over source if given, all of them in one scan unless
+    there are more than _MAX_SELECT_ITEMS.
+
+    Returns
+    -------
+    list
+        Value of each expression.
+    """
+    if source is None:
+        source = idadf.internal_state.current_state
+    values = []
+    for chunk in chunklist(list(expressions), _MAX_SELECT_ITEMS):
+        # first_row_only would truncate DECIMAL values to integers
+        data = idadf.ida_query("SELECT %s FROM %s"%(", ".join(chunk), source))
+        if isinstance(data, pd.Series):
+            values.append(data.iloc[0])
+        else:
+            values.extend(data.iloc[0])
+    return values
+
+def _aggregate_expression(stat, column):
+    """
+    Aggregate expression computing a statistic over a column, see
+    _aggregate_items.
+    """
+    if isinstance(stat, Number) and not isinstance(stat, bool):
+        return ("PERCENTILE_CONT(%s) WITHIN GROUP (ORDER BY %s)"
+                %(float(stat), plan.quote(column)))
+    if stat not in _AGGREGATES:
+        raise ValueError("Unsupported statistic '%s', expected one of %s"
+                         %(stat, ", ".join(_AGGREGATES)))
+    return _AGGREGATES[stat]%plan.quote(column)
+
+def _aggregate_items(idadf, items, source=None):
+    """
+    Compute aggregate statistics over columns of an IdaDataFrame, all of
+    them in one scan unless there are more than _MAX_SELECT_ITEMS.
+
+    Parameters
+    ----------
+    idadf : IdaDataFrame
+        Data source.
+    items : list of tuple
+        Pairs of a statistic and of the name of a column of idadf. A
+        statistic is either the name of a statistic in _AGGREGATES or a
+        number between 0 and 1, the percentile of the column with linear
+        interpolation.
+    source : str, optional
+        Query or table over which the statistics are computed instead of
+        the current state of idadf.
+
+    Returns
+    -------
+    list
+        Value of each item.
+    """
+    expressions = [_aggregate_expression(stat, column) for stat, column in items]
+    return _select_first_row(idadf, expressions, source)
+
+def _aggregate(idadf, stats, columns, source=None):
+    """
+    Compute several statistics over several columns of an IdaDataFrame in
+    one scan.
+
+    Parameters
+    ----------
+    idadf : IdaDataFrame
+        Data source.
+    stats : str or list
+        Names of the statistics to be computed: count, nulls (the number of
+        missing values), mean, std, var, min, max, sum or levels (the number
+        of distinct values), or numbers between 0 and 1 for percentiles with
+        linear interpolation.
+    columns : str or list of str
+        Name of the columns that belong to the IdaDataFrame.
+    source : str, optional
+        Query or table over which the statistics are computed instead of
+        the current state of idadf.
+
+    Returns
+    -------
+    DataFrame
+        The index consists of the statistics and the columns are the
+        columns of the IdaDataFrame.
+
+    Notes
+    -----
+    std and var are the sample standard deviation and variance, like in
+    pandas. When there are at least _UNPIVOT_THRESHOLD numerical columns,
+    the statistics of these columns are computed by _unpivot_aggregate,
+    except min, max, sum and levels of the columns whose values may not be
+    converted to DOUBLE exactly, such as BIGINT and DECIMAL.
+    """
+    if isinstance(stats, six.string_types) or isinstance(stats, Number):
+        stats = [stats]
+    if isinstance(columns, six.string_types):
+        columns = [columns]
+    columns = list(columns)
+
+    wide = [] if source is not None else _unpivoted_columns(idadf, columns)
+    exact = set(_exact_in_double(idadf, wide))
+    unpivoted_stats = [stat for stat in stats if exact or _is_double_aggregate(stat)]
+
+    def unpivoted(stat, column):
+        return column in wide and (column in exact or _is_double_aggregate(stat))
+
+    unpivoted_data = None
+    if wide and unpivoted_stats:
+        unpivoted_data = _unpivot_aggregate(idadf, unpivoted_stats, wide)
+    items = [(stat, column) for column in columns for stat in stats
+             if not unpivoted(stat, column)]
+    values = iter(_aggregate_items(idadf, items, source) if items else [])
+
+    data = OrderedDict()
+    for column in columns:
+        data[column] = [unpivoted_data.loc[column, stat] if unpivoted(stat, column)
+                        else next(values) for stat in stats]
+    return pd.DataFrame(data, index=list(stats), columns=columns)
+
+def _is_double_aggregate(stat):
+    """
+    Whether a statistic of _aggregate is computed in DOUBLE whatever the
+    type of the column: the ones of _DOUBLE_AGGREGATES and percentiles.
+    """
+    return isinstance(stat, Number) or stat in _DOUBLE_AGGREGATES
+
+def _exact_in_double(idadf, columns):
+    """
+    Return the columns among columns whose values are all converted to
+    DOUBLE exactly, given their type.
+    """
+    if not columns:
+        return []
+    types = idadf.dtypes["TYPENAME"]
+    return [column for column in columns if types[column] in _EXACT_IN_DOUBLE]
+
+def _unpivoted_columns(idadf, columns):
+    """
+    Return the numerical columns among columns, if there are at least
+    _UNPIVOT_THRESHOLD of them, from which statistics are computed by
+    _unpivot_aggregate rather than by one expression per column.
+    """
+    if len(columns) < _UNPIVOT_THRESHOLD:
+        return []
+    numerical = set(idadf._get_numerical_columns())
+    wide = [column for column in columns if column in numerical]
+    if len(wide) < _UNPIVOT_THRESHOLD:
+        return []
+    return wide
+
+def _unpivot_source(idadf, columns):
+    """
+    Return a source unpivoting numerical columns of the current state of an
+    IdaDataFrame: each row yields one row (COLNAME, VAL) per column, VAL
+    being the value of the column cast to DOUBLE.
+    """
+    values = ", ".join("('%s', CAST(T.%s AS DOUBLE))"
+                       %(column.replace("'", "''"), plan.quote(column))
+                       for column in columns)
+    return ("%s AS T, LATERAL (VALUES %s) AS U(COLNAME, VAL)"
+            %(idadf.internal_state.current_state, values))
+
+def _unpivot_aggregate(idadf, stats, columns):
+    """
+    Compute several statistics over numerical columns of an IdaDataFrame in
+    one scan, whatever the number of columns, by unpivoting them inside the
+    database and grouping their values by column.
+
+    Parameters
+    ----------
+    idadf : IdaDataFrame
+        Data source.
+    stats : str or list
+        Statistics as in _aggregate.
+    columns : list of str
+        Name of numerical columns that belong to the IdaDataFrame.
+
+    Returns
+    -------
+    DataFrame
+        Tidy result, the index consists of the columns and the columns are
+        the statistics.
+
+    Notes
+    -----
+    Whereas _aggregate needs as many expressions as statistics times columns,
+    which take several statements over wide tables, the statement here has
+    one expression per statistic. All values are cast to DOUBLE, so min,
+    max, sum and levels are only exact for the columns of _exact_in_double.
+    """
+    if isinstance(stats, six.string_types) or isinstance(stats, Number):
+        stats = [stats]
+    stats = list(stats)
+    expressions = [_aggregate_expression(stat, "VAL") for stat in stats]
+    query = ("SELECT \"COLNAME\", %s FROM %s GROUP BY \"COLNAME\""
+             %(", ".join(expressions), _unpivot_source(idadf, columns)))
+    data = idadf.ida_query(query)
+    data.columns = ["COLNAME"] + stats
+    data = data.set_index("COLNAME").reindex(columns)
+    data.index.name = None
+    # Columns without any row do not make a group
+    for stat in stats:
+        if stat in ("count", "nulls", "levels"):
+            data[stat] = data[stat].fillna(0).astype(int)
+    return data
+
 def _numeric_stats(idadf, stat, columns):
     """
     Compute various stats from one or several numerical columns of an IdaDataFrame.
@@ -62,53 +302,18 @@ def _numeric_stats(idadf, stat, columns):
     var, min, max, sum. Should return a tuple. Only available for numerical
     columns.
     """
-    # Calculate count, mean, median, std, var, min, max
     if isinstance(columns, six.string_types):
         columns = [columns]
 
-    if isinstance(stat, six.string_types):
-        if stat == "count":
-            select_string = 'COUNT(\"' + '\"), COUNT(\"'.join(columns) + '\")'
-        elif stat == "mean":
-            select_string = ('AVG(CAST(\"' +
-                             '\" AS FLOAT)), AVG(CAST(\"'.join(columns) +
-                             '\" AS FLOAT))')
-        elif stat == "median":
-            return _get_percentiles(idadf, 0.5, columns).values[0]
-        elif stat == "std":
-            tuple_count = _numeric_stats(idadf, 'count', columns)
-            # in case of only one column, ensure tuple_count is iterable
-            if len(columns) == 1:
-                tuple_count = [tuple_count]
-            count_dict = dict((x, y) for x, y in zip(columns, tuple_count))
-            agg_list = []
-            for column in columns:
-                agg_list.append("STDDEV(\"%s\")*(SQRT(%s)/SQRT(%s))"
-                                %(column, count_dict[column], count_dict[column]-1))
-            select_string = ', '.join(agg_list)
-        elif stat == "var":
-            tuple_count = _numeric_stats(idadf, 'count', columns)
-            if len(columns) == 1:
-                tuple_count = [tuple_count]
-            count_dict = dict((x, int(y)) for x, y in zip(columns, tuple_count))
-            agg_list = []
-            for column in columns:
-                agg_list.append("VAR(\"%s\")*(%s.0/%s.0)"
-                                %(column, count_dict[column], count_dict[column]-1))
-            select_string = ', '.join(agg_list)
-        elif stat == "min":
-            select_string = 'MIN(\"' + '\"), MIN(\"'.join(columns) + '\")'
-        elif stat == "max":
-            select_string = 'MAX(\"' + '\"), MAX(\"'.join(columns) + '\")'
-        elif stat == "sum":
-            select_string = 'SUM(\"' + '\"), SUM(\"'.join(columns) + '\")'
-
-        name = idadf.internal_state.current_state
-
-        return idadf.ida_query("SELECT %s FROM %s" %(select_string, name)).values[0]
-
-
-def _get_percentiles(idadf, percentiles, columns):
+    if stat == "median":
+        return _get_percentiles(idadf, 0.5, columns).values[0]
+    values = _aggregate(idadf, stat, columns).values[0]
+    if len(columns) == 1:
+        return values[0]
+    return values
+
+
+def _get_percentiles(idadf, percentiles, columns, interpolation="linear"):
     """
     Return percentiles over all entries of a column or list of columns in the
     IdaDataFrame.
@@ -120,59 +325,286 @@ def _get_percentiles(idadf, percentiles, columns):
         All values in percentiles must be > 0  and < 1
     columns: String or list of string
         Name of columns belonging to the IdaDataFrame.
+    interpolation : str, default: "linear"
+        Value returned when a percentile lies between two values i < j, as
+        in pandas: "linear" interpolates them, "lower" returns i, "higher"
+        returns j, "midpoint" returns (i + j) / 2, and "nearest" returns the
+        nearest of them.
 
     Returns
     -------
         DataFrame
-    """
 
+    Notes
+    -----
+    Percentiles are computed with the PERCENTILE_CONT aggregate function for
+    a linear interpolation and with PERCENTILE_DISC otherwise, which first
+    requires the number of non-missing values in each column. All columns
+    and percentiles are computed in the same scan.
+    """
     if isinstance(columns, six.string_types):
         columns = [columns]
     if isinstance(percentiles, Number):
         percentiles = [percentiles]
+    columns = list(columns)
+    percentiles = list(percentiles)
+    if interpolation not in _INTERPOLATIONS:
+        raise ValueError("Argument 'interpolation' should be one of %s"
+                         %", ".join(_INTERPOLATIONS))
+
+    if interpolation == "linear":
+        data = _aggregate(idadf, percentiles, columns)
+        return data.astype(float)
+
+    counts = _aggregate(idadf, "count", columns).loc["count"]
+    expressions = []
+    positions = []
+    for column in columns:
+        nb_not_missing = int(counts[column])
+        for percentile in percentiles:
+            index = float(percentile)*(nb_not_missing - 1)
+            if interpolation == "lower":
+                indexes = [int(math.floor(index))]
+            elif interpolation == "higher":
+                indexes = [int(math.ceil(index))]
+            elif interpolation == "nearest":
+                indexes = [int(np.around(index))]
+            else:
+                indexes = sorted(set([int(math.floor(index)), int(math.ceil(index))]))
+            positions.append(len(indexes))
+            for value_index in indexes:
+                if nb_not_missing == 0:
+                    expressions.append("CAST(NULL AS DOUBLE)")
+                else:
+                    # The value at value_index is the first one whose
+                    # cumulative distribution reaches (value_index + 0.5)/n
+                    expressions.append("PERCENTILE_DISC(%s) WITHIN GROUP (ORDER BY %s)"
+                                       %(float(value_index + 0.5)/nb_not_missing,
+                                         plan.quote(column)))
+
+    values = iter(_select_first_row(idadf, expressions))
+    positions = iter(positions)
+    data = OrderedDict()
+    for column in columns:
+        data[column] = []
+        for _ in percentiles:
+            selected = [next(values) for _ in range(next(positions))]
+            if any(pd.isnull(value) for value in selected):
+                data[column].append(np.nan)
+            else:
+                selected = [float(str(value)) for value in selected]
+                data[column].append(sum(selected)/len(selected))
+    return pd.DataFrame(data, index=percentiles, columns=columns)
 
-    name = idadf.internal_state.current_state
 
-    # Get na values for each columns
-    tuple_na = _get_number_of_nas(idadf, columns)
-    nrow = idadf.shape[0]
-    data = pd.DataFrame()
-    for index_col, column in enumerate(columns):
-        nb_not_missing = nrow - tuple_na[index_col]
-        indexes = [float(x)*float(nb_not_missing-1) + 1 for x in percentiles]
-        low = [math.floor(x) for x in indexes]
-        high = [math.ceil(x) for x in indexes]
-        tuplelist = []
-        i = 0
-        for flag in [((x+1) == y) for x, y in zip(low, high)]:
-            if flag:
-                tuplelist.append((i, i+1))
-                i += 2
+# Confidence of the error bounds of percentiles computed on a sample
+_APPROXIMATION_CONFIDENCE = 0.95
+
+def _use_catalog_statistics(idadf, fast=None):
+    """
+    Whether statistics may be read from the catalog for an IdaDataFrame:
+    fast if given, the use_catalog_stats attribute of its IdaDataBase
+    otherwise.
+    """
+    if fast is None:
+        return idadf._idadb.use_catalog_stats
+    return fast
+
+def _catalog_table_cardinality(idadf):
+    """
+    Return the number of rows in the table an IdaDataFrame is open on
+    according to the statistics of the catalog, whatever the state of the
+    IdaDataFrame, or None if the statistics of the table were never
+    collected or are older than the last alteration of the table.
+    """
+    data = idadf.ida_query(("SELECT CARD, STATS_TIME, ALTER_TIME FROM SYSCAT.TABLES " +
+                            "WHERE TABSCHEMA = '%s' AND TABNAME = '%s'")
+                           %(idadf.schema, idadf.tablename))
+    if data.empty:
+        return None
+    cardinality, stats_time, alter_time = data.iloc[0]
+    if pd.isnull(stats_time) or pd.isnull(cardinality) or cardinality < 0:
+        return None
+    if not pd.isnull(alter_time) and stats_time < alter_time:
+        return None
+    return int(cardinality)
+
+def _selects_table_columns(idadf):
+    """
+    Whether the rows of an IdaDataFrame are all the rows of its table and
+    each of its columns is a column of the table under its own name, so
+    that the statistics of the table in the catalog hold for it.
+    """
+    state = idadf.internal_state
+    for node in plan.lineage(state.plan):
+        if not isinstance(node, plan.Project):
+            # Filters, sorts, limits and row numbers
+            return False
+        if any(expr != plan.quote(name) for name, expr in node.columns):
+            return False
+    return all(expr == plan.quote(name) for name, expr in state.columndict.items())
+
+def _catalog_cardinality(idadf):
+    """
+    Return the number of rows in an IdaDataFrame according to the statistics
+    of the catalog, or None if the IdaDataFrame is not its table or a
+    selection of its columns, or if the statistics of its table are not up
+    to date.
+    """
+    if not _selects_table_columns(idadf):
+        return None
+    return _catalog_table_cardinality(idadf)
+
+def _catalog_column_statistics(idadf, columns):
+    """
+    Return the number of distinct non-missing values and of missing values
+    of columns of an IdaDataFrame according to the statistics of the
+    catalog.
+
+    Returns
+    -------
+    DataFrame
+        Index is the columns whose statistics are up to date, column COLCARD
+        contains the number of distinct non-missing values and column
+        NUMNULLS the number of missing values. None if the IdaDataFrame is
+        not its table or a selection of its columns, or if the statistics of
+        its table are not up to date.
+    """
+    if _catalog_cardinality(idadf) is None:
+        return None
+    data = idadf.ida_query(("SELECT COLNAME, COLCARD, NUMNULLS FROM SYSCAT.COLUMNS " +
+                            "WHERE TABSCHEMA = '%s' AND TABNAME = '%s'")
+                           %(idadf.schema, idadf.tablename))
+    data = data.set_index(data.columns[0])
+    data.columns = ["COLCARD", "NUMNULLS"]
+    # -1 means that the statistic was not collected
+    data = data[(data["COLCARD"] >= 0) & (data["NUMNULLS"] >= 0)]
+    return data.loc[[column for column in columns if column in data.index]]
+
+def _catalog_percentiles(idadf, percentiles, columns):
+    """
+    Approximate percentiles with linear interpolation from the quantiles
+    kept in SYSCAT.COLDIST for the columns of a table, whose statistics are
+    up to date.
+
+    Returns
+    -------
+    tuple of dict
+        Percentiles of each column for which the catalog has quantiles and
+        their error, the largest difference between the fraction of the
+        rows below the returned value and the requested percentile.
+    """
+    quoted = ", ".join("'%s'"%column.replace("'", "''") for column in columns)
+    data = idadf.ida_query(("SELECT COLNAME, COLVALUE, VALCOUNT FROM SYSCAT.COLDIST " +
+                            "WHERE TABSCHEMA = '%s' AND TABNAME = '%s' AND TYPE = 'Q' " +
+                            "AND COLVALUE IS NOT NULL AND COLNAME IN (%s) " +
+                            "ORDER BY COLNAME, SEQNO")%(idadf.schema, idadf.tablename, quoted))
+    values = OrderedDict()
+    errors = OrderedDict()
+    for column, quantiles in data.groupby(data.columns[0], sort=False):
+        points = [float(str(value).strip("'")) for value in quantiles.iloc[:, 1]]
+        ranks = [float(rank) for rank in quantiles.iloc[:, 2]]
+        nb_not_missing = ranks[-1]
+        if nb_not_missing <= 0:
+            continue
+        # Gap between the ranks of two consecutive quantiles, in which the
+        # exact percentile lies
+        gaps = np.diff([0.0] + ranks)
+        values[column] = []
+        errors[column] = []
+        for percentile in percentiles:
+            rank = float(percentile)*(nb_not_missing - 1) + 1
+            values[column].append(float(np.interp(rank, ranks, points)))
+            position = min(int(np.searchsorted(ranks, rank)), len(ranks) - 1)
+            errors[column].append(gaps[position]/nb_not_missing)
+    return values, errors
+
+def _approximate_percentiles(idadf, percentiles, columns, error=0.01):
+    """
+    Approximate percentiles with linear interpolation over columns of an
+    IdaDataFrame, without sorting the whole data.
+
+    Parameters
+    ----------
+    idadf : IdaDataFrame
+    percentiles: Float or list of floats.
+        All values in percentiles must be > 0  and < 1
+    columns: String or list of string
+        Name of columns belonging to the IdaDataFrame.
+    error : float, default: 0.01
+        Largest acceptable difference between the fraction of the values
+        below a returned percentile and the requested percentile.
+
+    Returns
+    -------
+    tuple of DataFrame
+        The percentiles, in the format of _get_percentiles, and their error.
+
+    Notes
+    -----
+    For a table or a selection of its columns, percentiles are interpolated
+    between the quantiles kept in the catalog when its statistics are up to
+    date, for the columns whose catalog quantiles are close enough to each
+    other for the interpolation to stay within error. Otherwise, they are
+    computed over a Bernoulli sample of the rows sized after the
+    Dvoretzky-Kiefer-Wolfowitz inequality: with probability
+    _APPROXIMATION_CONFIDENCE, no percentile of the sample differs from the
+    one of the data by more than the reported error. Data that is not
+    larger than the sample is not sampled and the error is 0.
+    """
+    if isinstance(columns, six.string_types):
+        columns = [columns]
+    if isinstance(percentiles, Number):
+        percentiles = [percentiles]
+    columns = list(columns)
+    percentiles = list(percentiles)
+    if not 0 < error < 1:
+        raise ValueError("Argument 'error' should be between 0 and 1")
+
+    values = OrderedDict()
+    errors = OrderedDict()
+    if _catalog_cardinality(idadf) is not None:
+        values, errors = _catalog_percentiles(idadf, percentiles, columns)
+        # The catalog keeps few quantiles, 20 by default, which may be too
+        # coarse for the requested error
+        for column in list(values):
+            if any(value > error for value in errors[column]):
+                del values[column]
+                del errors[column]
+    remaining = [column for column in columns if column not in values]
+
+    if remaining:
+        log_term = math.log(2/(1 - _APPROXIMATION_CONFIDENCE))
+        sample_size = int(math.ceil(log_term/(2*error**2)))
+        nrow = idadf.shape[0]
+        if nrow <= sample_size:
+            data = _aggregate(idadf, percentiles, remaining)
+            for column in remaining:
+                values[column] = list(data[column])
+                errors[column] = [0.0]*len(percentiles)
+        else:
+            # Oversample a little so that the size of the sample, which is
+            # random, seldom falls under sample_size
+            rate = min(1.0, 1.1*sample_size/nrow)
+            if idadf.internal_state.views:
+                source = ("(SELECT * FROM %s WHERE RAND() < %.8f)"
+                          %(idadf.internal_state.current_state, rate))
             else:
-                tuplelist.append((i, i))
-                i += 1
-        unique = low + high
-        unique = set(unique)
-        unique = sorted(unique)
-        unique = [str(x) for x in unique]
-        indexes_string = ",".join(unique)
-        df = idadf.ida_query("(SELECT \""+column+"\" AS \""+column+"\" FROM (SELECT "+
-                        "ROW_NUMBER() OVER(ORDER BY \""+column+"\") as rn, \""+
-                        column + "\" FROM (SELECT * FROM " + name +
-                        ")) WHERE rn  in("+ indexes_string +"))")
-
-        #indexvalues = list(df[df.columns[0]])
-        indexvalues = list(df)
-        #import pdb ; pdb.set_trace()
-        #print(tuplelist)
-        #print(indexvalues)
-        indexfinal = [(float(str(indexvalues[x[0]]))+float(str(indexvalues[x[1]])))/2 for x in tuplelist]
-        new_data = pd.DataFrame(indexfinal)
-        data[column] = (new_data.T).values[0]
-
-    percentile_names = [x for x in percentiles]
-    data.index = percentile_names
-    return data
+                source = "%s TABLESAMPLE BERNOULLI(%.6f)"%(idadf.name, 100*rate)
+            data = _aggregate(idadf, ["count"] + percentiles, remaining, source)
+            for column in remaining:
+                column_data = list(data[column])
+                size = column_data[0]
+                values[column] = column_data[1:]
+                if size > 0:
+                    bound = math.sqrt(log_term/(2*size))
+                else:
+                    bound = 1.0
+                errors[column] = [bound]*len(percentiles)
+
+    values = pd.DataFrame(values, index=percentiles, columns=columns).astype(float)
+    errors = pd.DataFrame(errors, index=percentiles, columns=columns).astype(float)
+    return values, errors
 
 
 def _categorical_stats(idadf, stat, columns):
@@ -196,7 +628,7 @@ def _categorical_stats(idadf, stat, columns):
     # Calculates count, unique, top, freq
     raise NotImplementedError("TODO")
 
-def _get_number_of_nas(idadf, columns):
+def _get_number_of_nas(idadf, columns, fast=None):
     """
     Return the count of missing values for a list of columns in the IdaDataFrame.
 
@@ -205,6 +637,9 @@ def _get_number_of_nas(idadf, columns):
     idadf : IdaDataFrame
     columns : str or list
         One column as a string or a list of columns in the idaDataFrame.
+    fast : bool, optional
+        Whether the counts may be read from the statistics of the catalog
+        when they are up to date, see _use_catalog_statistics.
 
     Returns
     -------
@@ -212,21 +647,21 @@ def _get_number_of_nas(idadf, columns):
     """
     if isinstance(columns, six.string_types):
         columns = [columns]
-
-    name = idadf.internal_state.current_state
-
-    query_list = list()
-    for column in columns:
-        string = ("(SELECT COUNT(*) AS \"" + column + "\" FROM " +
-                name + " WHERE \"" + column + "\" IS NULL)")
-        query_list.append(string)
-
-    query_string = ', '.join(query_list)
-
-    # TODO: Improvement idea : Get nrow (shape) and substract by count("COLUMN")
-    return idadf.ida_query("SELECT * FROM " + query_string, first_row_only = True)
-
-def _count_level(idadf, columnlist=None):
+    columns = list(columns)
+
+    nas = OrderedDict()
+    if _use_catalog_statistics(idadf, fast):
+        stats = _catalog_column_statistics(idadf, columns)
+        if stats is not None:
+            for column in stats.index:
+                nas[column] = int(stats.loc[column, "NUMNULLS"])
+    remaining = [column for column in columns if column not in nas]
+    if remaining:
+        values = _aggregate(idadf, "nulls", remaining).loc["nulls"]
+        nas.update(zip(remaining, [int(value) for value in values]))
+    return tuple(nas[column] for column in columns)
+
+def _count_level(idadf, columnlist=None, fast=None):
     """
     Count distinct levels across a list of columns of an IdaDataFrame grouped
     by themselves.
@@ -237,6 +672,9 @@ def _count_level(idadf, columnlist=None):
     columnlist : list
         List of column names that exist in the IdaDataFrame. By default, these
         are all columns in IdaDataFrame.
+    fast : bool, optional
+        Whether the levels may be read from the statistics of the catalog
+        when they are up to date, see _use_catalog_statistics.
 
     Returns
     -------
@@ -252,6 +690,29 @@ def _count_level(idadf, columnlist=None):
     """
     if columnlist is None:
         columnlist = idadf.columns
+    columnlist = list(columnlist)
+    requested = columnlist
+
+    levels = OrderedDict()
+    if _use_catalog_statistics(idadf, fast):
+        stats = _catalog_column_statistics(idadf, columnlist)
+        if stats is not None:
+            for column in stats.index:
+                # Missing values make a level of their own when grouping
+                levels[column] = (int(stats.loc[column, "COLCARD"]) +
+                                  int(stats.loc[column, "NUMNULLS"] > 0))
+        columnlist = [column for column in columnlist if column not in levels]
+
+    # Distinct values of other columns may be equal once cast to DOUBLE
+    wide = _exact_in_double(idadf, _unpivoted_columns(idadf, columnlist))
+    if wide:
+        stats = _unpivot_aggregate(idadf, ["levels", "nulls"], wide)
+        for column in wide:
+            levels[column] = (int(stats.loc[column, "levels"]) +
+                              int(stats.loc[column, "nulls"] > 0))
+        columnlist = [column for column in columnlist if column not in levels]
+    if not columnlist:
+        return tuple(levels[column] for column in requested)
 
     name = idadf.internal_state.current_state
 
@@ -266,7 +727,11 @@ def _count_level(idadf, columnlist=None):
 
     query_string = ', '.join(query_list)
     column_string = '\"' + '\", \"'.join(columnlist) + '\"'
-    return idadf.ida_query("SELECT " + column_string + " FROM " + query_string, first_row_only = True)
+    counts = idadf.ida_query("SELECT " + column_string + " FROM " + query_string, first_row_only = True)
+    if not levels:
+        return counts
+    levels.update(zip(columnlist, counts))
+    return tuple(levels[column] for column in requested)
 
 def _count_level_groupby(idadf, columnlist=None):
     """
@@ -297,9 +762,8 @@ def _count_level_groupby(idadf, columnlist=None):
     name = idadf.internal_state.current_state
 
     column_string = '\"' + '\", \"'.join(columnlist) + '\"'
-    query = (("SELECT COUNT(*) FROM (SELECT %s, COUNT(*) as COUNT "+
-            "FROM %s GROUP BY %s ORDER BY %s, COUNT ASC)")
-            %(column_string, name, column_string, column_string))
+    query = ("SELECT COUNT(*) FROM (SELECT %s FROM %s GROUP BY %s)"
+             %(column_string, name, column_string))
     return idadf.ida_query(query, first_row_only = True)
 
 # TODO: REFACTORING: factors function should maybe return a tuple ?
@@ -436,6 +900,56 @@ def _factors_avg(idadf, columnlist, valuelist):
 ### Pivot Table
 ###############################################################################
 
+# Expression unpivoted from each value column and aggregate function applied
+# to it by _pivot_query, for each aggregation function of pivot_table
+_PIVOT_AGGREGATES = {
+    "count": ("CASE WHEN T.%s IS NULL THEN 0 ELSE 1 END", "SUM"),
+    "sum": ("CAST(T.%s AS DOUBLE)", "SUM"),
+    "avg": ("CAST(T.%s AS DOUBLE)", "AVG")}
+
+def _pivot_query(idadf, columns, values, aggfunc, limit=None):
+    """
+    Return the query computing a pivot table in its final, long shape: one
+    row per value column and combination of the levels of the columns,
+    ordered by value column and levels. The value columns are unpivoted
+    inside the database, so that all of them are aggregated by a single
+    GROUP BY.
+
+    Parameters
+    ----------
+    columns : list
+        Name of the columns whose levels are combined.
+    values : list or None
+        Name of the columns that are aggregated. If None, the rows of each
+        combination are counted.
+    aggfunc : str
+        count, sum or avg.
+    limit : int, optional
+        Maximum number of rows returned.
+
+    Returns
+    -------
+    str
+        The query returns the position of the value column in values (0 if
+        values is None), the levels and the aggregate.
+    """
+    factors = ", ".join("T.%s"%plan.quote(column) for column in columns)
+    name = idadf.internal_state.current_state
+    if values is None:
+        query = ("SELECT 0, %s, COUNT(*) FROM %s AS T GROUP BY %s ORDER BY %s"
+                 %(factors, name, factors, factors))
+    else:
+        expression, function = _PIVOT_AGGREGATES[aggfunc]
+        rows = ", ".join("(%s, %s)"%(position, expression%plan.quote(value))
+                         for position, value in enumerate(values))
+        query = ("SELECT U.VALPOS, %s, %s(U.VAL) FROM %s AS T, " +
+                 "LATERAL (VALUES %s) AS U(VALPOS, VAL) " +
+                 "GROUP BY U.VALPOS, %s ORDER BY U.VALPOS, %s")
+        query = query%(factors, function, name, rows, factors, factors)
+    if limit is not None:
+        query += " FETCH FIRST %s ROWS ONLY"%int(limit)
+    return query
+
 def pivot_table(idadf, values=None, columns=None, max_entries=1000, sort=None,
                 factor_threshold=None, interactive=False, aggfunc='count'):
     """
@@ -447,6 +961,9 @@ def pivot_table(idadf, values=None, columns=None, max_entries=1000, sort=None,
     if aggfunc.lower() not in ['count', 'sum', 'avg', 'average', 'mean']:
         print("For now only 'count' and 'sum' and 'mean' as aggregation function is supported")
         return
+    aggfunc = aggfunc.lower()
+    if aggfunc in ['average', 'mean']:
+        aggfunc = 'avg'
 
     if (columns is None) & (factor_threshold is None):
         print("Please provide parameter factor_threshold for automatic selection of columns")
@@ -458,39 +975,48 @@ def pivot_table(idadf, values=None, columns=None, max_entries=1000, sort=None,
     if isinstance(values, six.string_types):
         values = [values]
 
-    if (values is None) and (aggfunc.lower() != "count"):
+    if (values is None) and (aggfunc != "count"):
         raise ValueError("Cannot aggregate using another function than count if" +
                          "no value(s) was/were given")
 
     ####### Identify automatically categorical fields #########
-    # Load distinct count for each and evaluate categorical or not
-    data = idadf._table_def(factor_threshold) #
+    # Load distinct count for each and evaluate categorical or not, the
+    # numbers of levels are otherwise only needed for sorting and reporting
     if columns is None:
-        factors = data.loc[data['VALTYPE'] == "CATEGORICAL", ['TYPENAME', 'FACTORS']]
+        data = idadf._table_def(factor_threshold)
+        factors = data.loc[data['VALTYPE'] == "CATEGORICAL", 'FACTORS']
         if len(factors) == 0:
             print("No categorical columns to tabulate")
             return
+        print("Automatic selection of columns :", factors.index.values)
     else:
-        factors = data.loc[columns, ['TYPENAME', 'FACTORS']]
+        factors = None
+        if sort in ("factor", "factors"):
+            factors = pd.Series(_count_level(idadf, columns), index=columns)
 
+    categorical_columns = list(columns) if factors is None else list(factors.index)
     if sort == "alpha":
-        factors.sort_index(inplace=True, ascending=1)
-    elif sort == "factor":
-        factors.sort(['FACTORS'], inplace=True, ascending=1)
-
-    if columns is None:
-        print("Automatic selection of columns :", factors.index.values)
-        columns = factors.index.values
-
-    nb_row = _count_level_groupby(idadf, factors.index.values)[0] * len(columns)
-    nb_col = len(factors.index.values)
-
-    nb_entries = nb_row * nb_col
-
-    if nb_entries > max_entries: # Overflow risk
-        print("Number of entries :", nb_entries)
+        categorical_columns = sorted(categorical_columns)
+    elif sort in ("factor", "factors"):
+        categorical_columns = list(factors.loc[categorical_columns].sort_values(kind="mergesort").index)
+
+    # The entries are the combinations of levels times the number of
+    # columns, squared. The aggregation itself tells whether the table
+    # overflows, one more combination than allowed is enough to know it:
+    # each value column gets a block of rows with all the combinations.
+    max_combinations = max_entries // len(categorical_columns)**2
+    nb_values = 1 if values is None else len(values)
+    query = _pivot_query(idadf, categorical_columns, values, aggfunc,
+                         limit=(max_combinations + 1)*nb_values)
+    dataframe = idadf.ida_query(query)
+
+    if (dataframe.iloc[:, 0] == 0).sum() > max_combinations: # Overflow risk
+        if factors is None:
+            factors = pd.Series(_count_level(idadf, categorical_columns),
+                                index=categorical_columns)
+        print("Number of entries : more than", max_entries)
         print("Value counts for factors:")
-        factor_values = factors[['FACTORS']]
+        factor_values = factors.loc[categorical_columns].to_frame()
         factor_values.columns = ['']
         print(factor_values.T)
         print("WARNING :Attempt to make a table with more than " +
@@ -498,43 +1024,20 @@ def pivot_table(idadf, values=None, columns=None, max_entries=1000, sort=None,
               "parameter or remove columns with too many levels.")
         return
 
-    print("Output dataframe has dimensions", nb_row, "x", (nb_col+1))
+    print("Output dataframe has dimensions", len(dataframe), "x", (len(categorical_columns)+1))
     if interactive is True:
         display_yes = ibmdbpy.utils.query_yes_no("Do you want to download it in memory ?")
         if not display_yes:
             return
 
-    categorical_columns = list(factors.index)
-    if aggfunc.lower() == 'count':
-        dataframe = _factors_count(idadf, categorical_columns, values) # Download dataframe
-    if aggfunc.lower() == 'sum':
-        dataframe = _factors_sum(idadf, categorical_columns, values) # Download dataframe
-    if aggfunc.lower() in ['avg', 'average', 'mean']:
-        dataframe = _factors_avg(idadf, categorical_columns, values) # Download dataframe
-
     if values is not None:
         agg_values = values
-    else: agg_values = aggfunc.upper()
-
-    if isinstance(agg_values, six.string_types):
-        agg_values = [agg_values]
-    dataframe.columns = categorical_columns + agg_values # Name the aggregate column
-
-    # Formatting result
-    if len(agg_values) == 1:
-        dataframe[None] = agg_values[0]
-    else:
-        catdataframe = dataframe[categorical_columns]
-        dataframe = catdataframe.join(dataframe[agg_values].stack().reset_index(1))
-        dataframe['level_1'] = pd.Categorical(dataframe['level_1'], agg_values)
-        dataframe = dataframe.rename(columns={'level_1':None})
-        dataframe = dataframe.sort([None] + categorical_columns)
-
-    dataframe.set_index([None] + categorical_columns, inplace=True)
-    dataframe = dataframe.astype(float)
+    else: agg_values = [aggfunc.upper()]
 
-    result = pd.Series(dataframe[dataframe.columns[0]])
-    result.name = None
+    arrays = [[agg_values[int(position)] for position in dataframe.iloc[:, 0]]]
+    arrays += [list(dataframe.iloc[:, index + 1]) for index in range(len(categorical_columns))]
+    index = pd.MultiIndex.from_arrays(arrays, names=[None] + categorical_columns)
+    result = pd.Series(list(dataframe.iloc[:, -1]), index=index, dtype=float)
 
     return result
 
@@ -542,7 +1045,7 @@ def pivot_table(idadf, values=None, columns=None, max_entries=1000, sort=None,
 ### Descriptive statistics
 ###############################################################################
 
-def describe(idadf, percentiles=[0.25, 0.50, 0.75]):
+def describe(idadf, percentiles=[0.25, 0.50, 0.75], approx=False, error=0.01):
     """
     See IdaDataFrame.describe
     """
@@ -570,15 +1073,16 @@ def describe(idadf, percentiles=[0.25, 0.50, 0.75]):
             data.append(_categorical_stats(idadf, "top", columns))
             data.append(_categorical_stats(idadf, "freq", columns))
     else:
-        data.append(_numeric_stats(idadf, "count", columns))
-        data.append(_numeric_stats(idadf, "mean", columns))
-        data.append(_numeric_stats(idadf, "std", columns))
-        data.append(_numeric_stats(idadf, "min", columns))
-        if percentiles is not None:
-            perc = (_get_percentiles(idadf, percentiles, columns))
-            for tup in perc.itertuples(index=False):
-                data.append(tup)
-        data.append(_numeric_stats(idadf, "max", columns))
+        # Moments, extrema and percentiles are all computed in one scan
+        if approx:
+            data = _aggregate(idadf, ["count", "mean", "std", "min", "max"], columns)
+            if percentiles is not None:
+                perc, perc_error = _approximate_percentiles(idadf, percentiles,
+                                                            columns, error)
+                data = pd.concat([data.iloc[:4], perc, data.iloc[4:]])
+        else:
+            stats = ["count", "mean", "std", "min"] + list(percentiles or []) + ["max"]
+            data = _aggregate(idadf, stats, columns)
 
     data = pd.DataFrame(data)
     data.columns = columns
@@ -587,6 +1091,9 @@ def describe(idadf, percentiles=[0.25, 0.50, 0.75]):
     else:
         percentile_names = []
     data.index = ['count', 'mean', 'std', 'min'] + percentile_names + ['max']
+    if approx and percentiles is not None:
+        # Largest error of the approximate percentiles of each column
+        data.loc['error'] = perc_error.max().values
 
     # quick fix -> JDBC problems
     #for column in data.columns:
@@ -598,7 +1105,48 @@ def describe(idadf, percentiles=[0.25, 0.50, 0.75]):
     return data
 
 
-def quantile(idadf, q=0.5):
+def agg(idadf, func):
+    """
+    See IdaDataFrame.agg
+    """
+    if isinstance(func, dict):
+        requested = OrderedDict()
+        for column, stats in func.items():
+            if isinstance(stats, six.string_types):
+                stats = [stats]
+            requested[column] = list(stats)
+    else:
+        stats = [func] if isinstance(func, six.string_types) else list(func)
+        if set(stats) <= set(["count", "nulls", "min", "max", "levels"]):
+            columns = list(idadf.columns)
+        else:
+            columns = idadf._get_numerical_columns()
+        requested = OrderedDict((column, stats) for column in columns)
+
+    for column in requested:
+        if column not in idadf.columns:
+            raise KeyError("Column %s does not exist in %s"%(column, idadf.name))
+
+    if isinstance(func, dict):
+        items = [(stat, column) for column, stats in requested.items() for stat in stats]
+        values = iter(_aggregate_items(idadf, items))
+        index = []
+        data = OrderedDict()
+        for column, stats in requested.items():
+            data[column] = OrderedDict((stat, next(values)) for stat in stats)
+            index.extend(stat for stat in stats if stat not in index)
+        result = pd.DataFrame(data, index=index, columns=list(requested))
+    else:
+        result = _aggregate(idadf, stats, list(requested))
+
+    if isinstance(func, six.string_types):
+        result = pd.Series(list(result.loc[func]), index=result.columns, name=func)
+    if isinstance(idadf, ibmdbpy.IdaSeries) and not isinstance(func, dict):
+        result = result[idadf.column]
+
+    return result
+
+def quantile(idadf, q=0.5, interpolation="linear", approx=False, error=0.01):
     """
     See IdaDataFrame.quantile
     """
@@ -612,14 +1160,28 @@ def quantile(idadf, q=0.5):
                         "a list of numbers between 0 and 1")
     elif True in [((x >= 1) | (x <= 0)) for x in q]:
         raise ValueError("Numbers in argument 'percentiles' should be between 0 and 1")
+    if approx and interpolation != "linear":
+        raise ValueError("Approximate quantiles are only available with " +
+                         "a linear interpolation")
 
     columns = idadf._get_numerical_columns()
     if not columns:
         print(idadf.name + " has no numeric columns")
         return
 
-    result = _get_percentiles(idadf, q, columns)
+    if approx:
+        result, result_error = _approximate_percentiles(idadf, q, columns, error)
+        return _format_quantile(result, q), _format_quantile(result_error, q)
 
+    result = _get_percentiles(idadf, q, columns, interpolation)
+    return _format_quantile(result, q)
+
+def _format_quantile(result, q):
+    """
+    Format the percentiles returned by _get_percentiles as the result of
+    quantile: a DataFrame for several quantiles, a Series for a single one,
+    a scalar for a single one of a single column.
+    """
     if isinstance(q, list):
         if len(q) > 1:
             return result
@@ -634,6 +1196,313 @@ def quantile(idadf, q=0.5):
 
     return result
 
+###############################################################################
+### Moments
+###############################################################################
+
+class _Moments(object):
+    """
+    Moments of a list of column expressions over the rows of a state: the
+    number of non-missing values, the sums, the sums of squares and the sums
+    of products, all pairwise over the rows in which both expressions are
+    not missing, from which covariances and correlations are derived as in
+    pandas. The moments are those of the expressions minus a shift, a value
+    close to their values chosen by _moment_shifts, which covariances and
+    correlations do not depend on.
+
+    Attributes
+    ----------
+    expressions : list of str
+        Column expressions, as in the columndict of an InternalState.
+    count : numpy.ndarray
+        count[i, j] is the number of rows in which expressions i and j are
+        not missing.
+    sums : numpy.ndarray
+        sums[i, j] is the sum of shifted expression i over the rows in which
+        expressions i and j are not missing.
+    squares : numpy.ndarray
+        squares[i, j] is the sum of the squares of shifted expression i over
+        the rows in which expressions i and j are not missing.
+    products : numpy.ndarray
+        products[i, j] is the sum of the products of shifted expressions i
+        and j.
+    """
+    def __init__(self, expressions, count, sums, squares, products):
+        self.expressions = list(expressions)
+        self.count = count
+        self.sums = sums
+        self.squares = squares
+        self.products = products
+
+    def subset(self, expressions):
+        """
+        Moments of some of the expressions, or None if they are not all
+        known.
+        """
+        if not set(expressions) <= set(self.expressions):
+            return None
+        positions = [self.expressions.index(expr) for expr in expressions]
+        grid = np.ix_(positions, positions)
+        return _Moments(expressions, self.count[grid], self.sums[grid],
+                        self.squares[grid], self.products[grid])
+
+    def covariance(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = (self.products - self.sums*self.sums.T/self.count)/(self.count - 1)
+        cov[self.count < 2] = np.nan
+        return cov
+
+    def correlation(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Variances over the rows in which both expressions are present
+            var = (self.squares - self.sums**2/self.count)/(self.count - 1)
+            corr = self.covariance()/np.sqrt(var*var.T)
+        np.fill_diagonal(corr, 1.0)
+        return corr
+
+# Number of rows over which the shifts of the moments are estimated
+_SHIFT_SAMPLE_ROWS = 1000
+
+def _moments_source(idadf):
+    """
+    Return the query or table the column expressions of an IdaDataFrame
+    refer to, and the key under which their moments are cached.
+    """
+    state = idadf.internal_state
+    rows = plan.without_sort(state.plan)
+    if not plan.lineage(rows):
+        return state.name, state.name
+    query = plan.render(rows, state.name)
+    return "(%s)"%query, query
+
+def _column_expressions(idadf, columns):
+    """
+    Expressions of columns of an IdaDataFrame, over the rows of its plan.
+    """
+    return [idadf.internal_state.columndict[column] for column in columns]
+
+def _cached_moments(idadf, expressions):
+    """
+    Return the moments of column expressions of an IdaDataFrame if they were
+    already computed for its current state, None otherwise.
+    """
+    _, key = _moments_source(idadf)
+    cached = idadf.internal_state._table_info.get("moments", {}).get(key)
+    if cached is None:
+        return None
+    return cached.subset(expressions)
+
+def _moment_shifts(idadf, expressions, source):
+    """
+    Return a value close to the values of each column expression of an
+    IdaDataFrame: its mean over the first _SHIFT_SAMPLE_ROWS rows of source,
+    or 0 if it has no value there.
+
+    Moments are computed over the expressions minus these values, so that
+    the sums of products and the products of sums they are derived from do
+    not cancel each other out when the mean of an expression is large
+    compared to its spread, such as timestamps or identifiers.
+    """
+    sample = "(SELECT * FROM %s FETCH FIRST %s ROWS ONLY)"%(source, _SHIFT_SAMPLE_ROWS)
+    items = ["AVG(CAST(%s AS DOUBLE))"%expr for expr in expressions]
+    shifts = _select_first_row(idadf, items, sample)
+    return [0.0 if pd.isnull(shift) else float(shift) for shift in shifts]
+
+def _moments(idadf, expressions):
+    """
+    Return the moments of numerical column expressions of an IdaDataFrame,
+    see _column_expressions, computed in one scan, chunked within the limits
+    of the select list, and cached for the rows of the current state of the
+    IdaDataFrame.
+
+    Pairwise counts, sums and sums of squares are computed in a second scan
+    only if some columns have missing values, and only for the pairs that
+    involve them. The expressions are shifted beforehand, see
+    _moment_shifts.
+
+    Returns
+    -------
+    _Moments
+    """
+    moments = _cached_moments(idadf, expressions)
+    if moments is not None:
+        return moments
+
+    source, key = _moments_source(idadf)
+    size = len(expressions)
+    # The E notation makes the shifts DOUBLE literals
+    values = ["(CAST(%s AS DOUBLE) - %.17E)"%(expr, shift)
+              for expr, shift in zip(expressions, _moment_shifts(idadf, expressions, source))]
+    pairs = list(itertools.combinations_with_replacement(range(size), 2))
+
+    items = ["COUNT(*)"]
+    items += ["COUNT(%s)"%expr for expr in expressions]
+    items += ["SUM(%s)"%value for value in values]
+    items += ["SUM(%s*%s)"%(values[i], values[j]) for i, j in pairs]
+    result = iter(_select_first_row(idadf, items, source))
+
+    nrow = next(result)
+    counts = np.array([next(result) for _ in range(size)], dtype=float)
+    sums = np.array([next(result) for _ in range(size)], dtype=float)
+    products = np.zeros((size, size))
+    for i, j in pairs:
+        products[i, j] = products[j, i] = next(result)
+
+    count = np.minimum.outer(counts, counts)
+    count[np.logical_and.outer(counts < nrow, counts < nrow)] = np.nan
+    np.fill_diagonal(count, counts)
+    sum_matrix = np.repeat(sums[:, None], size, axis=1)
+    squares = np.repeat(np.diag(products)[:, None], size, axis=1)
+
+    nullable = [i for i in range(size) if counts[i] < nrow]
+    if nullable:
+        items = []
+        both = [(i, j) for i, j in itertools.combinations(nullable, 2)]
+        for i, j in both:
+            items.append("SUM(CASE WHEN %s IS NOT NULL AND %s IS NOT NULL THEN 1 ELSE 0 END)"
+                         %(expressions[i], expressions[j]))
+        present = [(i, j) for j in nullable for i in range(size) if i != j]
+        for i, j in present:
+            condition = "CASE WHEN %s IS NOT NULL THEN %%s END"%expressions[j]
+            items.append("SUM(%s)"%(condition%values[i]))
+            items.append("SUM(%s)"%(condition%("%s*%s"%(values[i], values[i]))))
+        result = iter(_select_first_row(idadf, items, source))
+        for i, j in both:
+            count[i, j] = count[j, i] = next(result)
+        for i, j in present:
+            sum_matrix[i, j] = next(result)
+            squares[i, j] = next(result)
+        # Missing sums of a column without values are 0, not NULL
+        sum_matrix = np.nan_to_num(sum_matrix)
+        squares = np.nan_to_num(squares)
+
+    moments = _Moments(expressions, count, sum_matrix, squares, np.nan_to_num(products))
+    cache = idadf.internal_state._table_info.setdefault("moments", {})
+    previous = cache.get(key)
+    if previous is None or len(previous.expressions) <= size:
+        cache[key] = moments
+    return moments
+
+class _GroupedMoments(object):
+    """
+    Moments of numerical columns within the classes of a target column,
+    from which within-class variances and class means are derived. The
+    class of the rows with a missing target is kept, under a NaN label, so
+    that the number of rows and the overall means are derived as well.
+
+    Attributes
+    ----------
+    size : Series
+        Number of rows of each class.
+    count : DataFrame
+        Number of non-missing values of each column in each class.
+    mean : DataFrame
+        Mean of each column in each class.
+    var : DataFrame
+        Sample variance of each column in each class.
+    """
+    def __init__(self, size, count, mean, var):
+        self.size = size
+        self.count = count
+        self.mean = mean
+        self.var = var
+
+    def _classes(self):
+        """
+        Mask of the classes that are values of the target column.
+        """
+        return np.array([not pd.isnull(label) for label in self.size.index], dtype=bool)
+
+    def total(self):
+        """
+        Number of rows.
+        """
+        return int(self.size.sum())
+
+    def class_size(self):
+        return self.size[self._classes()]
+
+    def class_mean(self):
+        return self.mean[self._classes()]
+
+    def overall_mean(self):
+        """
+        Mean of each column over all rows, whatever their class.
+        """
+        counts = self.count.sum()
+        return (self.count*self.mean.fillna(0)).sum()/counts
+
+    def within_class_var(self):
+        """
+        Sum of the squared deviations of each column from the mean of its
+        class, divided by the number of rows minus the number of classes.
+        """
+        classes = self._classes()
+        squares = ((self.count[classes] - 1)*self.var[classes]).fillna(0).sum()
+        nrow = self.total()
+        nclass = int(classes.sum())
+        if nrow == nclass:
+            nrow += 1
+        return squares/(nrow - nclass)
+
+def _grouped_moments(idadf, target, features):
+    """
+    Compute the moments of numerical columns of an IdaDataFrame within the
+    classes of a target column in one scan. All the columns are aggregated
+    by a single GROUP BY, which groups their unpivoted values by class and
+    column when they would not fit in the select list.
+
+    Parameters
+    ----------
+    idadf : IdaDataFrame
+    target : str
+        Column whose values are the classes.
+    features : list of str
+        Numerical columns of idadf.
+
+    Returns
+    -------
+    _GroupedMoments
+    """
+    features = list(features)
+    stats = ["count", "mean", "var"]
+    key = plan.quote(target)
+
+    if 2 + len(stats)*len(features) <= _MAX_SELECT_ITEMS:
+        items = [key, "COUNT(*)"]
+        items += [_aggregate_expression(stat, feature) for feature in features
+                  for stat in stats]
+        data = idadf.ida_query("SELECT %s FROM %s GROUP BY %s"
+                               %(", ".join(items), idadf.internal_state.current_state, key))
+        labels = list(data.iloc[:, 0])
+        size = np.array(data.iloc[:, 1], dtype=float)
+        values = np.array(data.iloc[:, 2:], dtype=float)
+        values = values.reshape(len(data), len(features), len(stats))
+    else:
+        items = ["T.%s"%key, "\"COLNAME\"", "COUNT(*)"]
+        items += [_aggregate_expression(stat, "VAL") for stat in stats]
+        query = ("SELECT %s FROM %s GROUP BY T.%s, \"COLNAME\""
+                 %(", ".join(items), _unpivot_source(idadf, features), key))
+        data = idadf.ida_query(query)
+        # Missing classes are indexed under None, since NaN != NaN
+        classes = OrderedDict()
+        for label in data.iloc[:, 0]:
+            classes.setdefault(None if pd.isnull(label) else label, len(classes))
+        positions = dict((feature, position) for position, feature in enumerate(features))
+        labels = [np.nan if label is None else label for label in classes]
+        size = np.zeros(len(classes))
+        values = np.full((len(classes), len(features), len(stats)), np.nan)
+        for row in data.itertuples(index=False):
+            row = list(row)
+            klass = classes[None if pd.isnull(row[0]) else row[0]]
+            size[klass] = row[2]
+            values[klass, positions[row[1]]] = np.array(row[3:], dtype=float)
+
+    index = pd.Index(labels)
+    frames = [pd.DataFrame(values[:, :, position], index=index, columns=features)
+              for position in range(len(stats))]
+    return _GroupedMoments(pd.Series(size, index=index), *frames)
+
 # Note : Not casting to double can lead to SQL overflow
 # TODO: Has to be modified in ibmdbR
 
@@ -649,42 +1518,8 @@ def cov(idadf, other = None):
         print(idadf.name + " has less than two numeric columns")
         return
 
-    tuple_count = _numeric_stats(idadf, 'count', columns)
-    count_dict = dict((x, int(y)) for x, y in zip(columns, tuple_count))
-
-    agg_list = []
-
-    combinations = [x for x in itertools.combinations_with_replacement(columns, 2)]
-    columns_set = [{x[0], x[1]} for x in combinations]
-
-    for column_pair in combinations:
-        agg_list.append("COVARIANCE(\"" + column_pair[0] + "\",\"" +
-                        column_pair[1] + "\")*(" +
-                        str(min([count_dict[column_pair[0]],
-                                 count_dict[column_pair[1]]])) + ".0/" +
-                        str(min([count_dict[column_pair[0]],
-                                 count_dict[column_pair[1]]])-1) + ".0)")
-
-    agg_string = ', '.join(agg_list)
-
-    name = idadf.internal_state.current_state
-
-    data = idadf.ida_query("SELECT %s FROM %s"%(agg_string, name), first_row_only = True)
-
-    tuple_list = []
-
-    for column1 in columns:
-        list_value = []
-        for column2 in columns:
-            for index, column_set in enumerate(columns_set):
-                if {column1, column2} == column_set:
-                    list_value.append(data[index])
-                    break
-        tuple_list.append(tuple(list_value))
-
-    result = pd.DataFrame(tuple_list)
-    result.index = columns
-    result.columns = columns
+    moments = _moments(idadf, _column_expressions(idadf, columns))
+    result = pd.DataFrame(moments.covariance(), index=columns, columns=columns)
 
     if len(result) == 1:
         result = result[0]
@@ -721,64 +1556,45 @@ def corr(idadf, features=None,ignore_indexer=True):
     #if target not in columns:
     #    raise ValueError("%s is not a column of numerical type in %s"%(target, idadf.name))
 
-    values = OrderedDict()
-
-    combinations = [x for x in itertools.combinations(features, 2)]
-    #columns_set = [{x[0], x[1]} for x in combinations]
-
-    if len(features) < 64: # the limit of variables for an SQL statement is 4096, i.e 64^2
-        agg_list = []
-        for column_pair in combinations:
-            agg = "CORRELATION(\"%s\",\"%s\")"%(column_pair[0], column_pair[1])
-            agg_list.append(agg)
-
-        agg_string = ', '.join(agg_list)
-
-        name = idadf.internal_state.current_state
+    moments = _moments(idadf, _column_expressions(idadf, features))
+    result = pd.DataFrame(moments.correlation(), index=features, columns=features)
+    if len(result) == 1:
+        result = result[0]
 
-        data = idadf.ida_query("SELECT %s FROM %s"%(agg_string, name), first_row_only = True)
+    return result
 
-        for i, element in enumerate(combinations):
-            if element[0] not in values:
-                values[element[0]] = {}
-            if element[1] not in values:
-                values[element[1]] = {}
-            values[element[0]][element[1]] = data[i]
-            values[element[1]][element[0]] = data[i]
+def corrwith(idadf, other):
+    """
+    See IdaDataFrame.corrwith
+    """
+    if not isinstance(other, ibmdbpy.IdaDataFrame):
+        raise TypeError("Argument 'other' should be an IdaDataFrame or an IdaSeries")
+    if ((other.schema, other.tablename) != (idadf.schema, idadf.tablename) or
+            _moments_source(other)[1] != _moments_source(idadf)[1]):
+        raise ValueError("Argument 'other' should contain columns of the rows " +
+                         "of %s"%idadf.name)
 
-        result = pd.DataFrame(values).fillna(1)
+    columns = idadf._get_numerical_columns()
+    other_columns = other._get_numerical_columns()
+    if isinstance(other, ibmdbpy.IdaSeries):
+        if not other_columns:
+            raise TypeError("Correlation-based measure not available for " +
+                            "non-numerical columns %s"%other.column)
+        pairs = [(column, other_columns[0]) for column in columns]
     else:
-        chunkgen = chunklist(combinations, 100)
-
-        for chunk in chunkgen:
-            agg_list = []
-            for column_pair in chunk:
-                agg = "CORRELATION(\"%s\",\"%s\")"%(column_pair[0], column_pair[1])
-                agg_list.append(agg)
+        pairs = [(column, column) for column in columns if column in other_columns]
 
-            agg_string = ', '.join(agg_list)
+    left = _column_expressions(idadf, [x for x, _ in pairs])
+    right = _column_expressions(other, [y for _, y in pairs])
+    expressions = []
+    for expr in left + right:
+        if expr not in expressions:
+            expressions.append(expr)
 
-            name = idadf.internal_state.current_state
-
-            data = idadf.ida_query("SELECT %s FROM %s"%(agg_string, name), first_row_only = True)
-
-            for i, element in enumerate(chunk):
-                if element[0] not in values:
-                    values[element[0]] = OrderedDict()
-                if element[1] not in values:
-                    values[element[1]] = OrderedDict()
-                values[element[0]][element[1]] = data[i]
-                values[element[1]][element[0]] = data[i]
-
-        result = pd.DataFrame(values).fillna(1)
-
-    result = result.reindex(result.columns)
-    if len(result) == 1:
-        result = result[0]
-
-    return result
-
-### corrwith
+    correlation = _moments(idadf, expressions).correlation()
+    values = [correlation[expressions.index(x), expressions.index(y)]
+              for x, y in zip(left, right)]
+    return pd.Series(values, index=[x for x, _ in pairs], dtype=float)
 
 
 def mad(idadf):
@@ -790,15 +1606,14 @@ def mad(idadf):
         print(idadf.name + " has less than two numeric columns")
         return
 
-    mean_tuple = _numeric_stats(idadf, "mean", columns)
-    absmean_dict = dict((x, abs(y)) for x, y in zip(columns, mean_tuple))
-    tuple_na = _get_number_of_nas(idadf, columns)
+    stats = _aggregate(idadf, ["mean", "count"], columns)
+    absmean_dict = dict((x, abs(y)) for x, y in zip(columns, stats.loc["mean"]))
 
     agg_list = []
-    for index_col, column in enumerate(columns):
+    for column in columns:
         agg_list.append("SUM(ABS(\"" + column + "\" -" +
                         str(absmean_dict[column]) + "))/" +
-                        str(idadf.shape[0] - tuple_na[index_col]))
+                        str(stats.loc["count", column]))
 
     agg_string = ', '.join(agg_list)
 
@@ -818,9 +1633,9 @@ def ida_min(idadf):
     """
     See idadataFrame.min
     """
-    na_tuple = _get_number_of_nas(idadf, idadf.columns)
-    min_tuple = _numeric_stats(idadf, "min", idadf.columns)
-    if not hasattr(min_tuple,"__iter__") : min_tuple = (min_tuple,) # dirty fix
+    stats = _aggregate(idadf, ["nulls", "min"], idadf.columns)
+    na_tuple = tuple(stats.loc["nulls"])
+    min_tuple = tuple(stats.loc["min"])
     min_list = [np.nan if ((y > 0) and not isinstance(x, Number))
                 else x for x, y in zip(min_tuple, na_tuple)]
     min_tuple = tuple(min_list)
@@ -836,9 +1651,9 @@ def ida_max(idadf):
     """
     See idadataFrame.max
     """
-    na_tuple = _get_number_of_nas(idadf, idadf.columns)
-    max_tuple = _numeric_stats(idadf, "max", idadf.columns)
-    if not hasattr(max_tuple,"__iter__") : max_tuple = (max_tuple,) # dirty fix
+    stats = _aggregate(idadf, ["nulls", "max"], idadf.columns)
+    na_tuple = tuple(stats.loc["nulls"])
+    max_tuple = tuple(stats.loc["max"])
     max_list = [np.nan if ((y > 0) and not isinstance(x, Number))
                 else x for x, y in zip(max_tuple, na_tuple)]
     max_tuple = tuple(max_list)
@@ -864,11 +1679,11 @@ def count(idadf):
 
     return result
 
-def count_distinct(idadf):
+def count_distinct(idadf, fast=None):
     """
     See IdaDataFrame.count_distinct
     """
-    result = pd.Series(_count_level(idadf))
+    result = pd.Series(_count_level(idadf, fast=fast))
     result.index = idadf.columns
     result = result.astype(int)
 
@@ -94,6 +94,12 @@ class Test_ConnexionManagement(object):
         idadb_tmp.reconnect()
         assert(isinstance(idadb_tmp.show_tables(), pandas.DataFrame))
 
+    def test_idadb_check_connection_probe(self, idadb_tmp):
+        idadb_tmp.liveness_ttl = 0
+        assert(idadb_tmp._ping())
+        idadb_tmp._check_connection()
+        assert(isinstance(idadb_tmp.ida_query("VALUES 1", first_row_only=True), tuple))
+
 
 class Test_UploadDataFrame(object):
 
@@ -126,6 +132,45 @@ class Test_UploadDataFrame(object):
         idadb.drop_table("TEST_AS_IDADF_18729493954_23849590")
         idadb.drop_table("DUMMY.TEST_AS_IDADF_18729493954_23849590")
 
+    def test_idadb_as_idadataframe_special_characters(self, idadb):
+        df = pandas.DataFrame({"A": [1, 2, 3], "B": ["it's", "back\\slash", None]})
+        ida = idadb.as_idadataframe(df, "TEST_AS_IDADF_SPECIAL_9684030283", clear_existing = True)
+        downloaded_df = ida.as_dataframe().sort_values("A")
+        assert(list(downloaded_df["B"])[:2] == ["it's", "back\\slash"])
+        assert(downloaded_df["B"].isnull().sum() == 1)
+        assert(idadb._bulk_insert in [True, False])
+        idadb.drop_table("TEST_AS_IDADF_SPECIAL_9684030283")
+
+    def test_idadb_append_parallel(self, idadb, df):
+        ida = idadb.as_idadataframe(df, "TEST_APPEND_PARALLEL_2948573920", clear_existing = True)
+        idadb.append(ida, df, maxnrow=20, parallel=3)
+        assert(ida.shape == (2*df.shape[0], df.shape[1]))
+        assert(idadb.last_upload["failures"] == {})
+        idadb.drop_table("TEST_APPEND_PARALLEL_2948573920")
+
+    def test_idadb_upload_stream(self, idadb, df):
+        chunks = (df.iloc[start:start + 40] for start in range(0, len(df), 40))
+        ida = idadb.upload_stream(chunks, "TEST_UPLOAD_STREAM_6029384756", clear_existing = True)
+        assert(all(ida.columns == df.columns))
+        assert(ida.shape == df.shape)
+        idadb.drop_table("TEST_UPLOAD_STREAM_6029384756")
+
+    def test_idadb_upload_stream_wide_types(self, idadb):
+        # The first chunk fits in REAL and SMALLINT, the second one does not
+        chunks = [pandas.DataFrame({"X": [0.5, 1.25], "N": [1, 2]}, columns=["X", "N"]),
+                  pandas.DataFrame({"X": [0.1, 1e300], "N": [2**40, 3]}, columns=["X", "N"])]
+        ida = idadb.upload_stream(chunks, "TEST_UPLOAD_STREAM_6029384758", clear_existing = True)
+        downloaded = ida.as_dataframe()
+        assert(sorted(downloaded["X"]) == [0.1, 0.5, 1.25, 1e300])
+        assert(sorted(downloaded["N"]) == [1, 2, 3, 2**40])
+        idadb.drop_table("TEST_UPLOAD_STREAM_6029384758")
+
+    def test_idadb_upload_stream_mismatching_columns(self, idadb, df):
+        chunks = [df.iloc[:10], df.iloc[10:20, 1:]]
+        with pytest.raises(ValueError):
+            idadb.upload_stream(chunks, "TEST_UPLOAD_STREAM_6029384757", clear_existing = True)
+        idadb.drop_table("TEST_UPLOAD_STREAM_6029384757")
+
     def test_idadb_ida_query(self, idadb, idadf):
         query = "SELECT * FROM %s FETCH FIRST 5 ROWS ONLY"%idadf.name
         df = idadb.ida_query(query)
@@ -133,6 +178,20 @@ class Test_UploadDataFrame(object):
         assert(len(idadf.columns) == len(df.columns))
         assert(len(df) == 5)
 
+    def test_idadb_ida_query_chunksize(self, idadb, idadf):
+        query = "SELECT * FROM %s"%idadf.name
+        chunks = list(idadb.ida_query(query, chunksize=40))
+        assert(all(isinstance(chunk,pandas.DataFrame) for chunk in chunks))
+        assert(all(len(chunk) <= 40 for chunk in chunks))
+        assert(sum(len(chunk) for chunk in chunks) == idadf.shape[0])
+
+    def test_idadb_ida_query_empty_result(self, idadb, idadf):
+        query = "SELECT * FROM %s WHERE 1 = 0"%idadf.name
+        df = idadb.ida_query(query)
+        assert(isinstance(df,pandas.DataFrame))
+        assert(list(df.columns) == list(idadf.columns))
+        assert(len(df) == 0)
+
     def test_idadb_ida_query_first_row_only(self, idadb, idadf, df):
         query = "SELECT * FROM %s FETCH FIRST 5 ROWS ONLY"%idadf.name
         downloaded_df = idadb.ida_query(query, first_row_only=True)
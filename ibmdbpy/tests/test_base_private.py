@@ -93,6 +93,15 @@ class Test_IdaDataBase_PrivateMethods(object):
         assert(idadb.exists_table("CREATE_TABLE_TEST_585960708904") == 1)
         idadb.drop_table("CREATE_TABLE_TEST_585960708904")
 
+    def test_idadb_create_table_dtype(self, idadb, df):
+        try : idadb.drop_table("CREATE_TABLE_TEST_585960708905")
+        except : pass
+        column = str(df.columns[0])
+        idadb._create_table(df, "CREATE_TABLE_TEST_585960708905", dtype={column: "VARCHAR(100)"})
+        ida = IdaDataFrame(idadb, "CREATE_TABLE_TEST_585960708905")
+        assert(ida.dtypes.loc[column, "TYPENAME"] == "VARCHAR")
+        idadb.drop_table("CREATE_TABLE_TEST_585960708905")
+
     def test_idadb_create_view(self, idadb, df):
         try : idadb.drop_table("CREATE_VIEW_TEST_585960708904")
         except: pass
@@ -104,6 +113,15 @@ class Test_IdaDataBase_PrivateMethods(object):
         idadb.drop_table("CREATE_VIEW_TEST_585960708904")
         idadb.drop_view("VIEW_TEST_585960708904")
 
+    def test_idadb_register_state(self, idadb, idadf):
+        name = idadb._register_state("SELECT * FROM %s"%idadf.name)
+        try:
+            count = idadb.ida_scalar_query("SELECT CAST(COUNT(*) AS INTEGER) FROM %s"%name)
+            assert(count == idadf.shape[0])
+        finally:
+            idadb._unregister_state(name)
+        assert(name not in idadb._states)
+
     # Make test when it fails too
     def test_idadb_insert_into_database(self, idadb, df):
         try : idadb.drop_table("INSERT_TEST_585960708904")
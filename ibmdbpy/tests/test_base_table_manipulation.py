@@ -173,6 +173,25 @@ class Test_TableManipulation(object):
         assert("ID" not in idadf_tmp_new.columns)
         assert("ID" not in idadf_tmp_new._get_all_columns_in_table())
 
+    def test_idadb_add_column_id_destructive_filtered(self, idadb, idadf_tmp):
+        column = idadf_tmp._get_numerical_columns()[0]
+        filtered = idadf_tmp[idadf_tmp[column] >= idadf_tmp[column].min()]
+        assert(list(filtered._get_all_columns_in_table()) == list(idadf_tmp.columns))
+        idadb.add_column_id(filtered, "ID", destructive = True)
+        assert("ID" in filtered._get_all_columns_in_table())
+        idadf_tmp_new = IdaDataFrame(idadb, idadf_tmp._name, indexer = "ID")
+        assert("ID" in idadf_tmp_new._get_all_columns_in_table())
+
+    def test_idadb_delete_column_destructive_filtered(self, idadb, idadf_tmp):
+        column = idadf_tmp._get_numerical_columns()[0]
+        filtered = idadf_tmp[idadf_tmp[column] >= idadf_tmp[column].min()]
+        to_delete = [col for col in filtered.columns if col != column][0]
+        idadb.delete_column(filtered, to_delete, destructive = True)
+        assert(to_delete not in filtered.columns)
+        assert(to_delete not in filtered._get_all_columns_in_table())
+        idadf_tmp_new = IdaDataFrame(idadb, idadf_tmp._name)
+        assert(to_delete not in idadf_tmp_new._get_all_columns_in_table())
+
     def test_idadb_delete_column_non_destructive(self, idadb, idadf_tmp):
         to_delete = idadf_tmp.columns[0]
         idadb.delete_column(idadf_tmp, to_delete, destructive = False)
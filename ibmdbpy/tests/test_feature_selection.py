@@ -21,6 +21,7 @@ from builtins import zip
 from future import standard_library
 standard_library.install_aliases()
 
+import numpy
 import pandas
 import pytest
 
@@ -318,6 +319,20 @@ class Test_Entropy(object):
         if len(idadf.columns) >= 1:
             result = entropy(idadf, target = idadf.columns[0])
             assert(isinstance(result, float))
+            
+    def test_entropy_accuracy(self, idadf, df):
+        if len(idadf.columns) > 1:
+            result = entropy(idadf)
+            for column in idadf.columns:
+                counts = df[column].value_counts(dropna=False).values.astype(float)
+                frequencies = counts/counts.sum()
+                expected = -(frequencies*numpy.log2(frequencies)).sum()
+                assert(numpy.isclose(result[column], expected))
+                
+    def test_entropy_filtered(self, idadf):
+        column = idadf.columns[0]
+        filtered = idadf[idadf[column] == idadf[column].min()]
+        assert(numpy.isclose(entropy(filtered, target = column), 0))
     
 class Test_Information_Gain(object):
 
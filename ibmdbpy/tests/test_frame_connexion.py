@@ -30,6 +30,13 @@ class Test_Import(object):
         assert list(tmp.index) == list(idadf.index)
         assert tmp.name == idadf.tablename
 
+    def test_idadf_iter_batches(self, idadf):
+        batches = list(idadf.iter_batches(batch_size=40))
+        assert all(isinstance(batch, pandas.core.frame.DataFrame) for batch in batches)
+        assert all(len(batch) <= 40 for batch in batches)
+        assert sum(len(batch) for batch in batches) == idadf.shape[0]
+        assert all(list(batch.columns) == list(idadf.columns) for batch in batches)
+
 class Test_ConnexionManagement(object):
     def test_idadf_save_as(self, idadf):
         pass
@@ -47,6 +47,21 @@ class Test_IdaDataFrame_PrivateMethods(object):
     def test_idadf_get_columns_dtypes(self, idadf):
         pass
 
+    def test_idadf_dtypes_inferred(self, idadf):
+        columns = idadf._get_numerical_columns()[:2]
+        newidadf = idadf[columns] * 2
+        inferred = newidadf.internal_state._infer_dtypes()
+        assert inferred is not None
+        from_catalog = newidadf._get_columns_dtypes_in_view()
+        assert list(inferred.index) == list(from_catalog.index)
+        assert list(inferred["TYPENAME"]) == list(from_catalog["TYPENAME"])
+
+    def test_idadf_shape_without_count(self, idadf):
+        nrow = idadf.shape[0]
+        newidadf = idadf[idadf.columns[:2]].loc[2:5]
+        assert newidadf.internal_state._count_rows() == min(4, max(nrow - 2, 0))
+        assert newidadf.shape[0] == len(newidadf.as_dataframe())
+
     def test_idadf_table_def(self, idadf):
         to_assert = idadf._table_def()
         assert isinstance(to_assert, pandas.core.frame.DataFrame)
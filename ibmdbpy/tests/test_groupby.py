@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------
+# Copyright (c) 2015, IBM Corp.
+# All rights reserved.
+#
+# Distributed under the terms of the BSD Simplified License.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#-----------------------------------------------------------------------------
+
+"""
+Test module for IdaGroupBy
+"""
+
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from builtins import object
+from future import standard_library
+standard_library.install_aliases()
+
+import numpy
+import pandas
+import pytest
+
+from ibmdbpy import IdaSeries
+from ibmdbpy.groupby import IdaGroupBy
+
+def _key_and_values(idadf):
+    """
+    A categorical column of idadf to group by and its numerical columns.
+    """
+    data = idadf._table_def(20)
+    keys = list(data.loc[data['VALTYPE'] == "CATEGORICAL"].index)
+    if not keys:
+        pytest.skip("No categorical column to group by")
+    values = [column for column in idadf._get_numerical_columns()
+              if column != keys[0]]
+    return keys[0], values
+
+class Test_IdaGroupBy(object):
+
+    def test_idadf_groupby(self, idadf):
+        key, _ = _key_and_values(idadf)
+        assert isinstance(idadf.groupby(key), IdaGroupBy)
+        with pytest.raises(KeyError):
+            idadf.groupby("NOTEXISTING_COLUMN_455849820205")
+        with pytest.raises(ValueError):
+            idadf.groupby(key, subtotals="grouping sets")
+
+    def test_idadf_groupby_agg(self, idadf, df):
+        key, values = _key_and_values(idadf)
+        result = idadf.groupby(key)[values].agg(["mean", "max", "count"])
+        expected = df.groupby(key)[values].agg(["mean", "max", "count"])
+        assert list(result.index) == list(expected.index)
+        assert list(result.columns) == list(expected.columns)
+        assert numpy.allclose(result.astype(float), expected.astype(float))
+
+    def test_idadf_groupby_agg_series(self, idadf, df):
+        key, values = _key_and_values(idadf)
+        result = idadf.groupby(key)[values[0]].mean()
+        assert isinstance(result, pandas.Series)
+        assert numpy.allclose(result, df.groupby(key)[values[0]].mean())
+
+    def test_idadf_groupby_size(self, idadf, df):
+        key, _ = _key_and_values(idadf)
+        result = idadf.groupby(key).size()
+        assert list(result) == list(df.groupby(key).size())
+
+    def test_idadf_groupby_chunksize(self, idadf, df):
+        key, _ = _key_and_values(idadf)
+        chunks = list(idadf.groupby(key).size(chunksize=2))
+        assert all(len(chunk) <= 2 for chunk in chunks)
+        assert sum(chunk.sum() for chunk in chunks) == len(df)
+
+    def test_idadf_groupby_rollup(self, idadf, df):
+        key, values = _key_and_values(idadf)
+        result = idadf.groupby(key, subtotals="rollup").size()
+        assert result.loc["All"] == len(df)
+        assert len(result) == df[key].nunique() + 1
+
+    def test_idadf_groupby_transform(self, idadf, df):
+        key, values = _key_and_values(idadf)
+        result = idadf.groupby(key)[values[0]].transform("mean")
+        assert isinstance(result, IdaSeries)
+        downloaded = result.as_dataframe()
+        expected = df.groupby(key)[values[0]].mean()
+        assert numpy.allclose(sorted(numpy.ravel(downloaded.values)),
+                              sorted(df[key].map(expected)))
+        with pytest.raises(ValueError):
+            idadf.groupby(key).transform("levels")
@@ -19,6 +19,9 @@ from __future__ import absolute_import
 from future import standard_library
 standard_library.install_aliases()
 
+from copy import deepcopy
+
+from ibmdbpy.internals import ColumnMap
 
 class Test_internals(object):
     def test_internals_init(idadf):
@@ -35,3 +38,19 @@ class Test_internals(object):
 
     def test_internals_stop_cumulating(idadf):
         pass
+
+class Test_ColumnMap(object):
+    def test_columnmap_copy_on_write(self):
+        columndict = ColumnMap([("A", '"A"'), ("B", '"B"')])
+        copy = deepcopy(columndict)
+        copy["C"] = '("A" + 1)'
+        del copy["A"]
+        assert(columndict.items() == [("A", '"A"'), ("B", '"B"')])
+        assert(copy.items() == [("B", '"B"'), ("C", '("A" + 1)')])
+
+    def test_columnmap_delete_while_iterating(self):
+        columndict = ColumnMap([("A", '"A"'), ("B", '"B"'), ("C", '"C"')])
+        for column in columndict.keys():
+            if column != "B":
+                del columndict[column]
+        assert(columndict.keys() == ["B"])
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------
+# Copyright (c) 2015, IBM Corp.
+# All rights reserved.
+#
+# Distributed under the terms of the BSD Simplified License.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#-----------------------------------------------------------------------------
+
+"""
+Test module for the logical plans of IdaDataFrames
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from builtins import object
+from future import standard_library
+standard_library.install_aliases()
+
+import pytest
+
+from ibmdbpy import plan
+
+def _projection():
+    return plan.Project(plan.Scan(), [("A", '"A"'), ("B2", '("B" * 2)'), ("C", '"C"')])
+
+class Test_Expressions(object):
+
+    def test_plan_references(self):
+        assert(plan.references("(\"A\" + 'x\"B\"') * \"C\"\"D\"") == set(["A", 'C"D']))
+
+    def test_plan_substitute(self):
+        expr = plan.substitute("(\"B2\" > 4) AND \"C\" = '\"B2\"'", {"B2": '("B" * 2)', "C": "UPPER(\"C\")"})
+        assert(expr == "((\"B\" * 2) > 4) AND (UPPER(\"C\")) = '\"B2\"'")
+
+    def test_plan_immutable(self):
+        node = _projection()
+        with pytest.raises(AttributeError):
+            node.columns = ()
+
+class Test_Render(object):
+
+    def test_plan_render_merges_projections(self):
+        node = plan.Project(_projection(), [("B4", '("B2" * 2)')])
+        assert(plan.render(node, "T") == 'SELECT (("B" * 2) * 2) AS "B4" FROM T')
+
+    def test_plan_render_pushes_filter(self):
+        node = plan.Filter(_projection(), '("B2" > 4)')
+        assert(plan.render(node, "T") ==
+               'SELECT "A", ("B" * 2) AS "B2", "C" FROM T WHERE (("B" * 2) > 4)')
+
+    def test_plan_render_sort(self):
+        node = plan.Sort(plan.Filter(_projection(), '("A" > 0)'), ["B2"], ascending=False)
+        assert(plan.render(node, "T").endswith(' WHERE ("A" > 0) ORDER BY "B2" DESC'))
+
+    def test_plan_render_row_number(self):
+        node = plan.Sort(_projection(), ["A"])
+        node = plan.Filter(plan.RowNumber(node, "RN"), '"RN" BETWEEN 0 AND 9')
+        node = plan.Project(node, [("A", '"A"')])
+        query = plan.render(node, "T")
+        assert(query == 'SELECT "A" FROM (SELECT "A", (ROW_NUMBER() OVER(ORDER BY "A" ASC)-1) AS "RN" FROM T) ' +
+                        'WHERE "RN" BETWEEN 0 AND 9 ORDER BY "A" ASC')
+
+    def test_plan_render_window_not_folded(self):
+        node = plan.Project(plan.Scan(), [("ID", "((ROW_NUMBER() OVER())-1)"), ("A", '"A"')])
+        node = plan.Filter(node, '("ID" < 3)')
+        assert(plan.render(node, "T") ==
+               'SELECT * FROM (SELECT ((ROW_NUMBER() OVER())-1) AS "ID", "A" FROM T) WHERE ("ID" < 3)')
+
+    def test_plan_render_limit(self):
+        node = plan.Filter(plan.Limit(plan.Scan(), 5), '("A" > 0)')
+        assert(plan.render(node, "T") == 'SELECT * FROM (SELECT * FROM T FETCH FIRST 5 ROWS ONLY) WHERE ("A" > 0)')
+
+    def test_plan_without_sort(self):
+        node = plan.Filter(plan.Sort(_projection(), ["A"]), '("A" > 0)')
+        assert(" ORDER BY " in plan.render(node, "T"))
+        assert(" ORDER BY " not in plan.render(plan.without_sort(node), "T"))
+        assert(plan.output_names(node) == ["A", "B2", "C"])
+
+class Test_Types(object):
+
+    def test_plan_arithmetic_type(self):
+        assert(plan.arithmetic_type("SMALLINT", "SMALLINT") == "INTEGER")
+        assert(plan.arithmetic_type("INTEGER", "BIGINT") == "BIGINT")
+        assert(plan.arithmetic_type("BIGINT", "DECIMAL") == "DECIMAL")
+        assert(plan.arithmetic_type("REAL", "REAL") == "REAL")
+        assert(plan.arithmetic_type("REAL", "INTEGER") == "DOUBLE")
+        assert(plan.arithmetic_type("VARCHAR", "INTEGER") is None)
+
+    def test_plan_expression_type(self):
+        types = {"A": "SMALLINT", "B": "DOUBLE", "G": "ST_MULTIPOLYGON"}
+        assert(plan.expression_type('(FLOOR("A"/2) + 1.5)', types) == "DECIMAL")
+        assert(plan.expression_type('( POWER("A",2))', types) == "INTEGER")
+        assert(plan.expression_type('( MOD("B",2) )', types) == "DOUBLE")
+        assert(plan.expression_type('CAST("A" AS DOUBLE PRECISION)', types) == "DOUBLE")
+        assert(plan.expression_type("DB2GSE.ST_AREA(\"G\",'KILOMETER')", types) == "DOUBLE")
+        assert(plan.expression_type("((ROW_NUMBER() OVER())-1)", types) == "BIGINT")
+        assert(plan.expression_type('UPPER("A")', types) is None)
+        assert(plan.expression_type('"C"', types) is None)
+
+    def test_plan_output_types(self):
+        node = plan.RowNumber(plan.Filter(_projection(), '("A" > 0)'), "RN")
+        types = plan.output_types(node, {"A": "INTEGER", "B": "REAL", "C": "VARCHAR"})
+        assert(list(types.items()) == [("A", "INTEGER"), ("B2", "DOUBLE"),
+                                       ("C", "VARCHAR"), ("RN", "BIGINT")])
+
+class Test_Cardinality(object):
+
+    def test_plan_cardinality_kept(self):
+        node = plan.Sort(_projection(), ["A"])
+        assert(plan.cardinality(node, 150) == (150, 150))
+        assert(plan.cardinality(node) == (None, None))
+
+    def test_plan_cardinality_bounded(self):
+        node = plan.Filter(plan.RowNumber(_projection(), "RN"), '"RN" BETWEEN 10 AND 19',
+                           range(10, 20))
+        assert(plan.cardinality(node, 150) == (10, 10))
+        assert(plan.cardinality(node, 15) == (5, 5))
+        assert(plan.cardinality(node) == (None, 10))
+        assert(plan.cardinality(plan.Limit(plan.Filter(_projection(), '"A" > 0'), 5), 150) == (None, 5))
+        assert(plan.cardinality(plan.Limit(node, 0)) == (None, 0))
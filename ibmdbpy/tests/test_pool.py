@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------
+# Copyright (c) 2015, IBM Corp.
+# All rights reserved.
+#
+# Distributed under the terms of the BSD Simplified License.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#-----------------------------------------------------------------------------
+
+"""
+Test module for the connection pool
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from builtins import object
+from future import standard_library
+standard_library.install_aliases()
+
+import threading
+
+import pandas
+import pytest
+
+import ibmdbpy
+from ibmdbpy.pool import ConnectionPool
+from ibmdbpy.exceptions import IdaDataBaseError
+
+class FakeConnection(object):
+    def __init__(self):
+        self.closed = False
+        self.valid = True
+    def close(self):
+        self.closed = True
+
+class Test_ConnectionPool(object):
+
+    def test_pool_checkout_checkin(self):
+        pool = ConnectionPool(FakeConnection, 2)
+        con = pool.checkout()
+        pool.checkin(con)
+        assert(pool.checkout() is con)
+        assert(len(pool) == 1)
+
+    def test_pool_warm_up(self):
+        pool = ConnectionPool(FakeConnection, 3)
+        pool.warm_up()
+        assert(len(pool) == 3)
+
+    def test_pool_timeout(self):
+        pool = ConnectionPool(FakeConnection, 1)
+        pool.checkout()
+        with pytest.raises(IdaDataBaseError):
+            pool.checkout(timeout=0.1)
+
+    def test_pool_validation(self):
+        pool = ConnectionPool(FakeConnection, 1, validate=lambda con: con.valid,
+                              validate_after=0)
+        con = pool.checkout()
+        con.valid = False
+        pool.checkin(con)
+        new_con = pool.checkout()
+        assert(new_con is not con)
+        assert(con.closed)
+
+    def test_pool_idle_eviction(self):
+        pool = ConnectionPool(FakeConnection, 3, idle_timeout=0)
+        pool.warm_up()
+        con = pool.checkout()
+        pool.checkin(con)
+        assert(len(pool) == 1)
+
+    def test_pool_close(self):
+        pool = ConnectionPool(FakeConnection, 2)
+        con = pool.checkout()
+        pool.close()
+        pool.checkin(con)
+        assert(con.closed)
+        with pytest.raises(IdaDataBaseError):
+            pool.checkout()
+
+class Test_PooledIdaDataBase(object):
+
+    def test_idadb_pool_parallel_queries(self, request, idadf):
+        jdbc = request.config.getoption('--jdbc')
+        if jdbc != '':
+            idadb = ibmdbpy.IdaDataBase(dsn=jdbc, autocommit=False, pool_size=3)
+        else:
+            idadb = ibmdbpy.IdaDataBase(dsn=request.config.getoption('--dsn'),
+                                        uid=request.config.getoption('--uid'),
+                                        pwd=request.config.getoption('--pwd'),
+                                        autocommit=False, pool_size=3)
+        results = []
+        def work():
+            results.append(idadb.ida_scalar_query("SELECT COUNT(*) FROM %s"%idadf.name))
+        threads = [threading.Thread(target=work) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert(len(results) == 6)
+        assert(len(set(results)) == 1)
+        assert(len(idadb._pool) <= 3)
+        assert(isinstance(idadb.show_tables(), pandas.DataFrame))
+        idadb.close()
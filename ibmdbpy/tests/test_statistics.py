@@ -26,7 +26,7 @@ import numpy
 import pandas
 import pytest
 
-from ibmdbpy.statistics import _numeric_stats , _get_percentiles, _get_number_of_nas, _count_level, _count_level_groupby
+from ibmdbpy.statistics import _aggregate, _catalog_column_statistics, _unpivot_aggregate, _grouped_moments, _numeric_stats , _get_percentiles, _get_number_of_nas, _count_level, _count_level_groupby
 from ibmdbpy import IdaDataFrame as IDADF
 
 class Test_PrivateStatisticsMethods(object):
@@ -55,6 +55,63 @@ class Test_PrivateStatisticsMethods(object):
     def test_idadf_numeric_stats_accuracy(self, idadf):
         pass
 
+    def test_idadf_aggregate(self, idadf):
+        data = idadf._table_def()
+        columns = list(data.loc[data['VALTYPE'] == "NUMERIC"].index)
+        stats = ["count", "nulls", "mean", "std", "var", "min", "max", "sum"]
+        result = _aggregate(idadf, stats, columns)
+        assert list(result.index) == stats
+        assert list(result.columns) == columns
+        df = idadf[columns].as_dataframe()
+        for stat in ["count", "mean", "std", "var", "min", "max", "sum"]:
+            assert numpy.allclose(result.loc[stat].astype(float),
+                                  getattr(df, stat)().astype(float))
+        assert list(result.loc["nulls"]) == list(df.isnull().sum())
+
+    def test_idadf_unpivot_aggregate(self, idadf):
+        data = idadf._table_def()
+        columns = list(data.loc[data['VALTYPE'] == "NUMERIC"].index)
+        stats = ["count", "nulls", "mean", "std", "min", "max", "levels", 0.5]
+        result = _unpivot_aggregate(idadf, stats, columns)
+        assert list(result.index) == columns
+        assert list(result.columns) == stats
+        expected = _aggregate(idadf, stats, columns)
+        for stat in stats:
+            assert numpy.allclose(result[stat].astype(float),
+                                  expected.loc[stat].astype(float))
+
+    def test_idadf_aggregate_unpivot_bigint(self, idadb):
+        # Enough columns to be unpivoted, BIGINT values which DOUBLE rounds
+        big = [2**53 + 1, 2**53 + 3, 2**53 + 5]
+        df = pandas.DataFrame(dict(("X%s"%position, [0.5, 1.5, 2.5])
+                                   for position in range(100)))
+        df["BIG"] = big
+        idadf = idadb.as_idadataframe(df, "TEST_UNPIVOT_BIGINT_5930284", clear_existing = True)
+        result = _aggregate(idadf, ["min", "max", "sum", "levels", "mean"], list(df.columns))
+        assert int(result.loc["min", "BIG"]) == min(big)
+        assert int(result.loc["max", "BIG"]) == max(big)
+        assert int(result.loc["sum", "BIG"]) == sum(big)
+        assert result.loc["levels", "BIG"] == 3
+        assert _count_level(idadf)[-1] == 3
+        idadb.drop_table("TEST_UNPIVOT_BIGINT_5930284")
+
+    def test_idadf_grouped_moments(self, idadf, df):
+        data = idadf._table_def(20)
+        targets = list(data.loc[data['VALTYPE'] == "CATEGORICAL"].index)
+        columns = [column for column in data.loc[data['VALTYPE'] == "NUMERIC"].index
+                   if column not in targets]
+        if not targets or not columns:
+            return
+        moments = _grouped_moments(idadf, targets[0], columns)
+        groups = df.groupby(targets[0])
+        assert moments.total() == len(df)
+        assert list(moments.class_size().sort_index()) == list(groups.size())
+        assert numpy.allclose(moments.class_mean().sort_index(), groups[columns].mean())
+        assert numpy.allclose(moments.overall_mean(), df[columns].mean())
+        squares = groups[columns].apply(lambda group: ((group - group.mean())**2).sum()).sum()
+        assert numpy.allclose(moments.within_class_var(),
+                              squares/(len(df) - groups.ngroups))
+
     def test_idadf_get_percentiles_default(self, idadf):
         data = idadf._table_def() # We necessarly have to put the test under this condition
         columns = list(data.loc[data['VALTYPE'] == "NUMERIC"].index)
@@ -67,6 +124,15 @@ class Test_PrivateStatisticsMethods(object):
     def test_idadf_get_percentiles_accuracy(self, idadf):
         pass
 
+    def test_idadf_get_percentiles_interpolation(self, idadf, df):
+        columns = idadf._get_numerical_columns()
+        for interpolation in ["linear", "lower", "higher", "midpoint", "nearest"]:
+            result = _get_percentiles(idadf, [0.1, 0.5, 0.73], columns, interpolation)
+            expected = df[columns].quantile([0.1, 0.5, 0.73], interpolation=interpolation)
+            assert numpy.allclose(result.values, expected.values.astype(float))
+        with pytest.raises(ValueError):
+            _get_percentiles(idadf, 0.5, columns, "cubic")
+
     def test_idadf_get_categorical_stats(self, idadf):
         # FUNCTION TO IMPLEMENT
         pass
@@ -89,6 +155,29 @@ class Test_PrivateStatisticsMethods(object):
     def test_idadf_count_level_accuracy(self, idadf):
         pass
 
+    def test_idadf_count_level_fast(self, idadf):
+        # The catalog is only used when the statistics are up to date, the
+        # exact counts are returned otherwise
+        fast = _count_level(idadf, fast=True)
+        assert len(fast) == len(idadf.columns)
+        assert all(x >= 0 for x in fast)
+        assert _count_level(idadf[idadf.columns[:1]], fast=True) == _count_level(idadf[idadf.columns[:1]])
+        assert len(_get_number_of_nas(idadf, idadf.columns, fast=True)) == len(idadf.columns)
+
+    def test_idadf_count_level_fast_selection(self, idadb, idadf_tmp):
+        # Collect the statistics of the table so that the catalog is used for
+        # the selections of its columns, but not for a filtered state
+        idadb._prepare_and_execute("CALL SYSPROC.ADMIN_CMD('RUNSTATS ON TABLE %s')"
+                                   %idadf_tmp.name)
+        columns = list(idadf_tmp.columns[:2])
+        selection = idadf_tmp[columns]
+        stats = _catalog_column_statistics(selection, columns)
+        assert stats is not None
+        assert list(stats.index) == columns
+        assert _count_level(selection, fast=True) == _count_level(selection)
+        assert _catalog_column_statistics(idadf_tmp[columns[0]], columns[:1]) is not None
+        assert _catalog_column_statistics(idadf_tmp[0:5], columns) is None
+
     def test_idadf_count_level_groupby(self, idadf):
         assert isinstance(_count_level_groupby(idadf), tuple)
         assert(_count_level_groupby(idadf)[0] % 1 == 0)
@@ -109,8 +198,16 @@ class Test_PrivateStatisticsMethods(object):
 
 class Test_DescriptiveStatistics(object):
 
-    def test_idadf_pivot_table(self, idadf):
-        pass
+    def test_idadf_pivot_table(self, idadf, df):
+        data = idadf._table_def(20)
+        columns = list(data.loc[data['VALTYPE'] == "CATEGORICAL"].index)
+        if not columns:
+            return
+        result = idadf.pivot_table(columns=columns[0], max_entries=len(df) + 1)
+        expected = df.groupby(columns[0]).size()
+        assert list(result.index.names) == [None, columns[0]]
+        assert set(result.index.get_level_values(0)) == set(["COUNT"])
+        assert list(result.values) == [float(x) for x in expected.values]
 
     def test_idadf_describe_default(self, idadf):
         to_assert = idadf.describe()
@@ -136,6 +233,23 @@ class Test_DescriptiveStatistics(object):
     def test_idadf_quantile_custom(self, idadf, df):
         assert all(idadf.quantile([0.2,0.4,0.6,0.8]) == df.quantile([0.2,0.4,0.6,0.8]))
 
+    def test_idadf_quantile_approx(self, idadf, df):
+        columns = idadf._get_numerical_columns()
+        result, error = idadf.quantile([0.25, 0.75], approx=True, error=0.05)
+        assert result.shape == error.shape == (2, len(columns))
+        assert ((error >= 0) & (error <= 1)).all().all()
+        # Catalog quantiles coarser than the requested error are not used,
+        # and data smaller than the sample is not sampled
+        _, error = idadf.quantile([0.25, 0.75], approx=True, error=0.01)
+        assert (error <= 0.01).all().all()
+        with pytest.raises(ValueError):
+            idadf.quantile(0.5, interpolation="lower", approx=True)
+
+    def test_idadf_describe_approx(self, idadf):
+        to_assert = idadf.describe(approx=True)
+        assert list(to_assert.index) == ["count", "mean", "std", "min",
+                                         "25%", "50%", "75%", "max", "error"]
+
     def test_idadf_quantile_value_out_of_range(self, idadf):
         with pytest.raises(ValueError):
             idadf.quantile([5])
@@ -154,6 +268,36 @@ class Test_DescriptiveStatistics(object):
     def test_idadf_corr(self, idadf, df):
         assert str(idadf.corr()) == str(df.corr())
 
+    def test_idadf_cov_large_mean(self, idadb):
+        # Sums of products of values around 1e9 cancel out unless shifted
+        x = 1e9 + numpy.arange(100) % 7
+        df = pandas.DataFrame({"X": x, "Y": x + numpy.arange(100) % 3})
+        idadf = idadb.as_idadataframe(df, "TEST_COV_LARGE_MEAN_4958302", clear_existing = True)
+        assert numpy.allclose(idadf.cov(), df.cov())
+        assert numpy.allclose(idadf.corr(), df.corr())
+        assert "moments" in idadf.internal_state._table_info
+        idadf.clear_cache()
+        assert "moments" not in idadf.internal_state._table_info
+        idadb.drop_table("TEST_COV_LARGE_MEAN_4958302")
+
+    def test_idadf_agg(self, idadf, df):
+        columns = idadf._get_numerical_columns()
+        result = idadf.agg(["mean", "min", "max"])
+        expected = df[columns].agg(["mean", "min", "max"])
+        assert list(result.index) == ["mean", "min", "max"]
+        assert numpy.allclose(result[columns].astype(float), expected.astype(float))
+        assert numpy.allclose(idadf.agg("sum"), df[columns].sum())
+        assert idadf.agg({columns[0]: ["count", "nulls"]}).shape == (2, 1)
+
+    def test_idadf_corrwith(self, idadf, df):
+        columns = idadf._get_numerical_columns()
+        result = idadf.corrwith(idadf[columns[0]])
+        expected = df[columns].corrwith(df[columns[0]])
+        assert list(result.index) == columns
+        assert numpy.allclose(result, expected)
+        with pytest.raises(ValueError):
+            idadf.corrwith(idadf.loc[[0, 1, 2]])
+
     def test_idadf_mad(self, idadf, df):
         assert str(idadf.mad()) == str(df.mad())
 
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------
+# Copyright (c) 2015, IBM Corp.
+# All rights reserved.
+#
+# Distributed under the terms of the BSD Simplified License.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#-----------------------------------------------------------------------------
+
+"""
+Test module for the encoding of uploaded dataframes
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+from builtins import object
+from future import standard_library
+standard_library.install_aliases()
+
+import decimal
+
+import numpy as np
+import pandas
+import pytest
+
+from ibmdbpy import upload
+
+def _sample_dataframe():
+    return pandas.DataFrame({"A": [1, 2, 3],
+                             "B": [1.5, np.nan, 3.0],
+                             "C": ["it's", None, "c"],
+                             "D": [True, None, False],
+                             "E": pandas.to_datetime(["2016-01-01 00:00:00", None, "2016-01-03 10:00:00"])},
+                            columns=["A", "B", "C", "D", "E"])
+
+class Test_ColumnEncoding(object):
+
+    def test_column_kinds(self):
+        kinds = upload.column_kinds(_sample_dataframe())
+        assert(kinds == [upload.NUMERIC, upload.NUMERIC, upload.STRING,
+                         upload.BOOLEAN, upload.DATETIME])
+
+    def test_encode_literals(self):
+        df = _sample_dataframe()
+        literals = upload.encode_literals(df, upload.column_kinds(df))
+        assert(literals == "(1,1.5,'it''s',1,'2016-01-01 00:00:00')," +
+                           "(2,NULL,NULL,NULL,NULL)," +
+                           "(3,3.0,'c',0,'2016-01-03 10:00:00')")
+
+    def test_encode_parameters(self):
+        df = _sample_dataframe()
+        parameters = upload.encode_parameters(df, upload.column_kinds(df))
+        assert(parameters == [(1, 1.5, "it's", 1, "2016-01-01 00:00:00"),
+                              (2, None, None, None, None),
+                              (3, 3.0, "c", 0, "2016-01-03 10:00:00")])
+        assert(type(parameters[0][0]) is int)
+
+class Test_ColumnTypes(object):
+
+    def test_column_types(self):
+        df = pandas.DataFrame({"SMALL": [1, 2, 3],
+                               "LARGE": [1, 2**40, 3],
+                               "SINGLE": [0.5, 1.25, np.nan],
+                               "DOUBLE": [0.1, 0.2, 0.3],
+                               "TEXT": ["a", "abcdefghijkl", None],
+                               "DAY": pandas.to_datetime(["2016-01-01", "2016-01-02", None]),
+                               "PRICE": [decimal.Decimal("1.23"), decimal.Decimal("-100.5"), None]},
+                              columns=["SMALL", "LARGE", "SINGLE", "DOUBLE", "TEXT", "DAY", "PRICE"])
+        types = upload.column_types(df, upload.column_kinds(df))
+        assert(types == ["SMALLINT", "BIGINT", "REAL", "DOUBLE", "VARCHAR(24)",
+                         "DATE", "DECIMAL(5,2)"])
+
+    def test_column_types_wide(self):
+        df = pandas.DataFrame({"SMALL": [1, 2, 3],
+                               "SINGLE": [0.5, 1.25, np.nan],
+                               "TEXT": ["a", "abcdefghijkl", None],
+                               "DAY": pandas.to_datetime(["2016-01-01", "2016-01-02", None])},
+                              columns=["SMALL", "SINGLE", "TEXT", "DAY"])
+        types = upload.column_types(df, upload.column_kinds(df), narrow=False)
+        assert(types == ["BIGINT", "DOUBLE", "VARCHAR(255)", "TIMESTAMP"])
+        types = upload.column_types(df, upload.column_kinds(df), dtype={"SINGLE": "REAL"},
+                                    narrow=False)
+        assert(types[1] == "REAL")
+
+    def test_column_types_override(self):
+        df = _sample_dataframe()
+        types = upload.column_types(df, upload.column_kinds(df), dtype={"C": "CLOB(1M)"})
+        assert(types[2] == "CLOB(1M)")
+        with pytest.raises(ValueError):
+            upload.column_types(df, upload.column_kinds(df), dtype={"Z": "INTEGER"})
+
+class Test_ChunkSizeController(object):
+
+    def test_controller_grows_while_throughput_improves(self):
+        controller = upload.ChunkSizeController(1000, 100)
+        controller.record(1000, 1.0)
+        assert(controller.chunksize == 2000)
+        controller.record(2000, 1.0)
+        assert(controller.chunksize == 4000)
+
+    def test_controller_reverses_when_throughput_degrades(self):
+        controller = upload.ChunkSizeController(1000, 100)
+        controller.record(1000, 1.0)
+        controller.record(2000, 4.0)
+        assert(controller.chunksize < 2000)
+        assert(controller.summary()["chunksize"] == 1000)
+
+    def test_controller_statement_size_limit(self):
+        controller = upload.ChunkSizeController(10**6, 100, bulk=False)
+        assert(controller.chunksize * 100 <= upload.MAX_STATEMENT_BYTES)
+        controller.bulk = True
+        assert(controller.maximum * 100 <= upload.MAX_BATCH_BYTES)
+        assert(controller.maximum > controller.chunksize)
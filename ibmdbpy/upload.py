@@ -0,0 +1,591 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------
+# Copyright (c) 2015, IBM Corp.
+# All rights reserved.
+#
+# Distributed under the terms of the BSD Simplified License.
+#
+# The full license is in the LICENSE file, distributed with this software.
+#-----------------------------------------------------------------------------
+
+"""
+Column-wise encoding of pandas DataFrames for uploads into the database.
+
+The kind of each column (boolean, numeric, datetime or string) is inferred
+once per upload, then whole columns are rendered at once, either as SQL
+literals or as parameters to be bound to an INSERT statement.
+"""
+
+# Python 2 compatibility
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import division
+from __future__ import absolute_import
+from builtins import zip
+from future import standard_library
+standard_library.install_aliases()
+
+import decimal
+import threading
+
+import numpy as np
+import six
+
+from ibmdbpy.pool import ConnectionPool
+
+# Maximum length of an SQL statement in Db2
+MAX_STATEMENT_BYTES = 2097152
+# Maximum amount of data bound to a single executemany call
+MAX_BATCH_BYTES = 16777216
+
+# Maximum length of a VARCHAR column in Db2, longer strings are stored as CLOB
+MAX_VARCHAR_BYTES = 32672
+# Maximum precision of a DECIMAL column in Db2
+MAX_DECIMAL_PRECISION = 31
+
+BOOLEAN = "boolean"
+NUMERIC = "numeric"
+DECIMAL = "decimal"
+DATE = "date"
+DATETIME = "datetime"
+STRING = "string"
+
+def column_kinds(dataframe):
+    """
+    Infer how each column of a DataFrame is encoded for the database.
+
+    Parameters
+    ----------
+    dataframe : DataFrame
+        Data to be uploaded.
+
+    Returns
+    -------
+    list of str
+        For each column, one of BOOLEAN, NUMERIC, DECIMAL, DATE, DATETIME or
+        STRING.
+
+    Notes
+    -----
+    Object columns that contain only booleans, 0 or 1 and missing values are
+    stored as booleans, that is as SMALLINT columns containing 0 or 1.
+    Datetime columns whose values are all at midnight are stored as dates.
+    """
+    return [_column_kind(dataframe[column]) for column in dataframe.columns]
+
+def _column_kind(series):
+    """
+    Infer the kind of a single column. See column_kinds.
+    """
+    dtype = series.dtype
+    if not isinstance(dtype, np.dtype):
+        # Extension types, such as categories, are uploaded as strings
+        return STRING
+    if dtype == bool or dtype == object:
+        values = series.dropna()
+        if (len(values) and isinstance(values.iloc[0], decimal.Decimal) and
+                values.map(lambda value: isinstance(value, decimal.Decimal)).all()):
+            return DECIMAL
+        if values.isin([True, False]).all():
+            return BOOLEAN
+        return STRING
+    if np.issubdtype(dtype, np.datetime64):
+        values = series.dropna()
+        if len(values) and (values == values.dt.normalize()).all():
+            return DATE
+        return DATETIME
+    if np.issubdtype(dtype, np.number):
+        return NUMERIC
+    return STRING
+
+def column_types(dataframe, kinds, dtype=None, narrow=True):
+    """
+    Infer the narrowest SQL type fitting the values of each column of a
+    DataFrame.
+
+    Parameters
+    ----------
+    dataframe : DataFrame
+        Data to be uploaded.
+    kinds : list of str
+        Kind of each column, as returned by column_kinds.
+    dtype : dict, optional
+        SQL type to be used for some columns, by column name, instead of the
+        inferred one.
+    narrow : bool, default: True
+        If False, the types are chosen wide enough for values that are not
+        in dataframe, for example when dataframe is the first chunk of a
+        larger upload: integers are stored as BIGINT, floats as DOUBLE,
+        dates as TIMESTAMP and strings as VARCHAR columns of at least 255
+        bytes.
+
+    Returns
+    -------
+    list of str
+
+    Raises
+    ------
+    TypeError
+        dtype is not a dictionary of strings.
+    ValueError
+        dtype refers to a column which does not exist.
+
+    Notes
+    -----
+    Integers are stored as SMALLINT, INTEGER or BIGINT, keeping half of the
+    range of the type as headroom for values appended later. Floats are
+    stored as REAL if they can be converted to single precision without
+    loss, as DOUBLE otherwise. Strings are stored as VARCHAR columns twice as
+    long as the longest observed value in bytes, or as CLOB when this is too
+    long for a VARCHAR.
+    """
+    if dtype is None:
+        dtype = {}
+    if not isinstance(dtype, dict):
+        raise TypeError("dtype should be a dictionary")
+    for column, datatype in dtype.items():
+        if column not in dataframe.columns:
+            raise ValueError("dtype refers to %s, which is not a column"%column)
+        if not isinstance(datatype, six.string_types):
+            raise TypeError("The types in dtype should be strings")
+    return [dtype[column] if column in dtype else _column_type(dataframe[column], kind, narrow)
+            for column, kind in zip(dataframe.columns, kinds)]
+
+def _column_type(series, kind, narrow=True):
+    """
+    Infer the SQL type of a single column. See column_types.
+    """
+    if kind == BOOLEAN:
+        return "SMALLINT"
+    if kind == DATE:
+        return "DATE" if narrow else "TIMESTAMP"
+    if kind == DATETIME:
+        return "TIMESTAMP"
+    values = series.dropna()
+    if kind == DECIMAL:
+        return _decimal_type(values)
+    if kind == NUMERIC:
+        if np.issubdtype(series.dtype, np.integer):
+            if not len(values):
+                return "INTEGER" if narrow else "BIGINT"
+            bound = max(abs(int(values.min())), abs(int(values.max())))
+            if bound < 2**14 and narrow:
+                return "SMALLINT"
+            if bound < 2**30 and narrow:
+                return "INTEGER"
+            if bound < 2**63:
+                return "BIGINT"
+            return "DECIMAL(%s,0)"%MAX_DECIMAL_PRECISION
+        if not narrow:
+            return "DOUBLE"
+        if series.dtype.itemsize <= 4:
+            return "REAL"
+        values = values.values
+        with np.errstate(over="ignore"):
+            if len(values) and np.array_equal(values.astype(np.float32).astype(np.float64),
+                                              values):
+                return "REAL"
+        return "DOUBLE"
+    if not len(values):
+        return "VARCHAR(255)"
+    max_bytes = int(values.astype(six.text_type).str.encode("utf-8").str.len().max())
+    length = max(2*max_bytes, 16 if narrow else 255)
+    if length <= MAX_VARCHAR_BYTES:
+        return "VARCHAR(%s)"%length
+    if max_bytes <= MAX_VARCHAR_BYTES:
+        return "VARCHAR(%s)"%MAX_VARCHAR_BYTES
+    return "CLOB(%s)"%length
+
+def _decimal_type(values):
+    """
+    Infer the precision and scale of a column of decimal.Decimal values.
+    """
+    integer_digits, scale = 1, 0
+    for value in values:
+        sign, digits, exponent = value.as_tuple()
+        if not isinstance(exponent, int):
+            # NaN and infinite values
+            continue
+        value_scale = max(-exponent, 0)
+        scale = max(scale, value_scale)
+        integer_digits = max(integer_digits, len(digits) + exponent)
+    precision = min(integer_digits + scale, MAX_DECIMAL_PRECISION)
+    scale = min(scale, max(precision - integer_digits, 0))
+    return "DECIMAL(%s,%s)"%(precision, scale)
+
+def insert_query(dataframe, schema, tablename, kinds, bulk=True):
+    """
+    Build the INSERT statement uploading the rows of a DataFrame.
+
+    Parameters
+    ----------
+    dataframe : DataFrame
+        Data to be uploaded.
+    schema : str
+        Schema of the table in which the data is inserted.
+    tablename : str
+        Name of the table in which the data is inserted.
+    kinds : list of str
+        Kind of each column, as returned by column_kinds.
+    bulk : bool, default: True
+        If True, the statement contains parameter markers, to be executed
+        with executemany. Otherwise, the values are written as literals.
+
+    Returns
+    -------
+    tuple
+        The statement and the parameters to be bound to it, None if bulk is
+        False.
+    """
+    column_string = '"%s"' % '", "'.join([six.text_type(x).strip() for x in dataframe.columns])
+    if bulk:
+        markers = ",".join(["?"]*len(dataframe.columns))
+        query = 'INSERT INTO "%s"."%s" (%s) VALUES (%s)' % (schema, tablename, column_string, markers)
+        return query, encode_parameters(dataframe, kinds)
+    query = 'INSERT INTO "%s"."%s" (%s) VALUES %s' % (schema, tablename, column_string,
+                                                      encode_literals(dataframe, kinds))
+    return query, None
+
+def encode_literals(dataframe, kinds):
+    """
+    Render the rows of a DataFrame as SQL literals, ready to be used in the
+    VALUES clause of an INSERT statement.
+
+    Parameters
+    ----------
+    dataframe : DataFrame
+        Data to be uploaded.
+    kinds : list of str
+        Kind of each column, as returned by column_kinds.
+
+    Returns
+    -------
+    str
+        Rows formatted as "(v1,v2,...),(v1,v2,...)".
+    """
+    columns = [_column_literals(dataframe[column], kind)
+               for column, kind in zip(dataframe.columns, kinds)]
+    return ",".join(["(%s)" % ",".join(row) for row in zip(*columns)])
+
+def _column_literals(series, kind):
+    """
+    Render a column as a list of SQL literals, NULL for missing values.
+    """
+    mask = series.isnull().values
+    if kind == BOOLEAN:
+        literals = np.where(series.fillna(False).astype(bool).values, "1", "0").tolist()
+    elif kind == DECIMAL:
+        literals = list(map(six.text_type, series.fillna(0).tolist()))
+    elif kind == NUMERIC:
+        # repr keeps the full precision of floats, also in Python 2
+        if np.issubdtype(series.dtype, np.floating):
+            literals = list(map(repr, series.values.tolist()))
+        else:
+            literals = list(map(six.text_type, series.values.tolist()))
+    else:
+        strings = _column_strings(series, kind).tolist()
+        literals = ["'%s'" % value.replace("'", "''") for value in strings]
+    if mask.any():
+        literals = ["NULL" if missing else value for value, missing in zip(literals, mask)]
+    return literals
+
+def encode_parameters(dataframe, kinds):
+    """
+    Convert the rows of a DataFrame into parameters to be bound to an
+    INSERT statement containing parameter markers.
+
+    Parameters
+    ----------
+    dataframe : DataFrame
+        Data to be uploaded.
+    kinds : list of str
+        Kind of each column, as returned by column_kinds.
+
+    Returns
+    -------
+    list of tuples
+        One tuple of native Python values per row, None for missing values.
+    """
+    columns = [_column_parameters(dataframe[column], kind)
+               for column, kind in zip(dataframe.columns, kinds)]
+    return list(zip(*columns))
+
+def _column_parameters(series, kind):
+    """
+    Convert a column into a list of native Python values, None for missing
+    values.
+    """
+    mask = series.isnull().values
+    if kind == BOOLEAN:
+        values = series.fillna(False).astype(bool).astype(int).tolist()
+    elif kind in (NUMERIC, DECIMAL):
+        values = series.tolist()
+    else:
+        values = _column_strings(series, kind).tolist()
+    if mask.any():
+        values = [None if missing else value for value, missing in zip(values, mask)]
+    return values
+
+def _column_strings(series, kind):
+    """
+    Convert a column into strings. Datetimes are formatted as Db2 dates or
+    timestamps, without fractional seconds when there are none.
+    """
+    if kind == DATE:
+        return series.dt.strftime("%Y-%m-%d").fillna("")
+    if kind == DATETIME:
+        timestamp_format = "%Y-%m-%d %H:%M:%S"
+        if (series.dt.microsecond.fillna(0) != 0).any():
+            timestamp_format += ".%f"
+        return series.dt.strftime(timestamp_format).fillna("")
+    return series.fillna("").astype(six.text_type)
+
+def insert_in_parallel(idadb, chunks, schema, tablename, kinds, nb_workers,
+                       bulk=True, progress=None):
+    """
+    Insert chunks of a DataFrame concurrently over several connections. Each
+    chunk is inserted and committed in its own transaction, so that a failed
+    chunk does not abort the others.
+
+    Parameters
+    ----------
+    idadb : IdaDataBase
+        Database in which the data is inserted. In pooled mode, connections
+        are taken from its pool, otherwise nb_workers connections are opened
+        for the duration of the upload.
+    chunks : list of DataFrame
+        Chunks to be inserted.
+    schema : str
+        Schema of the table in which the data is inserted.
+    tablename : str
+        Name of the table in which the data is inserted.
+    kinds : list of str
+        Kind of each column, as returned by column_kinds.
+    nb_workers : int
+        Number of chunks inserted at the same time.
+    bulk : bool, default: True
+        If True, chunks are inserted with executemany, otherwise with a
+        literal multi-row INSERT statement.
+    progress : function, optional
+        Called with the number of processed chunks each time a chunk is
+        processed.
+
+    Returns
+    -------
+    dict
+        Exception raised for each chunk that could not be inserted, by
+        position of the chunk in chunks.
+    """
+    if idadb._pool is not None:
+        pool = idadb._pool
+    else:
+        pool = ConnectionPool(idadb._open_connection, nb_workers)
+    lock = threading.Lock()
+    pending = iter(enumerate(chunks))
+    failures = {}
+    processed = [0]
+
+    def next_chunk():
+        with lock:
+            return next(pending, (None, None))
+
+    def done(index, error):
+        with lock:
+            if error is not None:
+                failures[index] = error
+            processed[0] += 1
+            if progress is not None:
+                progress(processed[0])
+
+    def work():
+        if idadb._con_type == 'jdbc':
+            # Threads other than the main one must be attached to the JVM
+            import jpype
+            if not jpype.isThreadAttachedToJVM():
+                jpype.attachThreadToJVM()
+        con = None
+        try:
+            while True:
+                index, chunk = next_chunk()
+                if chunk is None:
+                    break
+                try:
+                    if con is None:
+                        con = pool.checkout()
+                    _execute_insert(con, chunk, schema, tablename, kinds, bulk)
+                except Exception as error:
+                    if con is not None:
+                        try:
+                            con.rollback()
+                        except Exception:
+                            # The connection is broken, use a new one
+                            pool.checkin(con, discard=True)
+                            con = None
+                    done(index, error)
+                else:
+                    done(index, None)
+        finally:
+            if con is not None:
+                pool.checkin(con)
+
+    workers = [threading.Thread(target=work) for _ in range(min(nb_workers, len(chunks)))]
+    try:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    finally:
+        if pool is not idadb._pool:
+            pool.close()
+    return failures
+
+def _execute_insert(con, dataframe, schema, tablename, kinds, bulk):
+    """
+    Insert a DataFrame and commit, using the given connection.
+    """
+    query, parameters = insert_query(dataframe, schema, tablename, kinds, bulk)
+    cursor = con.cursor()
+    try:
+        if bulk:
+            cursor.executemany(query, parameters)
+        else:
+            cursor.execute(query)
+    finally:
+        cursor.close()
+    con.commit()
+
+def estimate_row_bytes(dataframe, kinds, sample_size=1000):
+    """
+    Estimate the number of bytes needed to send a row of a DataFrame, based
+    on a sample of its rows.
+
+    Parameters
+    ----------
+    dataframe : DataFrame
+        Data to be uploaded.
+    kinds : list of str
+        Kind of each column, as returned by column_kinds.
+    sample_size : int, default: 1000
+        Maximum number of rows to look at.
+
+    Returns
+    -------
+    int
+    """
+    sample = dataframe.iloc[:sample_size]
+    row_bytes = 0
+    for column, kind in zip(dataframe.columns, kinds):
+        if kind == BOOLEAN:
+            row_bytes += 2
+        elif kind == NUMERIC:
+            # Literals of doubles take up to about twenty characters
+            row_bytes += 20 if np.issubdtype(sample[column].dtype, np.floating) else 12
+        elif kind == DATE:
+            row_bytes += 12
+        elif kind == DATETIME:
+            row_bytes += 29
+        elif kind == DECIMAL:
+            row_bytes += 34
+        elif len(sample):
+            lengths = sample[column].dropna().astype(six.text_type).str.len()
+            row_bytes += int(lengths.mean()) + 3 if len(lengths) else 4
+        else:
+            row_bytes += 4
+    return max(row_bytes, 1)
+
+class ChunkSizeController(object):
+    """
+    A ChunkSizeController chooses the number of rows sent per INSERT
+    statement during an upload. It measures the throughput of each chunk
+    and grows or shrinks the chunk size as long as the throughput improves,
+    reversing direction with a smaller step when it degrades, within the
+    limits on the size of a statement.
+    """
+
+    def __init__(self, initial, row_bytes, bulk=True, minimum=100,
+                 growth=2.0, tolerance=0.05):
+        """
+        Constructor for ChunkSizeController objects.
+
+        Parameters
+        ----------
+        initial : int
+            Number of rows of the first chunk.
+        row_bytes : int
+            Estimated number of bytes needed to send a row, see
+            estimate_row_bytes.
+        bulk : bool, default: True
+            True if rows are bound to a parameterized statement, False if
+            they are written as literals in the statement.
+        minimum : int, default: 100
+            Minimum number of rows per chunk.
+        growth : float, default: 2.0
+            Initial factor by which the chunk size is changed between chunks.
+        tolerance : float, default: 0.05
+            Relative decrease of the throughput considered as noise.
+        """
+        self.row_bytes = row_bytes
+        self.bulk = bulk
+        self.minimum = minimum
+        self.chunksize = self._clip(initial)
+        self.growth = growth
+        self.tolerance = tolerance
+        self.history = []
+        self._direction = 1
+        self._previous = None
+
+    @property
+    def maximum(self):
+        """
+        Maximum number of rows per chunk allowed by the size limits.
+        """
+        limit = MAX_BATCH_BYTES if self.bulk else MAX_STATEMENT_BYTES
+        return max(int(limit / self.row_bytes), 1)
+
+    def _clip(self, chunksize):
+        return int(max(min(chunksize, self.maximum), min(self.minimum, self.maximum)))
+
+    def record(self, nrows, seconds):
+        """
+        Record the time taken to send a chunk and choose the size of the
+        next one.
+
+        Parameters
+        ----------
+        nrows : int
+            Number of rows of the chunk.
+        seconds : float
+            Time taken to send the chunk.
+        """
+        seconds = max(seconds, 1e-6)
+        throughput = nrows / seconds
+        self.history.append((nrows, seconds))
+        if nrows < self.chunksize:
+            # The last chunk of an upload says nothing about its size
+            return
+        if self._previous is not None and throughput < self._previous * (1 - self.tolerance):
+            self._direction = -self._direction
+            self.growth = max(self.growth ** 0.5, 1.1)
+        self._previous = throughput
+        self.chunksize = self._clip(self.chunksize * self.growth ** self._direction)
+
+    def summary(self):
+        """
+        Return the chosen chunk size and the observed throughput.
+
+        Returns
+        -------
+        dict
+            "chunksize" is the size of the chunk with the best throughput,
+            "rows_per_second" and "bytes_per_second" the overall throughput
+            and "history" the number of rows and the time of each chunk.
+        """
+        nrows = sum(rows for rows, _ in self.history)
+        seconds = sum(duration for _, duration in self.history)
+        best = max(self.history, key=lambda chunk: chunk[0] / chunk[1]) if self.history else None
+        rows_per_second = nrows / seconds if seconds else 0.0
+        return {"chunksize": best[0] if best else self.chunksize,
+                "rows_per_second": rows_per_second,
+                "bytes_per_second": rows_per_second * self.row_bytes,
+                "history": list(self.history)}